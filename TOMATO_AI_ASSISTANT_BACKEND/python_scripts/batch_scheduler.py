@@ -0,0 +1,112 @@
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import Future
+
+
+class MicroBatchScheduler:
+    """
+    Collect concurrent requests into batches and run them through one model call.
+
+    A batch is dispatched as soon as max_batch_size requests are queued or the
+    oldest queued request has waited max_wait_ms. process_batch receives the list
+    of queued items and must return one result per item, in the same order.
+    """
+
+    def __init__(self, process_batch, max_batch_size=16, max_wait_ms=10):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._running = True
+
+        # Metrics
+        self.batches_run = 0
+        self.requests_processed = 0
+        self.max_queue_depth = 0
+        self.batch_size_histogram = {}
+
+        self._thread = threading.Thread(target=self._run, name='micro-batch-scheduler', daemon=True)
+        self._thread.start()
+        logging.info(f"Micro-batch scheduler started (max_batch_size={max_batch_size}, max_wait_ms={max_wait_ms})")
+
+    def submit(self, item):
+        """Queue one item and return a Future that resolves to its result"""
+        future = Future()
+        with self._condition:
+            if not self._running:
+                raise RuntimeError("Scheduler has been shut down")
+            self._queue.append((item, future, time.time()))
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+            self._condition.notify()
+        return future
+
+    def _next_batch(self):
+        """Block until a batch is due, then pop it off the queue"""
+        with self._condition:
+            while self._running and not self._queue:
+                self._condition.wait()
+
+            if not self._queue:
+                return []
+
+            # Wait for more requests until the batch is full or the oldest one is due
+            deadline = self._queue[0][2] + self.max_wait
+            while self._running and len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            batch_size = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(batch_size)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+
+            items = [item for item, _, _ in batch]
+            try:
+                results = self.process_batch(items)
+                if len(results) != len(items):
+                    raise ValueError(f"process_batch returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                logging.error(f"Micro-batch of {len(items)} failed: {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+
+            with self._condition:
+                self.batches_run += 1
+                self.requests_processed += len(items)
+                self.batch_size_histogram[len(items)] = self.batch_size_histogram.get(len(items), 0) + 1
+
+    def stats(self):
+        """Current queue depth and batch-size distribution"""
+        with self._condition:
+            return {
+                'queue_depth': len(self._queue),
+                'max_queue_depth': self.max_queue_depth,
+                'batches_run': self.batches_run,
+                'requests_processed': self.requests_processed,
+                'average_batch_size': self.requests_processed / self.batches_run if self.batches_run else 0.0,
+                'batch_size_histogram': dict(sorted(self.batch_size_histogram.items()))
+            }
+
+    def shutdown(self, wait=True):
+        """Stop accepting work; queued requests are still processed"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if wait:
+            self._thread.join()
@@ -0,0 +1,463 @@
+"""
+Benchmark harness for tomato_prediction.py and soil_prediction.py.
+
+Generates small synthetic stand-in models with the production input/output
+shapes (224x224x3 -> 30 classes, 6 features -> regression) so the numbers can
+be reproduced without the real weights, then measures cold start, per-stage
+latency percentiles and batch throughput and writes them as JSON.
+
+    python benchmark.py [--output results.json] [--workdir DIR] [--iterations N]
+                        [--batch-sizes 1,8,32] [--only tomato|soil] [--compare baseline.json]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import subprocess
+import tempfile
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stderr)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TOMATO_MODEL_FILE = 'final_fast_tomato_model.h5'
+SOIL_MODEL_FILE = 'soil_regressor_rf.pkl'
+SCALER_FILE = 'scaler_soil.pkl'
+
+OPTIMAL_RANGES = {
+    'ph_level': {'optimal': [6.0, 6.8], 'unit': ''},
+    'temperature': {'optimal': [21, 29], 'unit': '°C'},
+    'moisture': {'optimal': [60, 80], 'unit': '%'},
+    'nitrogen': {'optimal': [40, 60], 'unit': 'mg/kg'},
+    'phosphorus': {'optimal': [30, 50], 'unit': 'mg/kg'},
+    'potassium': {'optimal': [40, 80], 'unit': 'mg/kg'},
+    'moisture_threshold': {'optimal': [20, 100], 'unit': '%'}
+}
+
+# Reading fields in the column order the soil model expects
+SOIL_FIELDS = ('ph_level', 'temperature', 'moisture', 'nitrogen', 'phosphorus', 'potassium')
+
+# Direction of every metric the benchmark reports, by the last part of its name: 'lower' or
+# 'higher' is better, None for figures that describe the run rather than measure it
+METRIC_DIRECTIONS = {
+    'mean_ms': 'lower',
+    'p50_ms': 'lower',
+    'p90_ms': 'lower',
+    'p99_ms': 'lower',
+    'model_load_ms': 'lower',
+    'flat_ms': 'lower',
+    'sklearn_ms': 'lower',
+    'max_abs_mean_diff': 'lower',
+    'max_abs_tree_diff': 'lower',
+    'images_per_second': 'higher',
+    'readings_per_second': 'higher',
+    'serial_images_per_second': 'higher',
+    'pipelined_images_per_second': 'higher',
+    'overlap_ratio': 'higher',
+    'speedup': 'higher',
+    'one_shot_speedup': 'higher',
+    'serve_ready_speedup': 'higher',
+    'decode_threads': None,
+    'prefetch_depth': None,
+    'max_depth': None,
+    'n_trees': None,
+    'n_estimators': None,
+    'node_count': None,
+    'rows': None
+}
+
+
+def generate_stand_in_models(workdir, seed=0, num_images=16, targets=('tomato', 'soil')):
+    """Write the stand-in models and images the selected targets need into workdir; returns the paths
+
+    TensorFlow is imported only for the 'tomato' target, so a soil-only run works without it.
+    """
+    model_dir = os.path.join(workdir, 'models')
+    image_dir = os.path.join(workdir, 'images')
+    os.makedirs(model_dir, exist_ok=True)
+    os.makedirs(image_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    tomato_model_path = os.path.join(model_dir, TOMATO_MODEL_FILE)
+    if 'tomato' in targets and not os.path.exists(tomato_model_path):
+        import tensorflow as tf
+
+        tf.keras.utils.set_random_seed(seed)
+        model = tf.keras.Sequential([
+            tf.keras.Input(shape=(224, 224, 3)),
+            tf.keras.layers.Conv2D(16, 3, strides=2, activation='relu'),
+            tf.keras.layers.Conv2D(32, 3, strides=2, activation='relu'),
+            tf.keras.layers.Conv2D(64, 3, strides=2, activation='relu'),
+            tf.keras.layers.GlobalAveragePooling2D(),
+            tf.keras.layers.Dense(30, activation='softmax')
+        ])
+        model.save(tomato_model_path)
+        logging.info(f"Stand-in disease model written to {tomato_model_path}")
+
+        if os.environ.get('TOMATO_BACKEND') == 'tflite':
+            converter = tf.lite.TFLiteConverter.from_keras_model(model)
+            with open(os.path.splitext(tomato_model_path)[0] + '.tflite', 'wb') as f:
+                f.write(converter.convert())
+
+    soil_model_path = os.path.join(model_dir, SOIL_MODEL_FILE)
+    if 'soil' in targets and not os.path.exists(soil_model_path):
+        import joblib
+        from sklearn.ensemble import RandomForestRegressor
+        from sklearn.preprocessing import StandardScaler
+
+        readings = random_soil_readings(rng, 2000)
+        X = np.array([[reading[field] for field in SOIL_FIELDS] for reading in readings])
+        # Quality falls off with the distance from the middle of each optimal range
+        centers = np.array([np.mean(OPTIMAL_RANGES[field]['optimal']) for field in SOIL_FIELDS])
+        spans = np.array([np.ptp(OPTIMAL_RANGES[field]['optimal']) for field in SOIL_FIELDS])
+        y = np.clip(100 - 12 * np.abs((X - centers) / spans).sum(axis=1) + rng.normal(0, 3, len(X)), 0, 100)
+
+        scaler = StandardScaler().fit(X)
+        forest = RandomForestRegressor(n_estimators=100, random_state=seed, n_jobs=1).fit(scaler.transform(X), y)
+        joblib.dump(forest, soil_model_path)
+        joblib.dump(scaler, os.path.join(model_dir, SCALER_FILE))
+        logging.info(f"Stand-in soil model written to {soil_model_path}")
+
+    image_paths = []
+    for i in range(num_images if 'tomato' in targets else 0):
+        image_path = os.path.join(image_dir, f'{i}.jpg')
+        if not os.path.exists(image_path):
+            from PIL import Image
+
+            # Smooth gradients plus noise compress like photos rather than like pure noise
+            height, width = (480, 640) if i % 2 else (960, 1280)
+            yy, xx = np.mgrid[0:height, 0:width]
+            base = np.stack([xx / width, yy / height, (xx + yy) / (width + height)], axis=-1) * 255
+            pixels = np.clip(base * rng.uniform(0.5, 1.0, 3) + rng.normal(0, 12, base.shape), 0, 255)
+            Image.fromarray(pixels.astype(np.uint8)).save(image_path, quality=90)
+        image_paths.append(image_path)
+
+    return {'model_dir': model_dir, 'image_paths': image_paths}
+
+
+def random_soil_readings(rng, count):
+    return [
+        {
+            'ph_level': round(float(rng.uniform(4.5, 8.5)), 2),
+            'temperature': round(float(rng.uniform(10, 40)), 1),
+            'moisture': round(float(rng.uniform(10, 95)), 1),
+            'nitrogen': int(rng.uniform(5, 150)),
+            'phosphorus': int(rng.uniform(5, 120)),
+            'potassium': int(rng.uniform(5, 200))
+        }
+        for _ in range(count)
+    ]
+
+
+def percentiles(samples_seconds):
+    samples_ms = np.asarray(samples_seconds) * 1000
+    return {
+        'p50_ms': float(np.percentile(samples_ms, 50)),
+        'p90_ms': float(np.percentile(samples_ms, 90)),
+        'p99_ms': float(np.percentile(samples_ms, 99)),
+        'mean_ms': float(samples_ms.mean())
+    }
+
+
+def timed(function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+
+def measure_cold_start(script, payload, env, runs):
+    """Wall time of a one-shot CLI call and of a --serve worker becoming ready, each in a fresh interpreter"""
+    script_path = os.path.join(SCRIPT_DIR, script)
+    one_shot = []
+    serve_ready = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        completed = subprocess.run([sys.executable, script_path, json.dumps(payload)], env=env,
+                                   capture_output=True, text=True, timeout=600)
+        one_shot.append(time.perf_counter() - start_time)
+        if not json.loads(completed.stdout.strip().splitlines()[-1]).get('success'):
+            raise RuntimeError(f"{script} one-shot run failed: {completed.stdout[-500:]}")
+
+        start_time = time.perf_counter()
+        worker = subprocess.Popen([sys.executable, script_path, '--serve'], env=env, text=True,
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        for line in worker.stdout:
+            if json.loads(line).get('type') == 'ready':
+                break
+        serve_ready.append(time.perf_counter() - start_time)
+        worker.communicate(json.dumps({'type': 'shutdown'}) + '\n', timeout=60)
+
+    import_report = subprocess.run([sys.executable, script_path, '--import-report'], env=env,
+                                   capture_output=True, text=True, timeout=600)
+    return {
+        'one_shot': percentiles(one_shot),
+        'serve_ready': percentiles(serve_ready),
+        'import_report': json.loads(import_report.stdout)
+    }
+
+
+def benchmark_tomato(image_paths, iterations, batch_sizes):
+    from tomato_prediction import TomatoClassifier
+
+    classifier, load_seconds = timed(TomatoClassifier)
+    classifier.cache = None  # measure the model, not cache hits
+    target_size = (224, 224)
+    classifier.predict_disease(image_paths[0])  # warm-up
+
+    stages = {'decode': [], 'preprocess': [], 'forward': [], 'postprocess': [], 'end_to_end': []}
+    for i in range(iterations):
+        image_path = image_paths[i % len(image_paths)]
+        decoded, decode_seconds = timed(classifier.decode_image, image_path, target_size)
+        batch, preprocess_seconds = timed(lambda: (decoded[np.newaxis] / 255.0).astype(np.float32))
+        predictions, forward_seconds = timed(lambda: classifier.model.predict(batch, verbose=0))
+        top_indices = np.argsort(predictions[0])[-3:][::-1]
+        _, postprocess_seconds = timed(classifier.interpret_prediction, predictions[0], int(np.argmax(predictions[0])), top_indices)
+        _, end_to_end_seconds = timed(classifier.predict_disease, image_path)
+
+        stages['decode'].append(decode_seconds)
+        stages['preprocess'].append(preprocess_seconds)
+        stages['forward'].append(forward_seconds)
+        stages['postprocess'].append(postprocess_seconds)
+        stages['end_to_end'].append(end_to_end_seconds)
+
+    throughput = {}
+    for batch_size in batch_sizes:
+        paths = [image_paths[i % len(image_paths)] for i in range(batch_size)]
+        classifier.predict_disease_batch(paths, batch_size=batch_size)  # warm-up for this shape
+        rounds = max(1, iterations // batch_size)
+        _, seconds = timed(lambda: [classifier.predict_disease_batch(paths, batch_size=batch_size) for _ in range(rounds)])
+        throughput[str(batch_size)] = {'images_per_second': rounds * batch_size / seconds}
+
+    return {
+        'backend': classifier.backend,
+        'decoder': classifier.decoder,
+        'model_load_ms': load_seconds * 1000,
+        'stages': {stage: percentiles(samples) for stage, samples in stages.items()},
+        'batch_throughput': throughput,
+        'prefetch': benchmark_prefetch(classifier, image_paths, max(batch_sizes))
+    }
+
+
+def benchmark_prefetch(classifier, image_paths, batch_size, chunks=4):
+    """Serial decode-then-infer against the prefetch pipeline on a multi-chunk workload"""
+    paths = [image_paths[i % len(image_paths)] for i in range(batch_size * chunks)]
+    prefetch_depth = classifier.prefetch_depth or 2
+
+    classifier.prefetch_depth = 0
+    _, serial_seconds = timed(classifier.predict_disease_batch, paths, (224, 224), batch_size)
+
+    classifier.prefetch_depth = prefetch_depth
+    classifier.predict_disease_batch(paths[:batch_size * 2], batch_size=batch_size)  # warm-up, allocates the ring
+    pipeline = classifier.prefetch_pipeline(batch_size)
+    wait_before, decode_before = pipeline.wait_seconds, pipeline.decode_seconds
+    _, pipelined_seconds = timed(classifier.predict_disease_batch, paths, (224, 224), batch_size)
+    decode_seconds = pipeline.decode_seconds - decode_before
+
+    return {
+        'prefetch_depth': prefetch_depth,
+        'decode_threads': classifier.decode_threads,
+        'serial_images_per_second': len(paths) / serial_seconds,
+        'pipelined_images_per_second': len(paths) / pipelined_seconds,
+        'overlap_ratio': 1.0 - (pipeline.wait_seconds - wait_before) / decode_seconds if decode_seconds else 0.0
+    }
+
+
+def benchmark_soil(model_dir, iterations, batch_sizes, seed=0):
+    from soil_prediction import SoilAnalyzer
+    from flat_forest import compare_with_sklearn
+
+    analyzer, load_seconds = timed(SoilAnalyzer, model_dir)
+    analyzer.memo = None  # measure the model, not memo hits
+    readings = random_soil_readings(np.random.default_rng(seed + 1), max(iterations, max(batch_sizes)))
+    analyzer.analyze_soil(readings[0], OPTIMAL_RANGES)  # warm-up
+
+    stages = {'map_fields': [], 'scale': [], 'forest_confidence': [], 'rules': [], 'end_to_end': []}
+    for reading in readings[:iterations]:
+        X, map_seconds = timed(analyzer.map_to_model_matrix, [reading])
+        X_scaled, scale_seconds = timed(analyzer.scaler.transform, X)
+        _, forest_seconds = timed(analyzer.predict_with_confidence, X_scaled)
+        _, rules_seconds = timed(lambda: (analyzer.detect_soil_issues(reading, OPTIMAL_RANGES),
+                                          analyzer.generate_recommendations(reading, OPTIMAL_RANGES)))
+        _, end_to_end_seconds = timed(analyzer.analyze_soil, reading, OPTIMAL_RANGES)
+
+        stages['map_fields'].append(map_seconds)
+        stages['scale'].append(scale_seconds)
+        stages['forest_confidence'].append(forest_seconds)
+        stages['rules'].append(rules_seconds)
+        stages['end_to_end'].append(end_to_end_seconds)
+
+    throughput = {}
+    for batch_size in batch_sizes:
+        batch = readings[:batch_size]
+        rounds = max(1, iterations // batch_size)
+        _, seconds = timed(lambda: [analyzer.analyze_soil_batch(batch, OPTIMAL_RANGES) for _ in range(rounds)])
+        throughput[str(batch_size)] = {'readings_per_second': rounds * batch_size / seconds}
+
+    return {
+        'n_estimators': analyzer.n_estimators,
+        'model_format': analyzer.model_format,
+        'model_load_ms': load_seconds * 1000,
+        'stages': {stage: percentiles(samples) for stage, samples in stages.items()},
+        'batch_throughput': throughput,
+        'flat_forest': compare_with_sklearn(
+            analyzer.soil_model,
+            analyzer.scaler.transform(analyzer.map_to_model_matrix(readings)),
+            flat=analyzer.forest,
+            row_counts=(1,) + tuple(batch_sizes)
+        )
+    }
+
+
+def benchmark_soil_startup(model_dir, payload, env, runs):
+    """Cold start with the pickled forest against the memory-mapped artifact exported from it"""
+    from soil_prediction import SoilAnalyzer
+    from soil_artifact import ARTIFACT_FILE, export_soil_artifact
+
+    analyzer = SoilAnalyzer(model_dir, model_format='pickle')
+    export_soil_artifact(os.path.join(model_dir, ARTIFACT_FILE), analyzer.soil_model, analyzer.scaler, analyzer.model_paths)
+
+    startup = {
+        model_format: measure_cold_start('soil_prediction.py', payload, dict(env, SOIL_MODEL_FORMAT=model_format), runs)
+        for model_format in ('pickle', 'mmap')
+    }
+    for phase in ('one_shot', 'serve_ready'):
+        startup[f'{phase}_speedup'] = startup['pickle'][phase]['p50_ms'] / startup['mmap'][phase]['p50_ms']
+    return startup
+
+
+def environment_info():
+    def version(module_name):
+        module = sys.modules.get(module_name)
+        return getattr(module, '__version__', None)
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIR,
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'tensorflow': version('tensorflow'),
+        'sklearn': version('sklearn')
+    }
+
+
+def flatten_metrics(results, prefix=''):
+    """{'tomato': {'stages': {'forward': {'p50_ms': 1}}}} -> {'tomato.stages.forward.p50_ms': 1}"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_metrics(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare_results(current, baseline, threshold=0.10):
+    """
+    Per-metric change against a baseline run; changes worse than threshold are flagged as regressions.
+    Metrics missing from METRIC_DIRECTIONS are listed as unclassified instead of guessed at.
+    """
+    current_metrics = flatten_metrics({key: current[key] for key in ('tomato', 'soil') if key in current})
+    baseline_metrics = flatten_metrics({key: baseline[key] for key in ('tomato', 'soil') if key in baseline})
+
+    changes = {}
+    unclassified = set()
+    for name, value in current_metrics.items():
+        old_value = baseline_metrics.get(name)
+        if not old_value or 'import_report' in name:
+            continue
+        metric = name.rsplit('.', 1)[-1]
+        if metric not in METRIC_DIRECTIONS:
+            unclassified.add(metric)
+            continue
+        if METRIC_DIRECTIONS[metric] is None:
+            continue
+        change = (value - old_value) / old_value
+        lower_is_better = METRIC_DIRECTIONS[metric] == 'lower'
+        changes[name] = {
+            'baseline': old_value,
+            'current': value,
+            'change': change,
+            'regression': change > threshold if lower_is_better else change < -threshold
+        }
+
+    return {
+        'baseline_commit': baseline.get('environment', {}).get('commit'),
+        'threshold': threshold,
+        'regressions': sorted(name for name, change in changes.items() if change['regression']),
+        'unclassified': sorted(unclassified),
+        'metrics': changes
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the tomato and soil prediction scripts on synthetic stand-in models')
+    parser.add_argument('--output', help='write results JSON here (default: stdout)')
+    parser.add_argument('--workdir', help='where stand-in models and images live (default: a fresh temp dir)')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--batch-sizes', default='1,8,32')
+    parser.add_argument('--cold-runs', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', choices=('tomato', 'soil'))
+    parser.add_argument('--compare', help='baseline results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='relative change counted as a regression')
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='ml-benchmark-')
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+    targets = (args.only,) if args.only else ('tomato', 'soil')
+    assets = generate_stand_in_models(workdir, seed=args.seed, targets=targets)
+
+    # Both scripts (in-process and in the cold-start subprocesses) load the stand-ins
+    os.environ['ML_MODEL_DIR'] = assets['model_dir']
+    env = dict(os.environ, PYTHONIOENCODING='utf-8')
+
+    results = {'workdir': workdir, 'iterations': args.iterations, 'seed': args.seed}
+
+    if args.only in (None, 'tomato'):
+        logging.info("Benchmarking tomato_prediction...")
+        results['tomato'] = {
+            'cold_start': measure_cold_start('tomato_prediction.py', {'image_path': assets['image_paths'][0]}, env, args.cold_runs),
+            **benchmark_tomato(assets['image_paths'], args.iterations, batch_sizes)
+        }
+
+    if args.only in (None, 'soil'):
+        logging.info("Benchmarking soil_prediction...")
+        payload = {'soil_data': random_soil_readings(np.random.default_rng(args.seed), 1)[0], 'optimal_ranges': OPTIMAL_RANGES}
+        # Exports the memory-mapped artifact, so every later soil load in this run uses it
+        startup_by_format = benchmark_soil_startup(assets['model_dir'], payload, env, args.cold_runs)
+        results['soil'] = {
+            'cold_start': measure_cold_start('soil_prediction.py', payload, env, args.cold_runs),
+            'startup_by_format': startup_by_format,
+            **benchmark_soil(assets['model_dir'], args.iterations, batch_sizes, seed=args.seed)
+        }
+
+    results['environment'] = environment_info()
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            results['comparison'] = compare_results(results, json.load(f), args.threshold)
+
+    output = json.dumps(results, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        logging.info(f"Benchmark results written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
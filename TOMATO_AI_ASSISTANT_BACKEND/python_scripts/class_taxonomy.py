@@ -0,0 +1,88 @@
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+TAXONOMY_FORMAT_VERSION = 1
+
+
+def taxonomy_path_for(model_path):
+    """Sidecar location: models/final_fast_tomato_model.h5 -> models/final_fast_tomato_model.taxonomy.json"""
+    return os.path.splitext(model_path)[0] + '.taxonomy.json'
+
+
+class ClassTaxonomy:
+    """
+    Per-class post-processing metadata indexed by class index.
+
+    Everything the rule methods derive from a class name (plant type, tomato
+    type, disease name, severity base score, recommendations) is computed once,
+    so interpreting a prediction is a handful of list/array lookups. Only the
+    confidence-dependent parts (the Healthy threshold and the score adjustment)
+    are evaluated per prediction.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.class_names = [entry['class_name'] for entry in entries]
+        self.is_tomato = np.array([entry['is_tomato'] for entry in entries], dtype=bool)
+        self.base_score = np.array([np.nan if entry['base_score'] is None else entry['base_score'] for entry in entries])
+        self.version = hashlib.sha256(json.dumps(entries, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+    def __len__(self):
+        return len(self.entries)
+
+    @classmethod
+    def compile(cls, class_names, rules):
+        """Run the classifier's name-based rules once per class"""
+        entries = []
+        for class_name in class_names:
+            plant_type = rules.get_plant_type(class_name)
+            is_tomato = rules.is_tomato(plant_type)
+            disease_type = rules.get_disease_type(class_name, plant_type)
+            # Status for everything except a confident Healthy call, which is decided per prediction
+            health_status = rules.get_health_status(class_name, 0.0, plant_type)
+            # The score is base + (confidence - 0.5) * 30, so the base is the score at confidence 0.5
+            base_score = None
+            if is_tomato:
+                base_score = rules.calculate_plant_health_score(class_name, 0.5, plant_type)
+
+            entries.append({
+                'class_name': class_name,
+                'plant_type': plant_type,
+                'tomato_type': rules.get_tomato_type(plant_type),
+                'is_tomato': is_tomato,
+                'disease_type': disease_type,
+                'healthy': is_tomato and 'healthy' in class_name.lower(),
+                'health_status': health_status,
+                'base_score': base_score,
+                'recommendations': rules.get_recommendations(plant_type, disease_type, health_status)
+            })
+        return cls(entries)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('format_version') != TAXONOMY_FORMAT_VERSION:
+            raise ValueError(f"Unsupported taxonomy format in {path}: {data.get('format_version')}")
+        return cls(data['classes'])
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'format_version': TAXONOMY_FORMAT_VERSION, 'classes': self.entries}, f, indent=2, ensure_ascii=False)
+        logging.info(f"Class taxonomy for {len(self)} classes written to {path}")
+
+    def health_status(self, class_idx, confidence):
+        entry = self.entries[class_idx]
+        if entry['healthy'] and confidence > 0.7:
+            return "Healthy"
+        return entry['health_status']
+
+    def plant_health_score(self, class_idx, confidence):
+        base_score = self.base_score[class_idx]
+        if np.isnan(base_score):
+            return None
+        return round(max(0, min(100, base_score + (confidence - 0.5) * 30)), 1)
@@ -0,0 +1,169 @@
+import time
+
+import numpy as np
+
+# Arrays a flattened forest is made of, in constructor order
+FOREST_ARRAYS = ('feature', 'threshold', 'missing_left', 'children', 'value', 'roots')
+
+
+class FlatForest:
+    """
+    A fitted RandomForestRegressor flattened into contiguous NumPy arrays.
+
+    All trees share one node table: feature and threshold of each split, the side
+    a missing (NaN) feature takes, children as (left, right) pairs already offset
+    into the table, and the leaf value, with roots[t] the first node of tree t.
+    Leaves point at themselves with an infinite threshold, so every (tree, row) pair
+    walks down in lockstep with plain array indexing instead of one sklearn call per
+    estimator; pairs that reached a leaf drop out of the walk.
+    """
+
+    def __init__(self, feature, threshold, missing_left, children, value, roots, max_depth):
+        # Plain ndarray views, so arrays memory-mapped from disk are indexed without copies or memmap overhead
+        self.feature = np.asarray(feature, dtype=np.intp).view(np.ndarray)
+        self.threshold = np.asarray(threshold, dtype=np.float64).view(np.ndarray)
+        self.missing_left = np.asarray(missing_left, dtype=bool).view(np.ndarray)
+        self.children = np.asarray(children, dtype=np.intp).view(np.ndarray)
+        self.value = np.asarray(value, dtype=np.float64).view(np.ndarray)
+        self.roots = np.asarray(roots, dtype=np.intp).view(np.ndarray)
+        self.max_depth = int(max_depth)
+
+        # (left, right) pairs side by side: child = children_flat[2 * node + go_right]
+        self._children = self.children.reshape(-1)
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        """Flatten every estimator's tree_ (single-output regression trees)"""
+        if hasattr(forest, 'classes_') or forest.n_outputs_ != 1:
+            raise ValueError(f"Only single-output regression forests can be flattened, got {type(forest).__name__}")
+
+        features, thresholds, missing_left, children, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count) + offset
+            is_leaf = tree.children_left == -1
+
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            # sklearn before 1.3 had no missing-value routing: NaN failed x <= threshold and went right
+            missing_left.append(getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count)).astype(bool))
+            children.append(np.column_stack([
+                np.where(is_leaf, node_ids, tree.children_left + offset),
+                np.where(is_leaf, node_ids, tree.children_right + offset)
+            ]))
+            values.append(tree.value[:, 0, 0])
+            roots.append(offset)
+
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            np.concatenate(features),
+            np.concatenate(thresholds),
+            np.concatenate(missing_left),
+            np.ascontiguousarray(np.concatenate(children)),
+            np.concatenate(values),
+            roots,
+            max_depth
+        )
+
+    def arrays(self):
+        """The node table as a dict of arrays plus max_depth, the inverse of from_arrays"""
+        return {'max_depth': self.max_depth, **{name: getattr(self, name) for name in FOREST_ARRAYS}}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(*(arrays[name] for name in FOREST_ARRAYS), max_depth=arrays['max_depth'])
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def node_count(self):
+        return len(self.feature)
+
+    def predict_trees(self, X):
+        """Per-tree predictions for every row as one (n_trees x n_samples) matrix, like sklearn's tree_.predict"""
+        # sklearn compares float32 features against float64 thresholds; do the same so every split agrees
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_samples, n_features = X.shape
+        features = X.reshape(-1)
+        has_missing = bool(np.isnan(features).any())
+
+        # One entry per (tree, row) pair, tree-major
+        row_offsets = np.tile(np.arange(n_samples, dtype=np.intp) * n_features, self.n_trees)
+        nodes = np.repeat(self.roots, n_samples)
+        active = np.arange(len(nodes))
+        for _ in range(self.max_depth):
+            current = nodes[active]
+            # sklearn goes left on x <= threshold; without NaNs, x > threshold is exactly the opposite
+            values = features[row_offsets[active] + self.feature[current]]
+            go_right = values > self.threshold[current]
+            if has_missing:
+                # A NaN fails both tests and goes wherever the split sends missing values
+                missing = np.isnan(values)
+                go_right[missing] = ~self.missing_left[current[missing]]
+            following = self._children[2 * current + go_right]
+            nodes[active] = following
+            active = active[following != current]
+            if not len(active):
+                break
+
+        return self.value[nodes].reshape(self.n_trees, n_samples)
+
+    def predict(self, X):
+        """Forest prediction (mean over trees) per row"""
+        return self.predict_trees(X).mean(axis=0)
+
+
+def sklearn_tree_matrix(forest, X):
+    """The per-estimator evaluation FlatForest replaces: one tree_.predict call per tree"""
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    return np.array([tree.tree_.predict(X).reshape(len(X), -1)[:, 0] for tree in forest.estimators_])
+
+
+def compare_with_sklearn(forest, X, flat=None, row_counts=(1, 8, 64, 512), min_seconds=0.2):
+    """
+    Parity of a FlatForest against the sklearn forest it was flattened from, plus a
+    microbenchmark of both evaluators from a single row up to whole batches.
+    """
+    flat = flat or FlatForest.from_sklearn(forest)
+    X = np.asarray(X, dtype=np.float64)
+
+    sklearn_trees = sklearn_tree_matrix(forest, X)
+    flat_trees = flat.predict_trees(X)
+
+    def seconds_per_call(function, batch):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            function(batch)
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_seconds:
+                return elapsed / calls
+
+    timings = {}
+    for rows in row_counts:
+        batch = X[np.arange(rows) % len(X)]
+        sklearn_seconds = seconds_per_call(lambda rows_: sklearn_tree_matrix(forest, rows_), batch)
+        flat_seconds = seconds_per_call(flat.predict_trees, batch)
+        timings[str(rows)] = {
+            'sklearn_ms': sklearn_seconds * 1000,
+            'flat_ms': flat_seconds * 1000,
+            'speedup': sklearn_seconds / flat_seconds
+        }
+
+    return {
+        'n_trees': flat.n_trees,
+        'node_count': flat.node_count,
+        'max_depth': flat.max_depth,
+        'rows': len(X),
+        'identical': bool(np.array_equal(sklearn_trees, flat_trees)),
+        'max_abs_tree_diff': float(np.abs(sklearn_trees - flat_trees).max()),
+        'max_abs_mean_diff': float(np.abs(forest.predict(X) - flat_trees.mean(axis=0)).max()),
+        'timings': timings
+    }
@@ -0,0 +1,358 @@
+import sys
+import json
+import math
+import time
+import logging
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from lazy_imports import import_report
+from stage_metrics import StageTimer
+
+logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stderr)
+sys.stdout.reconfigure(encoding='utf-8') if hasattr(sys.stdout, 'reconfigure') else None
+
+# 'average' mirrors lateFusionService.performLateFusion, 'weighted' mirrors fuseSinglePair
+FUSION_MODES = ('average', 'weighted')
+PLANT_WEIGHT = 0.7
+SOIL_WEIGHT = 0.3
+
+HIGH_PRIORITY_KEYWORDS = ('immediate', 'urgent', 'critical', 'severe', 'destroy', 'remove')
+MEDIUM_PRIORITY_KEYWORDS = ('apply', 'treat', 'fungicide', 'fertilizer', 'nutrient', 'water')
+LOW_PRIORITY_KEYWORDS = ('maintain', 'continue', 'monitoring', 'prevent')
+
+
+# The helpers below reproduce lateFusionService.js, including its JavaScript semantics
+# (`||` defaults, parseFloat, Math.round), so both sides produce the same fused record.
+
+def js_or(value, default):
+    """JavaScript `value || default`: falls back on null, 0, NaN, '' and false"""
+    if value is None or value is False or value == '' or value == 0:
+        return default
+    if isinstance(value, float) and math.isnan(value):
+        return default
+    return value
+
+
+def js_parse_float(value):
+    """JavaScript parseFloat for the values the analyses return: numbers and numeric strings, else NaN"""
+    if isinstance(value, bool) or value is None:
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def json_number(value):
+    """NaN serializes as null in JSON.stringify"""
+    return None if isinstance(value, float) and math.isnan(value) else value
+
+
+def js_iso_timestamp(offset_hours=0):
+    """new Date(Date.now() + offset).toISOString()"""
+    moment = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=offset_hours)
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.') + f'{moment.microsecond // 1000:03d}Z'
+
+
+def score_to_health_category(score):
+    if score >= 80:
+        return 'Healthy'
+    if score >= 60:
+        return 'Moderate'
+    if score >= 40:
+        return 'Unhealthy'
+    if score >= 20:
+        return 'Critical'
+    return 'Unknown'
+
+
+def combined_confidence(image_confidence, soil_confidence):
+    """Average of the two confidences, rounded to 2 decimals the way Math.round does"""
+    image_confidence = js_or(js_parse_float(image_confidence), 0.5)
+    soil_confidence = js_or(js_parse_float(soil_confidence), 0.5)
+    return math.floor(((image_confidence + soil_confidence) / 2) * 100 + 0.5) / 100
+
+
+def remove_duplicates(recommendations):
+    """Drop empty and non-string entries and case/whitespace-insensitive repeats, keeping first occurrences"""
+    seen = set()
+    unique = []
+    for recommendation in recommendations:
+        if not recommendation or not isinstance(recommendation, str):
+            continue
+        normalized = recommendation.lower().strip()
+        if normalized in seen:
+            continue
+        seen.add(normalized)
+        unique.append(recommendation)
+    return unique
+
+
+def prioritize_recommendations(recommendations):
+    """Stable keyword triage: high, then medium (and unmatched), then low priority"""
+    high, medium, low = [], [], []
+    for recommendation in recommendations:
+        lower = recommendation.lower()
+        if any(keyword in lower for keyword in HIGH_PRIORITY_KEYWORDS):
+            high.append(recommendation)
+        elif any(keyword in lower for keyword in MEDIUM_PRIORITY_KEYWORDS):
+            medium.append(recommendation)
+        elif any(keyword in lower for keyword in LOW_PRIORITY_KEYWORDS):
+            low.append(recommendation)
+        else:
+            medium.append(recommendation)
+    return high + medium + low
+
+
+def combine_recommendations(image_recommendations, soil_recommendations):
+    return prioritize_recommendations(remove_duplicates(list(image_recommendations) + list(soil_recommendations)))
+
+
+def format_for_storage(items):
+    """Lists become one '; '-joined string, as stored in prediction_results"""
+    if not items:
+        return 'No issues found'
+    if isinstance(items, list):
+        return '; '.join(item for item in items if item and item.strip())
+    return str(items)
+
+
+def perform_late_fusion(image_results, soil_results, user_id, image_id, soil_id):
+    """performLateFusion: plain average of plant health and soil quality; raises unless both analyses succeeded"""
+    if not (image_results or {}).get('success') or not (soil_results or {}).get('success'):
+        raise ValueError('Both image and soil analyses must be successful')
+
+    plant_health_score = js_or(image_results.get('plant_health_score'), 0)
+    soil_quality_score = js_or(soil_results.get('soil_quality_score'), 0)
+    average_score = (plant_health_score + soil_quality_score) / 2
+
+    return {
+        'user_id': user_id,
+        'image_id': image_id,
+        'soil_id': soil_id,
+        'health_status': image_results.get('health_status'),
+        'disease_type': image_results.get('disease_type'),
+        'soil_status': soil_results.get('soil_status'),
+        'recommendations': format_for_storage(combine_recommendations(
+            image_results.get('recommendations') or [], soil_results.get('recommendations') or [])),
+        'combined_confidence_score': combined_confidence(
+            js_or(image_results.get('confidence_score'), 0.5), js_or(soil_results.get('confidence_score'), 0.5)),
+        'tomato_type': image_results.get('tomato_type'),
+        'overall_health': score_to_health_category(average_score),
+        'soil_issues': format_for_storage(soil_results.get('soil_issues') or []),
+        'plant_health_score': plant_health_score,
+        'soil_quality_score': soil_quality_score,
+        # Node stores prediction times shifted by +8h; keep the same convention
+        'date_predicted': js_iso_timestamp(offset_hours=8)
+    }
+
+
+def fuse_single_pair(image_result, soil_analysis, user_id, image_id, soil_id):
+    """fuseSinglePair: 0.7 plant / 0.3 soil weighted score with defaults; never raises, errors give the fallback record"""
+    try:
+        if not image_result or not soil_analysis:
+            raise ValueError('Both image and soil analyses must be provided')
+
+        # A missing score counts as 50; a null one is NaN, as parseFloat(null) is
+        plant_health_score = js_parse_float(image_result['plant_health_score']) if 'plant_health_score' in image_result else 50
+        soil_quality_score = js_parse_float(soil_analysis['soil_quality_score']) if 'soil_quality_score' in soil_analysis else 50
+        combined_score = plant_health_score * PLANT_WEIGHT + soil_quality_score * SOIL_WEIGHT
+
+        return {
+            'user_id': user_id,
+            'image_id': image_id,
+            'soil_id': soil_id,
+            'health_status': image_result.get('health_status') or 'Unknown',
+            'disease_type': image_result.get('disease_type') or 'Unknown',
+            'soil_status': soil_analysis.get('soil_status') or 'Unknown',
+            'recommendations': format_for_storage(combine_recommendations(
+                image_result.get('recommendations') or [], soil_analysis.get('recommendations') or [])),
+            'combined_confidence_score': combined_confidence(
+                image_result.get('confidence_score'), soil_analysis.get('confidence_score')),
+            'tomato_type': image_result.get('tomato_type') or 'Unknown',
+            'overall_health': score_to_health_category(combined_score),
+            'soil_issues': format_for_storage(soil_analysis.get('soil_issues') or []),
+            'plant_health_score': json_number(plant_health_score),
+            'soil_quality_score': json_number(soil_quality_score),
+            'has_soil_data': bool(soil_id),
+            'mode': 'batch_integrated'
+        }
+    except Exception as e:
+        logging.error(f"Single pair fusion failed: {e}")
+        return {
+            'user_id': user_id,
+            'image_id': image_id,
+            'soil_id': soil_id,
+            'health_status': 'Error',
+            'disease_type': 'Fusion Failed',
+            'soil_status': 'Error',
+            'recommendations': 'Check system configuration',
+            'combined_confidence_score': 0,
+            'tomato_type': 'Not Tomato',
+            'overall_health': 'Unknown',
+            'soil_issues': 'Fusion process error',
+            'plant_health_score': None,
+            'soil_quality_score': None,
+            'has_soil_data': bool(soil_id),
+            'mode': 'batch_integrated'
+        }
+
+
+class FusionAnalyzer:
+    """
+    Image and soil models in one process: both load concurrently, and every request
+    runs predict_disease and analyze_soil side by side before fusing the two results,
+    instead of two script spawns and a fusion step in Node.
+
+    The Node routes still fuse in lateFusionService.js; this entry point is for
+    callers that hold the image and the soil reading together.
+    """
+
+    def __init__(self, model_path='models/final_fast_tomato_model.h5', model_dir=None):
+        from tomato_prediction import TomatoClassifier
+        from soil_prediction import SoilAnalyzer
+
+        # Both inference paths spend most of their time in native code, so two threads overlap them
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='fusion')
+        load_start = time.perf_counter()
+        classifier = self._executor.submit(TomatoClassifier, model_path)
+        analyzer = self._executor.submit(SoilAnalyzer, model_dir)
+        self.classifier = classifier.result()
+        self.analyzer = analyzer.result()
+        self.load_seconds = time.perf_counter() - load_start
+        logging.info(f"Fusion analyzer ready: both models loaded in {self.load_seconds:.2f}s")
+
+    def analyze(self, request):
+        """Score the request's image and soil readings concurrently and fuse them (fusion_mode 'average' or 'weighted')"""
+        import tomato_prediction
+        import soil_prediction
+
+        fusion_mode = request.get('fusion_mode', 'average')
+        if fusion_mode not in FUSION_MODES:
+            return {
+                'success': False,
+                'error': f"Unknown fusion_mode '{fusion_mode}', expected one of {FUSION_MODES}"
+            }
+
+        user_id = request.get('user_id', 'unknown')
+        image_id = request.get('image_id')
+        soil_id = request.get('soil_id')
+        timer = StageTimer('fusion_prediction')
+
+        def timed_call(function, *args):
+            start = time.perf_counter()
+            result = function(*args)
+            return result, time.perf_counter() - start
+
+        # Only the single-image, single-reading forms: each half sees its part of the request
+        image_request = {key: value for key, value in request.items()
+                         if key not in ('soil_data', 'soil_readings', 'images', 'image_paths')}
+        soil_request = {key: value for key, value in request.items()
+                        if key not in ('soil_readings', 'images', 'image_paths', 'image_base64', 'image_bytes')}
+        image_future = self._executor.submit(timed_call, tomato_prediction.process_request, self.classifier, image_request)
+        soil_future = self._executor.submit(timed_call, soil_prediction.process_request, self.analyzer, soil_request)
+        image_analysis, image_seconds = image_future.result()
+        soil_analysis, soil_seconds = soil_future.result()
+        timer.add('image', image_seconds)
+        timer.add('soil', soil_seconds)
+
+        response = {
+            'image_analysis': image_analysis,
+            'soil_analysis': soil_analysis
+        }
+        try:
+            with timer.stage('fuse'):
+                if fusion_mode == 'weighted':
+                    fused = fuse_single_pair(image_analysis, soil_analysis, user_id, image_id, soil_id)
+                else:
+                    fused = perform_late_fusion(image_analysis, soil_analysis, user_id, image_id, soil_id)
+        except Exception as e:
+            return {
+                'success': False,
+                'error': f"Late fusion failed: {str(e)}",
+                **response,
+                'timings': timer.finish()
+            }
+
+        logging.info(f"Fusion result: {fused['overall_health']} (image {image_seconds:.3f}s, soil {soil_seconds:.3f}s)")
+        return {
+            'success': True,
+            'fusion_mode': fusion_mode,
+            'fused': fused,
+            **response,
+            # Wall time against the two analyses run back to back shows what running them side by side saved
+            'timings': timer.finish()
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def validate_request(request):
+    """Error message for a request missing either half, checked before any model is loaded"""
+    from tomato_prediction import resolve_image
+
+    if not request.get('soil_data'):
+        return 'No soil data provided'
+    if not request.get('optimal_ranges'):
+        return 'No optimal ranges provided from database'
+    return resolve_image(request)[1]
+
+
+def serve():
+    """Resident fusion worker: both models loaded once, JSON-lines requests on stdin"""
+    from worker_protocol import serve_lines
+
+    fusion = FusionAnalyzer()
+    worker_info = {
+        'worker': 'fusion_prediction',
+        'model_loaded': True,
+        'fusion_modes': list(FUSION_MODES),
+        'model_load_ms': fusion.load_seconds * 1000,
+        'import_report': import_report()
+    }
+
+    def handle_request(request):
+        error = validate_request(request)
+        if error:
+            return {'success': False, 'error': error}
+        return fusion.analyze(request)
+
+    try:
+        serve_lines(handle_request, worker_info)
+    finally:
+        fusion.shutdown()
+
+
+def main():
+    """One image plus one soil reading in, the fused result (and both analyses) out"""
+    try:
+        if len(sys.argv) < 2:
+            print(json.dumps({'success': False, 'error': 'Input data argument required'}))
+            return
+
+        if sys.argv[1] == '--serve':
+            serve()
+            return
+
+        request = json.loads(sys.argv[1])
+        error = validate_request(request)
+        if error:
+            # Reject bad input before paying for model loading
+            print(json.dumps({'success': False, 'error': error}))
+            return
+
+        fusion = FusionAnalyzer()
+        try:
+            result = fusion.analyze(request)
+        finally:
+            fusion.shutdown()
+        print(json.dumps(result, default=str))
+
+    except Exception as e:
+        print(json.dumps({'success': False, 'error': f"Fusion prediction failed: {str(e)}"}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,375 @@
+import os
+import time
+import queue
+import logging
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from stage_metrics import StageTimer
+
+DEFAULT_MODEL_PATH = 'models/final_fast_tomato_model.h5'
+
+
+def available_cores():
+    """Cores the pool may use: TOMATO_CPU_AFFINITY if set, else what this process may run on"""
+    from runtime_profile import resolve_runtime_profile
+
+    configured = resolve_runtime_profile()['cpu_affinity']
+    if configured:
+        return configured
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def split_cores(num_workers):
+    """Give each worker its own slice of the available cores"""
+    cores = available_cores()
+    if num_workers > len(cores):
+        logging.warning(f"{num_workers} workers on {len(cores)} cores - workers will share cores")
+        return [[cores[i % len(cores)]] for i in range(num_workers)]
+    return [cores[i::num_workers] for i in range(num_workers)]
+
+
+def wait_for_workers(result_queue, num_workers, exit_code, on_ready, timeout, label='Pool', poll_interval=0.2):
+    """
+    Take one 'ready' message per worker off result_queue, polling in short steps so a worker
+    that exits before it is ready (missing model, import error, out of memory) fails the wait
+    at once with its exit code instead of after the whole timeout. exit_code(worker_index)
+    returns None while that worker is still running.
+    """
+    deadline = time.time() + timeout
+    waiting = set(range(num_workers))
+    while waiting:
+        try:
+            message = result_queue.get(timeout=poll_interval)
+        except queue.Empty:
+            message = None
+        if message is not None and message[0] == 'ready':
+            waiting.discard(message[1])
+            on_ready(message[1], message[2])
+        for worker_index in sorted(waiting):
+            code = exit_code(worker_index)
+            if code is not None:
+                raise RuntimeError(f"{label} worker {worker_index} exited with code {code} before it was ready")
+        if waiting and time.time() > deadline:
+            raise RuntimeError(f"Only {num_workers - len(waiting)}/{num_workers} {label.lower()} workers started")
+
+
+def _worker_main(worker_index, cores, model_path, shm_name, slot_bytes, task_queue, result_queue):
+    """Pool worker: own a TomatoClassifier and run the shared-memory slots the dispatcher hands over"""
+    from tomato_prediction import TomatoClassifier
+
+    # TensorFlow sizes its default thread pools from the schedulable cores, so pinning is enough
+    classifier = TomatoClassifier(model_path, profile={'cpu_affinity': cores})
+    shm = shared_memory.SharedMemory(name=shm_name)
+    result_queue.put(('ready', worker_index, os.getpid()))
+
+    running = True
+    while running:
+        tasks = [task_queue.get()]
+        # Whatever else is already queued for this worker rides along in the same forward pass
+        while True:
+            try:
+                tasks.append(task_queue.get_nowait())
+            except queue.Empty:
+                break
+        if None in tasks:
+            running = False
+            tasks = [task for task in tasks if task is not None]
+        if not tasks:
+            continue
+
+        start_time = time.time()
+        timer = StageTimer('tomato_prediction')
+        try:
+            # One copy out of the slots into a contiguous batch; the slots are free again once it is made
+            batch = np.stack([
+                np.ndarray(shape, dtype=np.float32, buffer=shm.buf, offset=slot * slot_bytes)
+                for _, slot, shape in tasks
+            ])
+            results = classifier.predict_preprocessed(batch, timer)
+        except Exception as e:
+            logging.error(f"Pool worker {worker_index} inference failed: {e}")
+            results = [None] * len(tasks)
+
+        per_image_time = (time.time() - start_time) / len(tasks)
+        stages = {stage: seconds / len(tasks) for stage, seconds in timer.stages.items()}
+        for (request_id, _, _), result in zip(tasks, results):
+            if result is not None:
+                result['inference_time'] = per_image_time
+                result['cache_hit'] = False
+            result_queue.put(('result', worker_index, request_id, result, stages))
+
+    shm.close()
+
+
+class InferencePool:
+    """
+    N TomatoClassifier processes pinned to disjoint cores.
+
+    Each worker owns a shared-memory block of slots_per_worker input slots. A
+    dispatcher thread pool decodes and normalizes each image straight into a
+    free slot of the chosen worker and only the slot index and tensor shape go
+    over the queue, so image tensors are never pickled and the calling thread
+    does no image work. Requests go to the worker with the fewest requests in
+    flight. Results are plain prediction dicts, the same as
+    TomatoClassifier.predict_disease returns.
+    """
+
+    def __init__(self, num_workers=None, model_path=DEFAULT_MODEL_PATH, target_size=(224, 224),
+                 slots_per_worker=8, decoder=None, decode_threads=None, startup_timeout=300):
+        from tomato_prediction import decode_image_pil, decode_image_opencv
+
+        self.decoder = decoder or os.environ.get('TOMATO_DECODER', 'pil')
+        self.decode = decode_image_opencv if self.decoder == 'opencv' else decode_image_pil
+        self.target_size = target_size
+        self.slots_per_worker = slots_per_worker
+        core_sets = split_cores(num_workers or len(available_cores()))
+        self.num_workers = len(core_sets)
+
+        context = multiprocessing.get_context('spawn')
+        self._result_queue = context.Queue()
+        self._condition = threading.Condition()
+        self._pending = {}
+        self._request_ids = itertools.count()
+        self._workers = []
+        self._decode_pool = ThreadPoolExecutor(max_workers=decode_threads or self.num_workers,
+                                               thread_name_prefix='tomato-pool-decode')
+
+        self.tensor_shape = (target_size[0], target_size[1], 3)
+        slot_bytes = int(np.prod(self.tensor_shape)) * np.dtype(np.float32).itemsize
+        for worker_index, cores in enumerate(core_sets):
+            shm = shared_memory.SharedMemory(create=True, size=slot_bytes * slots_per_worker)
+            task_queue = context.Queue()
+            process = context.Process(
+                target=_worker_main,
+                args=(worker_index, cores, model_path, shm.name, slot_bytes, task_queue, self._result_queue),
+                name=f'tomato-pool-{worker_index}',
+                daemon=True
+            )
+            process.start()
+            self._workers.append({
+                'process': process,
+                'cores': cores,
+                'shm': shm,
+                'slots': np.ndarray((slots_per_worker,) + self.tensor_shape, dtype=np.float32, buffer=shm.buf),
+                'free_slots': list(range(slots_per_worker)),
+                'task_queue': task_queue,
+                'in_flight': 0,
+                'completed': 0,
+                'alive': True
+            })
+
+        self._wait_until_ready(startup_timeout)
+        self._collector = threading.Thread(target=self._collect_results, name='tomato-pool-results', daemon=True)
+        self._collector.start()
+        logging.info(f"Inference pool ready: {self.num_workers} workers on cores {core_sets}")
+
+    def _wait_until_ready(self, timeout):
+        try:
+            wait_for_workers(
+                self._result_queue,
+                self.num_workers,
+                lambda worker_index: self._workers[worker_index]['process'].exitcode,
+                lambda worker_index, pid: logging.info(f"Pool worker {worker_index} ready (pid {pid})"),
+                timeout
+            )
+        except RuntimeError:
+            self.shutdown()
+            raise
+
+    def submit(self, img_path):
+        """Reserve a slot on the least busy live worker and queue the image (path or raw bytes) for decoding into it; returns a Future of the prediction result"""
+        future = Future()
+        timer = StageTimer('tomato_prediction')
+        with timer.stage('queue_wait'):
+            with self._condition:
+                while True:
+                    candidates = [worker for worker in self._workers if worker['alive'] and worker['free_slots']]
+                    if candidates:
+                        break
+                    if not any(worker['alive'] for worker in self._workers):
+                        raise RuntimeError("No live pool workers")
+                    self._condition.wait()
+                worker = min(candidates, key=lambda candidate: candidate['in_flight'])
+                worker['in_flight'] += 1
+                slot = worker['free_slots'].pop()
+                request_id = next(self._request_ids)
+                self._pending[request_id] = (future, worker, slot, timer)
+        self._decode_pool.submit(self._decode_into_slot, request_id, worker, slot, img_path, timer)
+        return future
+
+    def _decode_into_slot(self, request_id, worker, slot, img_path, timer):
+        """Decode and normalize one image into its slot, then hand the worker only the slot index and shape"""
+        from tomato_prediction import describe_image
+
+        try:
+            with timer.stage('decode'):
+                decoded = self.decode(img_path, self.target_size)
+            with timer.stage('preprocess'):
+                np.divide(decoded, 255.0, out=worker['slots'][slot], dtype=np.float32)
+        except Exception as e:
+            logging.error(f"Error preprocessing image {describe_image(img_path)}: {e}")
+            entry = self._finish(request_id)
+            if entry is not None:
+                entry[0].set_result(None)
+            return
+        worker['task_queue'].put((request_id, slot, self.tensor_shape))
+
+    def _finish(self, request_id):
+        """Take a request out of the pending table and give its slot back; None if it was already failed"""
+        with self._condition:
+            entry = self._pending.pop(request_id, None)
+            if entry is not None:
+                _, worker, slot, _ = entry
+                worker['free_slots'].append(slot)
+                worker['in_flight'] -= 1
+                self._condition.notify()
+        return entry
+
+    def predict_disease(self, img_path):
+        """Blocking single prediction, so the pool can stand in for a TomatoClassifier"""
+        return self.submit(img_path).result()
+
+    def predict_disease_batch(self, img_paths):
+        futures = [self.submit(img_path) for img_path in img_paths]
+        return [future.result() for future in futures]
+
+    def _collect_results(self):
+        while True:
+            try:
+                message = self._result_queue.get(timeout=0.2)
+            except queue.Empty:
+                message = False
+            # Every pass, busy or idle, so a dead worker is noticed even while others keep answering
+            self._check_workers()
+            if message is None:
+                return
+            if message is not False:
+                self._handle_result(message)
+
+    def _handle_result(self, message):
+        """Resolve the request a worker answered and free its slot"""
+        _, worker_index, request_id, result, worker_stages = message
+        with self._condition:
+            self._workers[worker_index]['completed'] += 1
+        entry = self._finish(request_id)
+        if entry is None:
+            # Already failed by _check_workers
+            return
+        future, _, _, timer = entry
+        if result is not None:
+            # Queue wait, decode and preprocess happened here; forward and postprocess in the worker
+            for stage, seconds in worker_stages.items():
+                timer.add(stage, seconds)
+            result['timings'] = timer.finish()
+        future.set_result(result)
+
+    def _check_workers(self):
+        """Fail the requests of any worker that died so callers never wait forever"""
+        failed = []
+        with self._condition:
+            for worker_index, worker in enumerate(self._workers):
+                if not worker['alive'] or worker['process'].is_alive():
+                    continue
+                logging.error(f"Pool worker {worker_index} exited with code {worker['process'].exitcode}")
+                worker['alive'] = False
+                for request_id, (future, owner, _, _) in list(self._pending.items()):
+                    if owner is worker:
+                        del self._pending[request_id]
+                        failed.append((future, worker_index))
+                worker['in_flight'] = 0
+            self._condition.notify_all()
+        for future, worker_index in failed:
+            future.set_exception(RuntimeError(f"Pool worker {worker_index} died"))
+
+    def stats(self):
+        with self._condition:
+            return {
+                'workers': [
+                    {
+                        'pid': worker['process'].pid,
+                        'cores': worker['cores'],
+                        'alive': worker['alive'],
+                        'queue_depth': worker['in_flight'],
+                        'completed': worker['completed']
+                    }
+                    for worker in self._workers
+                ],
+                'requests_in_flight': len(self._pending)
+            }
+
+    def shutdown(self):
+        """Let workers finish what they have, then stop them and the collector and free the shared memory"""
+        self._decode_pool.shutdown(wait=True)
+        for worker in self._workers:
+            if worker['process'].is_alive():
+                worker['task_queue'].put(None)
+        for worker in self._workers:
+            worker['process'].join(timeout=30)
+            if worker['process'].is_alive():
+                worker['process'].terminate()
+
+        self._result_queue.put(None)
+        collector = getattr(self, '_collector', None)
+        if collector is not None:
+            collector.join(timeout=5)
+        for worker in self._workers:
+            # The slot view has to go before the block can be closed
+            worker['slots'] = None
+            worker['shm'].close()
+            worker['shm'].unlink()
+        self._workers = []
+
+
+def benchmark_pool(img_paths, num_workers=None, threads=8, requests=64, model_path=DEFAULT_MODEL_PATH):
+    """Throughput of the process pool against one process serving the same requests from a thread pool"""
+    from tomato_prediction import TomatoClassifier
+
+    workload = [img_paths[i % len(img_paths)] for i in range(requests)]
+
+    classifier = TomatoClassifier(model_path)
+    classifier.cache = None  # measure inference, not cache hits
+    classifier.predict_disease(workload[0])  # warm-up
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        threaded_results = list(executor.map(classifier.predict_disease, workload))
+    threaded_seconds = time.time() - start_time
+
+    pool = InferencePool(num_workers, model_path)
+    try:
+        pool.predict_disease(workload[0])  # warm-up
+        start_time = time.time()
+        pool_results = pool.predict_disease_batch(workload)
+        pool_seconds = time.time() - start_time
+        pool_stats = pool.stats()
+    finally:
+        pool.shutdown()
+
+    agreement = sum(
+        1 for threaded, pooled in zip(threaded_results, pool_results)
+        if threaded and pooled and threaded['predicted_class'] == pooled['predicted_class']
+    ) / len(workload)
+
+    return {
+        'success': True,
+        'requests': requests,
+        'single_process_threads': {
+            'threads': threads,
+            'seconds': threaded_seconds,
+            'images_per_second': requests / threaded_seconds
+        },
+        'process_pool': {
+            'workers': pool_stats['workers'],
+            'seconds': pool_seconds,
+            'images_per_second': requests / pool_seconds
+        },
+        'speedup': threaded_seconds / pool_seconds,
+        'top1_agreement': agreement
+    }
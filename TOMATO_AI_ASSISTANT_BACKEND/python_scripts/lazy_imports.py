@@ -0,0 +1,38 @@
+import importlib
+import os
+import sys
+import time
+
+# module name -> seconds spent on its first import in this process
+IMPORT_TIMINGS = {}
+
+# Imports slower than this are flagged in the report (IMPORT_BUDGET_MS to override)
+DEFAULT_IMPORT_BUDGET_MS = 500
+
+
+def timed_import(module_name):
+    """Import a module on first use and record how long the import took"""
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    start_time = time.perf_counter()
+    module = importlib.import_module(module_name)
+    IMPORT_TIMINGS[module_name] = time.perf_counter() - start_time
+    return module
+
+
+def import_report():
+    """Per-module import timings against the configured budget"""
+    budget_ms = float(os.environ.get('IMPORT_BUDGET_MS', DEFAULT_IMPORT_BUDGET_MS))
+    imports = {
+        name: {
+            'time_ms': round(seconds * 1000, 2),
+            'over_budget': seconds * 1000 > budget_ms
+        }
+        for name, seconds in sorted(IMPORT_TIMINGS.items(), key=lambda item: item[1], reverse=True)
+    }
+    return {
+        'imports': imports,
+        'total_import_ms': round(sum(IMPORT_TIMINGS.values()) * 1000, 2),
+        'budget_ms': budget_ms
+    }
@@ -0,0 +1,167 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """SHA-256 of a file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """
+    Content-addressed cache of prediction results.
+
+    Keys combine the hash of the image bytes with the model version, so a new
+    model never serves stale results. Results live in an in-memory LRU and,
+    when disk_dir is set, in a directory of JSON files trimmed to max_disk_bytes
+    by evicting the least recently used files. The directory's sizes and use
+    order are kept in memory, so a write does not list the directory; it is
+    rescanned every rescan_every writes to pick up other processes sharing it.
+    """
+
+    def __init__(self, model_version, max_entries=1024, disk_dir=None, max_disk_bytes=256 * 1024 * 1024, rescan_every=1024):
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.rescan_every = rescan_every
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # File name -> size in bytes, least recently used first
+        self._disk_entries = OrderedDict()
+        self._disk_bytes = 0
+        self._disk_lock = threading.Lock()
+        self._writes_since_scan = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    def key_for_file(self, path):
+        return hashlib.sha256(f"{self.model_version}:{hash_file(path)}".encode('utf-8')).hexdigest()
+
+    def key_for_bytes(self, data):
+        return hashlib.sha256(f"{self.model_version}:{hashlib.sha256(data).hexdigest()}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return a copy of the cached result, or None on a miss"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return copy.deepcopy(self._memory[key])
+
+        result = self._read_disk(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, result)
+        return copy.deepcopy(result)
+
+    def put(self, key, result):
+        stored = copy.deepcopy(result)
+        with self._lock:
+            self._remember(key, stored)
+        self._write_disk(key, stored)
+
+    def _remember(self, key, result):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            # Touch the file so eviction sees it as recently used, here and in a later scan
+            os.utime(path)
+            with self._disk_lock:
+                if os.path.basename(path) in self._disk_entries:
+                    self._disk_entries.move_to_end(os.path.basename(path))
+            return result
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, result):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, default=str)
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not write prediction cache entry: {e}")
+            return
+
+        with self._disk_lock:
+            name = os.path.basename(path)
+            self._disk_bytes += size - self._disk_entries.pop(name, 0)
+            self._disk_entries[name] = size
+            self._writes_since_scan += 1
+            if self._writes_since_scan >= self.rescan_every:
+                self._scan_disk()
+            self._evict_disk()
+
+    def _scan_disk(self):
+        """Rebuild the in-memory view of the directory from one listing, oldest files first"""
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.disk_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name, stat.st_size))
+
+        self._disk_entries = OrderedDict((name, size) for _, name, size in sorted(entries))
+        self._disk_bytes = sum(self._disk_entries.values())
+        self._writes_since_scan = 0
+
+    def _evict_disk(self):
+        """Drop least recently used files until the directory fits in max_disk_bytes"""
+        while self._disk_bytes > self.max_disk_bytes and self._disk_entries:
+            name, size = self._disk_entries.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(os.path.join(self.disk_dir, name))
+            except OSError:
+                # Already evicted by another process sharing the directory
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._memory),
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+            }
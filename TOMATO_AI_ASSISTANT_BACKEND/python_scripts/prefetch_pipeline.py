@@ -0,0 +1,211 @@
+import os
+import time
+import queue
+import logging
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from stage_metrics import StageTimer
+
+
+def prefetch_settings():
+    """
+    (prefetch depth, decode threads) from TOMATO_PREFETCH_DEPTH (0 disables prefetching)
+    and TOMATO_DECODE_THREADS. With a single schedulable core decoding can only steal time
+    from inference, so prefetching defaults to off there.
+    """
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    prefetch_depth = int(os.environ.get('TOMATO_PREFETCH_DEPTH', 2 if cores > 1 else 0))
+    decode_threads = int(os.environ.get('TOMATO_DECODE_THREADS', min(4, cores)))
+    return prefetch_depth, max(1, decode_threads)
+
+
+class PrefetchPipeline:
+    """
+    Overlap image reads and decoding with model inference.
+
+    A producer thread takes the next batch_size items and a pool of decode
+    threads decodes them straight into one of prefetch_depth + 1 preallocated
+    float32 buffers, while the caller's thread runs the forward pass on an
+    earlier buffer. At most prefetch_depth decoded batches wait ahead of the
+    model, so memory stays bounded however long the input is.
+    """
+
+    def __init__(self, classifier, batch_size=16, prefetch_depth=2, decode_threads=4, target_size=(224, 224)):
+        if prefetch_depth < 1:
+            raise ValueError("prefetch_depth must be at least 1")
+
+        self.classifier = classifier
+        self.batch_size = batch_size
+        self.prefetch_depth = prefetch_depth
+        self.decode_threads = decode_threads
+        self.target_size = target_size
+
+        # One buffer on the model plus prefetch_depth being filled or waiting
+        shape = (batch_size, target_size[0], target_size[1], 3)
+        self._ring = [np.empty(shape, dtype=np.float32) for _ in range(prefetch_depth + 1)]
+        self._executor = ThreadPoolExecutor(max_workers=decode_threads, thread_name_prefix='prefetch-decode')
+        self._run_lock = threading.Lock()
+
+        self.batches = 0
+        self.images = 0
+        self.decode_seconds = 0.0
+        self.compute_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    def _fill(self, buffer, row, img_path):
+        """
+        Decode thread: check the prediction cache, else decode and normalize into buffer[row].
+        Returns (cache_key, cached_result or False when decoded or None when failed, stage seconds).
+        """
+        stages = {}
+        if not img_path:
+            return None, None, stages
+        try:
+            start = time.perf_counter()
+            cache_key, cached = self.classifier._lookup_cache(img_path, time.time())
+            stages['cache_lookup'] = time.perf_counter() - start
+            if cached is not None:
+                return cache_key, cached, stages
+
+            start = time.perf_counter()
+            decoded = self.classifier.decode_image(img_path, self.target_size)
+            stages['decode'] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            np.divide(decoded, 255.0, out=buffer[row], dtype=np.float32)
+            stages['preprocess'] = time.perf_counter() - start
+            return cache_key, False, stages
+        except Exception as e:
+            logging.error(f"Skipping image {self.classifier.describe_image(img_path)}: {e}")
+            return None, None, stages
+
+    def _produce(self, items, path_of, free_buffers, ready, stop):
+        try:
+            items = iter(items)
+            while not stop.is_set():
+                chunk = list(itertools.islice(items, self.batch_size))
+                if not chunk:
+                    break
+                buffer_index = free_buffers.get()
+                if stop.is_set():
+                    break
+                buffer = self._ring[buffer_index]
+                start = time.perf_counter()
+                filled = list(self._executor.map(
+                    lambda row: self._fill(buffer, row, path_of(chunk[row])), range(len(chunk))))
+                ready.put((chunk, buffer_index, filled, time.perf_counter() - start))
+        except Exception as e:
+            ready.put(e)
+        finally:
+            ready.put(None)
+
+    def run(self, items, path_of=None):
+        """
+        Yield (item, prediction_result) for every item, in input order.
+        path_of maps an item to its image path (identity by default); a falsy path
+        or an unreadable image yields None without touching the model.
+        """
+        path_of = path_of or (lambda item: item)
+
+        with self._run_lock:
+            free_buffers = queue.Queue()
+            for buffer_index in range(len(self._ring)):
+                free_buffers.put(buffer_index)
+            # The ring already bounds how far the producer can run ahead
+            ready = queue.Queue()
+            stop = threading.Event()
+
+            producer = threading.Thread(
+                target=self._produce,
+                args=(items, path_of, free_buffers, ready, stop),
+                name='prefetch-producer',
+                daemon=True
+            )
+            producer.start()
+
+            try:
+                while True:
+                    wait_start = time.perf_counter()
+                    message = ready.get()
+                    wait_seconds = time.perf_counter() - wait_start
+                    if message is None:
+                        break
+                    if isinstance(message, Exception):
+                        raise message
+
+                    chunk, buffer_index, filled, decode_seconds = message
+                    results = self._infer(self._ring[buffer_index], filled, decode_seconds, wait_seconds)
+                    free_buffers.put(buffer_index)
+                    yield from zip(chunk, results)
+            finally:
+                # Caller stopped early: let the producer finish its chunk so no decode writes into the ring later
+                stop.set()
+                free_buffers.put(0)
+                producer.join()
+
+    def _infer(self, buffer, filled, decode_seconds, wait_seconds):
+        """Run the model on the decoded rows of one ring buffer; cached rows are returned as they are"""
+        compute_start = time.perf_counter()
+        results = [None] * len(filled)
+        rows = []
+        for row, (_, cached, stages) in enumerate(filled):
+            if cached is False:
+                rows.append(row)
+            elif cached is not None:
+                timer = StageTimer('tomato_prediction')
+                timer.add('cache_lookup', stages['cache_lookup'])
+                cached['timings'] = timer.finish()
+                results[row] = cached
+
+        if rows:
+            timer = self.classifier.stage_timer()
+            timer.add('prefetch_wait', wait_seconds)
+            for row in rows:
+                for stage, seconds in filled[row][2].items():
+                    timer.add(stage, seconds)
+
+            # Contiguous rows are a view of the ring buffer; a cached or failed row in between forces a gather
+            batch = buffer[:len(rows)] if rows[-1] == len(rows) - 1 else buffer[rows]
+            try:
+                predictions = self.classifier.predict_preprocessed(batch, timer)
+            except Exception as e:
+                logging.error(f"Error predicting disease batch: {e}")
+                predictions = [None] * len(rows)
+
+            per_image_time = (decode_seconds + time.perf_counter() - compute_start) / len(rows)
+            timings = timer.finish(count=len(rows))
+            for row, prediction in zip(rows, predictions):
+                if prediction is None:
+                    continue
+                prediction['inference_time'] = per_image_time
+                prediction['cache_hit'] = False
+                prediction['timings'] = dict(timings)
+                if filled[row][0] is not None:
+                    self.classifier.cache.put(filled[row][0], prediction)
+                results[row] = prediction
+
+        self.batches += 1
+        self.images += len(filled)
+        self.decode_seconds += decode_seconds
+        self.compute_seconds += time.perf_counter() - compute_start
+        self.wait_seconds += wait_seconds
+        return results
+
+    def stats(self):
+        """overlap_ratio is the share of decode wall time hidden behind inference (1.0 = the model never waited)"""
+        hidden = self.decode_seconds - self.wait_seconds
+        return {
+            'prefetch_depth': self.prefetch_depth,
+            'decode_threads': self.decode_threads,
+            'batch_size': self.batch_size,
+            'batches': self.batches,
+            'images': self.images,
+            'decode_seconds': self.decode_seconds,
+            'compute_seconds': self.compute_seconds,
+            'wait_seconds': self.wait_seconds,
+            'overlap_ratio': max(0.0, min(1.0, hidden / self.decode_seconds)) if self.decode_seconds else 0.0
+        }
@@ -0,0 +1,118 @@
+import os
+import sys
+import logging
+
+# profile key -> (environment variable, command-line flag)
+PROFILE_SETTINGS = {
+    'intra_op_threads': ('TOMATO_INTRA_OP_THREADS', '--intra-op-threads'),
+    'inter_op_threads': ('TOMATO_INTER_OP_THREADS', '--inter-op-threads'),
+    'onednn': ('TOMATO_ONEDNN', '--onednn'),
+    'cpu_affinity': ('TOMATO_CPU_AFFINITY', '--cpu-affinity')
+}
+
+
+def parse_cpu_list(value):
+    """'0-3,6' -> [0, 1, 2, 3, 6]"""
+    if isinstance(value, (list, tuple, set)):
+        return sorted(int(cpu) for cpu in value)
+    cpus = set()
+    for part in str(value).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def parse_switch(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('1', 'on', 'true', 'yes'):
+        return True
+    if text in ('0', 'off', 'false', 'no'):
+        return False
+    raise ValueError(f"Expected on/off, got '{value}'")
+
+
+def profile_args_to_env(argv):
+    """
+    Strip --intra-op-threads N style flags out of argv and export them as TOMATO_* variables,
+    so every classifier this process (or its worker processes) creates picks them up.
+    """
+    flags = {flag: env_name for env_name, flag in PROFILE_SETTINGS.values()}
+    remaining = argv[:1]
+    args = iter(argv[1:])
+    for arg in args:
+        if arg in flags:
+            value = next(args, None)
+            if value is None:
+                raise ValueError(f"{arg} needs a value")
+            os.environ[flags[arg]] = value
+        else:
+            remaining.append(arg)
+    argv[:] = remaining
+
+
+def resolve_runtime_profile(overrides=None):
+    """Combine TOMATO_* environment settings with explicit overrides (which win); unset keys keep TF defaults"""
+    raw = {key: os.environ.get(env_name) for key, (env_name, _) in PROFILE_SETTINGS.items()}
+    if raw['onednn'] is None and 'TF_ENABLE_ONEDNN_OPTS' in os.environ:
+        raw['onednn'] = os.environ['TF_ENABLE_ONEDNN_OPTS']
+    raw.update({key: value for key, value in (overrides or {}).items() if value is not None})
+
+    profile = {}
+    for key in ('intra_op_threads', 'inter_op_threads'):
+        profile[key] = int(raw[key]) if raw[key] not in (None, '') else None
+    profile['onednn'] = parse_switch(raw['onednn']) if raw['onednn'] not in (None, '') else None
+    profile['cpu_affinity'] = parse_cpu_list(raw['cpu_affinity']) if raw['cpu_affinity'] not in (None, '') else None
+    return profile
+
+
+def apply_process_settings(profile):
+    """Settings that must be in place before TensorFlow is imported: oneDNN switch and CPU affinity"""
+    if 'tensorflow' in sys.modules and profile['onednn'] is not None:
+        logging.warning("TensorFlow already imported - oneDNN setting only applies to new processes")
+    if profile['onednn'] is not None:
+        os.environ['TF_ENABLE_ONEDNN_OPTS'] = '1' if profile['onednn'] else '0'
+
+    if profile['cpu_affinity'] is not None:
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, profile['cpu_affinity'])
+        else:
+            logging.warning("CPU affinity is not supported on this platform")
+
+
+def apply_tensorflow_threads(profile):
+    """Thread pool sizes; TensorFlow only accepts these before its runtime starts"""
+    tf = sys.modules['tensorflow']
+    for key, setter in (('intra_op_threads', tf.config.threading.set_intra_op_parallelism_threads),
+                        ('inter_op_threads', tf.config.threading.set_inter_op_parallelism_threads)):
+        if profile[key] is None:
+            continue
+        try:
+            setter(profile[key])
+        except RuntimeError as e:
+            logging.warning(f"Could not set {key}: {e}")
+
+
+def effective_runtime_profile(backend, model=None):
+    """What is actually in force in this process, for result metadata and health replies"""
+    onednn_env = os.environ.get('TF_ENABLE_ONEDNN_OPTS')
+    effective = {
+        'backend': backend,
+        'onednn': None if onednn_env is None else onednn_env == '1',
+        'cpu_affinity': sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else None
+    }
+    if backend == 'tflite':
+        effective['num_threads'] = getattr(model, 'num_threads', None)
+    elif 'tensorflow' in sys.modules:
+        threading = sys.modules['tensorflow'].config.threading
+        # 0 means TensorFlow picks the size itself (one thread per schedulable core)
+        effective['intra_op_threads'] = threading.get_intra_op_parallelism_threads()
+        effective['inter_op_threads'] = threading.get_inter_op_parallelism_threads()
+    return effective
@@ -0,0 +1,88 @@
+import os
+import logging
+
+import numpy as np
+
+from flat_forest import FlatForest
+from lazy_imports import timed_import
+
+ARTIFACT_FILE = 'soil_model.mmap.joblib'
+ARTIFACT_VERSION = 2
+MODEL_FORMATS = ('auto', 'mmap', 'pickle')
+
+
+class FlatScaler:
+    """StandardScaler.transform from its mean_ and scale_ arrays, without importing sklearn"""
+
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+
+    @classmethod
+    def from_sklearn(cls, scaler):
+        if not hasattr(scaler, 'with_mean') or not hasattr(scaler, 'with_std'):
+            raise TypeError(f"Only StandardScaler can be exported, got {type(scaler).__name__}")
+        return cls(scaler.mean_ if scaler.with_mean else None, scaler.scale_ if scaler.with_std else None)
+
+    def transform(self, X):
+        # Same operations in the same order as sklearn, so the scaled values are bit-identical
+        X = np.array(X, dtype=np.float64)
+        if self.mean_ is not None:
+            X -= self.mean_
+        if self.scale_ is not None:
+            X /= self.scale_
+        return X
+
+
+def source_signature(paths):
+    """(size, mtime_ns) of each pickle the artifact was exported from, to notice when one is replaced"""
+    signature = {}
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature[os.path.basename(path)] = [stat.st_size, stat.st_mtime_ns]
+    return signature
+
+
+def export_soil_artifact(path, soil_model, scaler, source_paths=()):
+    """
+    Write the flattened forest and the scaler's arrays as one uncompressed joblib file.
+    Uncompressed numpy arrays are what joblib can memory-map on load.
+    """
+    import joblib
+
+    forest = FlatForest.from_sklearn(soil_model)
+    scaler = FlatScaler.from_sklearn(scaler)
+    joblib.dump({
+        'version': ARTIFACT_VERSION,
+        'forest': forest.arrays(),
+        'scaler': {'mean': scaler.mean_, 'scale': scaler.scale_},
+        'sources': source_signature(source_paths)
+    }, path)
+    return forest
+
+
+def load_soil_artifact(path, source_paths=()):
+    """
+    Memory-map an exported artifact: (FlatForest, FlatScaler), or None when it is missing,
+    from another artifact version or older than the pickles it was exported from.
+
+    The arrays stay backed by the file, so loading reads only the header and every
+    process that maps the same file shares one copy of the pages in the page cache.
+    """
+    if not os.path.exists(path):
+        return None
+
+    artifact = timed_import('joblib').load(path, mmap_mode='r')
+    if artifact.get('version') != ARTIFACT_VERSION:
+        logging.warning(f"Ignoring {path}: artifact version {artifact.get('version')}, expected {ARTIFACT_VERSION}")
+        return None
+
+    current = source_signature(source_paths)
+    stale = [name for name, signature in current.items() if artifact['sources'].get(name, signature) != signature]
+    if stale:
+        logging.warning(f"Ignoring {path}: {', '.join(stale)} changed since it was exported")
+        return None
+
+    scaler = artifact['scaler']
+    return FlatForest.from_arrays(artifact['forest']), FlatScaler(scaler['mean'], scaler['scale'])
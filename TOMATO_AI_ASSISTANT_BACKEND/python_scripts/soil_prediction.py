@@ -1,6 +1,3 @@
-import pandas as pd
-import joblib
-import numpy as np
 import warnings
 import json
 import sys
@@ -8,90 +5,267 @@ import os
 import logging
 import time
 
+from lazy_imports import timed_import, import_report
+from stage_metrics import StageTimer
+
+# joblib/sklearn are imported lazily in SoilAnalyzer; the soil path never needs TensorFlow or pandas
+np = timed_import('numpy')
+
 # Configure logging to output to stderr
 logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stderr)
 sys.stdout.reconfigure(encoding='utf-8') if hasattr(sys.stdout, 'reconfigure') else None
 warnings.filterwarnings("ignore")
 
+# Supabase field name -> model feature name, in the column order the model expects
+FIELD_MAPPING = {
+    'ph_level': 'Soil_pH',
+    'temperature': 'Temperature',
+    'moisture': 'Moisture',
+    'nitrogen': 'N',
+    'phosphorus': 'P',
+    'potassium': 'K'
+}
+
+FOREST_EVALUATORS = ('flat', 'sklearn')
+SOIL_MODEL_FILE = 'soil_regressor_rf.pkl'
+SCALER_FILE = 'scaler_soil.pkl'
+
+# Sensor resolution per field (decimal places), in FIELD_MAPPING order; with the memo on, the
+# model scores the rounded reading so every reading in a bucket gets the same score
+READING_RESOLUTION = {
+    'ph_level': 2,
+    'temperature': 1,
+    'moisture': 1,
+    'nitrogen': 0,
+    'phosphorus': 0,
+    'potassium': 0
+}
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def resolve_model_dir(model_dir=None):
+    """The models directory; ML_MODEL_DIR points both scripts at another one (e.g. benchmark stand-ins)"""
+    return model_dir or os.environ.get('ML_MODEL_DIR') or os.path.join(SCRIPT_DIR, 'models')
+
+def model_file_path(model_dir, file_name):
+    """file_name in the models directory, falling back to the script directory"""
+    path = os.path.join(model_dir, file_name)
+    return path if os.path.exists(path) else os.path.join(SCRIPT_DIR, file_name)
+
+def load_model_artifact(model_dir, model_format):
+    """
+    SOIL_MODEL_FORMAT=auto (default) memory-maps the exported artifact when there is a
+    current one and otherwise unpickles; mmap requires the artifact, pickle never uses it.
+    Returns (FlatForest, FlatScaler), or None when the pickles are to be loaded.
+    """
+    from soil_artifact import MODEL_FORMATS, ARTIFACT_FILE, load_soil_artifact
+    
+    if model_format not in MODEL_FORMATS:
+        raise ValueError(f"Unknown soil model format '{model_format}', expected one of {MODEL_FORMATS}")
+    if model_format == 'pickle' or os.environ.get('SOIL_FOREST_EVALUATOR') == 'sklearn':
+        return None
+    
+    artifact_path = model_file_path(model_dir, ARTIFACT_FILE)
+    source_paths = (model_file_path(model_dir, SOIL_MODEL_FILE), model_file_path(model_dir, SCALER_FILE))
+    artifact = load_soil_artifact(artifact_path, source_paths)
+    if artifact is None and model_format == 'mmap':
+        raise FileNotFoundError(f"No usable soil model artifact at {artifact_path} (run soil_prediction.py --export-artifact)")
+    return artifact
+
 class SoilAnalyzer:
-    def __init__(self):
+    def __init__(self, model_dir=None, model_format=None):
         """Initialize soil analyzer with pre-trained models ONLY"""
+        load_start = time.perf_counter()
         try:
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            
-            # Load soil model
-            soil_model_path = os.path.join(script_dir, 'models', 'soil_regressor_rf.pkl')
-            if not os.path.exists(soil_model_path):
-                soil_model_path = os.path.join(script_dir, 'soil_regressor_rf.pkl')
+            self.model_dir = resolve_model_dir(model_dir)
+            self.model_paths = (self.model_path(SOIL_MODEL_FILE), self.model_path(SCALER_FILE))
+            self._soil_model = None
             
-            self.soil_model = joblib.load(soil_model_path)
-            logging.info("Soil prediction model loaded")
+            artifact = load_model_artifact(self.model_dir, model_format or os.environ.get('SOIL_MODEL_FORMAT', 'auto'))
+            if artifact is not None:
+                # Nothing was unpickled and sklearn is never imported. Every batch size stays on the flat
+                # walk: unpickling the forest for large batches would cost seconds inside a live request
+                # and a private copy of the model per process, the two things the artifact saves
+                self.forest, self.scaler = artifact
+                self.flat_forest_max_rows = float('inf')
+                self.model_format = 'mmap'
+                logging.info("Soil model and scaler memory-mapped")
+            else:
+                joblib = timed_import('joblib')
+                timed_import('sklearn.ensemble')
+                
+                # Load soil model
+                self._soil_model = joblib.load(self.model_paths[0])
+                logging.info("Soil prediction model loaded")
+                
+                # Load scaler
+                self.scaler = joblib.load(self.model_paths[1])
+                logging.info("Feature scaler loaded")
+                
+                self.forest, self.flat_forest_max_rows = self._build_flat_forest()
+                self.model_format = 'pickle'
             
-            # Load scaler
-            scaler_path = os.path.join(script_dir, 'models', 'scaler_soil.pkl')
-            if not os.path.exists(scaler_path):
-                scaler_path = os.path.join(script_dir, 'scaler_soil.pkl')
+            self.memo = self._build_memo()
             
-            self.scaler = joblib.load(scaler_path)
-            logging.info("Feature scaler loaded")
+            self.load_seconds = time.perf_counter() - load_start
+            # Reported once, on the first analysis this process makes
+            self._unreported_load_time = self.load_seconds
             
         except Exception as e:
             logging.error(f"Error loading soil models: {e}")
             raise
 
+    def model_path(self, file_name):
+        return model_file_path(self.model_dir, file_name)
+
+    @property
+    def soil_model(self):
+        """The sklearn forest; a memory-mapped analyzer only unpickles it for diagnostics (--forest-parity)"""
+        if self._soil_model is None:
+            self._soil_model = timed_import('joblib').load(self.model_paths[0])
+            logging.info("Soil prediction model loaded")
+        return self._soil_model
+
+    def flat_forest_max_rows_setting(self):
+        """
+        Largest batch the flat walk evaluates (SOIL_FLAT_FOREST_MAX_ROWS, default 16). Larger
+        batches go back to sklearn, whose compiled per-tree loop overtakes the vectorized walk.
+        On the shipped forest (100 trees, depth 22) --forest-parity measured the flat walk at
+        3.1x sklearn for 1 row, 1.8x for 8 and 0.84x for 64; the crossover sits between 16
+        and 48 rows depending on the machine, so 16 keeps the flat walk only where it wins.
+        """
+        return int(os.environ.get('SOIL_FLAT_FOREST_MAX_ROWS', 16))
+
+    @property
+    def n_estimators(self):
+        return self.forest.n_trees if self.forest is not None else len(self.soil_model.estimators_)
+
+    def stage_timer(self):
+        """Start timing one request; the first one of the process also carries the model load time"""
+        timer = StageTimer('soil_prediction')
+        if self._unreported_load_time is not None:
+            timer.add('model_load', self._unreported_load_time)
+            self._unreported_load_time = None
+        return timer
+
+    def _build_memo(self):
+        """LRU of forest scores per quantized reading (SOIL_MEMO_SIZE entries, 0 disables it)"""
+        max_entries = int(os.environ.get('SOIL_MEMO_SIZE', 4096))
+        if max_entries <= 0:
+            return None
+        
+        from prediction_cache import PredictionCache
+        
+        return PredictionCache('soil', max_entries=max_entries)
+
+    def _build_flat_forest(self):
+        """Array-backed copy of the forest (SOIL_FOREST_EVALUATOR=flat, the default, or sklearn)"""
+        evaluator = os.environ.get('SOIL_FOREST_EVALUATOR', 'flat')
+        if evaluator not in FOREST_EVALUATORS:
+            raise ValueError(f"Unknown forest evaluator '{evaluator}', expected one of {FOREST_EVALUATORS}")
+        if evaluator == 'sklearn':
+            return None, 0
+        
+        from flat_forest import FlatForest
+        
+        forest = FlatForest.from_sklearn(self.soil_model)
+        logging.info(f"Flat forest built: {forest.n_trees} trees, {forest.node_count} nodes, depth {forest.max_depth}")
+        return forest, self.flat_forest_max_rows_setting()
+
+    def memo_key(self, soil_data):
+        """
+        Key on the readings quantized to sensor resolution. The key doubles as the model
+        input, so the memoized score never depends on which reading in a bucket came
+        first; readings finer than READING_RESOLUTION score as their rounded value, the
+        same as with SOIL_MEMO_SIZE=0 only for readings already at sensor resolution.
+
+        Only the forest score and confidence are memoized, and they do not depend on
+        optimal_ranges, so the key leaves the range profile out and one entry serves
+        every profile. The range checks always run on the raw reading with the request's
+        optimal_ranges, since two readings in one bucket can sit on either side of a
+        range boundary.
+        """
+        return tuple(round(float(soil_data[field]), places) for field, places in READING_RESOLUTION.items())
+
     def map_to_model_fields(self, soil_data):
         """Map Supabase field names to model field names"""
-        field_mapping = {
-            'ph_level': 'Soil_pH',
-            'temperature': 'Temperature',
-            'moisture': 'Moisture',
-            'nitrogen': 'N',
-            'phosphorus': 'P',
-            'potassium': 'K'
-        }
-        
         mapped_data = {}
-        for supabase_field, model_field in field_mapping.items():
+        for supabase_field, model_field in FIELD_MAPPING.items():
             if supabase_field in soil_data:
                 mapped_data[model_field] = soil_data[supabase_field]
             else:
                 raise KeyError(f"Missing required field: {supabase_field}")
         
         return mapped_data
+
+    def map_to_model_matrix(self, soil_readings):
+        """
+        Map a batch of readings to the (n_readings x 6) model feature matrix.
+        Accepts a list of reading dicts or a dict of columns keyed by Supabase field name.
+        """
+        if isinstance(soil_readings, dict):
+            columns = soil_readings
+        else:
+            columns = {}
+            for supabase_field in FIELD_MAPPING:
+                try:
+                    columns[supabase_field] = [reading[supabase_field] for reading in soil_readings]
+                except KeyError:
+                    raise KeyError(f"Missing required field: {supabase_field}")
+        
+        for supabase_field in FIELD_MAPPING:
+            if supabase_field not in columns:
+                raise KeyError(f"Missing required field: {supabase_field}")
+        
+        return np.column_stack([np.asarray(columns[field], dtype=float) for field in FIELD_MAPPING])
+
+    def readings_as_rows(self, soil_readings):
+        """Per-reading dicts for the rule checks, whichever layout the batch came in"""
+        if not isinstance(soil_readings, dict):
+            return list(soil_readings)
+        
+        n_readings = len(soil_readings[next(iter(FIELD_MAPPING))])
+        return [{field: soil_readings[field][i] for field in FIELD_MAPPING} for i in range(n_readings)]
     
+    def tree_prediction_matrix(self, X_soil_scaled):
+        """Per-tree predictions for every row as one (n_trees x n_samples) matrix"""
+        if self.forest is not None and len(X_soil_scaled) <= self.flat_forest_max_rows:
+            return self.forest.predict_trees(X_soil_scaled)
+        
+        # Convert once for the whole forest; tree_.predict skips the per-call input validation
+        X = np.ascontiguousarray(X_soil_scaled, dtype=np.float32)
+        n_samples = X.shape[0]
+        return np.array([tree.tree_.predict(X).reshape(n_samples, -1)[:, 0] for tree in self.soil_model.estimators_])
+
     # CALCULATING MODEL CONFIDENCE
-    def calculate_model_confidence(self, X_soil_scaled):
-        """Calculate real confidence score with proper error handling"""
+    def predict_with_confidence(self, X_soil_scaled):
+        """Evaluate the forest once and derive both the prediction and its confidence per row"""
         try:
+            tree_predictions = self.tree_prediction_matrix(X_soil_scaled)
             
-            tree_predictions = []
-            for tree in self.soil_model.estimators_:
-                pred = tree.predict(X_soil_scaled)[0]
-                tree_predictions.append(pred)
-            
-            
-            std_dev = np.std(tree_predictions)
-            mean_pred = np.mean(tree_predictions)
-            
-           
-            if std_dev == 0:
-                return 1.0
-            if mean_pred == 0:
-                cv = std_dev
-            else:
-                cv = std_dev / abs(mean_pred)
-            
+            # The forest prediction is the mean over trees, so it comes from the same matrix
+            mean_pred = tree_predictions.mean(axis=0)
+            std_dev = tree_predictions.std(axis=0)
             
+            # cv falls back to std when the mean is zero; zero spread means full confidence
+            abs_mean = np.abs(mean_pred)
+            cv = np.where(abs_mean == 0, std_dev, std_dev / np.where(abs_mean == 0, 1.0, abs_mean))
             confidence = 1.0 / (1.0 + cv)
+            confidence[std_dev == 0] = 1.0
             
-            logging.info(f"Model confidence calculation: mean={mean_pred:.2f}, std={std_dev:.2f}, cv={cv:.3f}, confidence={confidence:.3f}")
+            if len(mean_pred) == 1:
+                logging.info(f"Model confidence calculation: mean={mean_pred[0]:.2f}, std={std_dev[0]:.2f}, cv={cv[0]:.3f}, confidence={confidence[0]:.3f}")
             
-            return float(confidence)
+            return mean_pred, confidence
             
         except Exception as e:
             logging.error(f"FATAL: Confidence calculation failed: {e}")
             raise ValueError(f"Cannot calculate confidence: {str(e)}")
-    
+
+    def calculate_model_confidence(self, X_soil_scaled):
+        """Calculate real confidence score for a single scaled reading"""
+        _, confidence = self.predict_with_confidence(X_soil_scaled)
+        return float(confidence[0])
 
     def categorize_soil(self, soil_quality):
         """Simple categorization based on pure model score"""
@@ -109,29 +283,48 @@ class SoilAnalyzer:
     def analyze_soil(self, soil_data, optimal_ranges):
         """Perform soil analysis using optimal_ranges from database"""
         start_time = time.time()
+        timer = self.stage_timer()
         try:
-            logging.info("Making soil quality prediction...")
-            
             # Map fields
-            mapped_data = self.map_to_model_fields(soil_data)
-            
-            # Prepare features for model
-            model_feature_names = ["Soil_pH", "Temperature", "Moisture", "N", "P", "K"]
-            X_soil = np.array([[mapped_data[feature] for feature in model_feature_names]])
+            with timer.stage('map_fields'):
+                mapped_data = self.map_to_model_fields(soil_data)
             
-            # Scale and predict
-            X_soil_scaled = self.scaler.transform(X_soil)
-            soil_quality = self.soil_model.predict(X_soil_scaled)[0]
+            # Unchanged sensor readings skip the scaler and the forest
+            memo_key = None
+            scores = None
+            if self.memo is not None:
+                with timer.stage('memo_lookup'):
+                    memo_key = self.memo_key(soil_data)
+                    scores = self.memo.get(memo_key)
             
-            # Calculate confidence
-            confidence_score = self.calculate_model_confidence(X_soil_scaled)
+            if scores is None:
+                logging.info("Making soil quality prediction...")
+                
+                # Prepare features for model; a memoized score is the score of the quantized reading
+                if memo_key is not None:
+                    X_soil = np.array([memo_key])
+                else:
+                    model_feature_names = ["Soil_pH", "Temperature", "Moisture", "N", "P", "K"]
+                    X_soil = np.array([[mapped_data[feature] for feature in model_feature_names]])
+                
+                # Scale, then predict and calculate confidence from one pass over the trees
+                with timer.stage('scale'):
+                    X_soil_scaled = self.scaler.transform(X_soil)
+                with timer.stage('forest_confidence'):
+                    soil_qualities, confidence_scores = self.predict_with_confidence(X_soil_scaled)
+                scores = {'soil_quality_score': float(soil_qualities[0]), 'confidence_score': float(confidence_scores[0])}
+                if memo_key is not None:
+                    self.memo.put(memo_key, scores)
+            soil_quality = scores['soil_quality_score']
+            confidence_score = scores['confidence_score']
             
             # Get soil status based on pure model prediction
             soil_status = self.categorize_soil(soil_quality)
             
             # Generate issues and recommendations
-            issues = self.detect_soil_issues(soil_data, optimal_ranges)
-            recommendations = self.generate_recommendations(soil_data, optimal_ranges)
+            with timer.stage('rules'):
+                issues = self.detect_soil_issues(soil_data, optimal_ranges)
+                recommendations = self.generate_recommendations(soil_data, optimal_ranges)
             
             inference_time = time.time() - start_time
             
@@ -147,6 +340,8 @@ class SoilAnalyzer:
                 'recommendations': recommendations
             }
             
+            result['inference_time'] = inference_time
+            result['timings'] = timer.finish()
             return result
             
         except Exception as e:
@@ -158,6 +353,72 @@ class SoilAnalyzer:
                 'error': f"Soil analysis failed: {str(e)}"
             }
 
+    def analyze_soil_batch(self, soil_readings, optimal_ranges):
+        """Score many readings with one scaler.transform and one forest predict; returns one result per reading"""
+        start_time = time.time()
+        timer = self.stage_timer()
+        try:
+            with timer.stage('map_fields'):
+                X_soil = self.map_to_model_matrix(soil_readings)
+                rows = self.readings_as_rows(soil_readings)
+            
+            # Memoized readings reuse their forest scores; only the rest go through the model
+            scores = [None] * len(rows)
+            memo_keys = [None] * len(rows)
+            if self.memo is not None:
+                with timer.stage('memo_lookup'):
+                    for i, soil_data in enumerate(rows):
+                        memo_keys[i] = self.memo_key(soil_data)
+                        scores[i] = self.memo.get(memo_keys[i])
+            pending = [i for i, score in enumerate(scores) if score is None]
+            
+            # Scale and evaluate the remaining readings with one pass over the trees,
+            # quantized like the memo keys so they score the same as a single analysis
+            if pending:
+                with timer.stage('scale'):
+                    X_pending = np.array([memo_keys[i] for i in pending]) if self.memo is not None else X_soil[pending]
+                    X_soil_scaled = self.scaler.transform(X_pending)
+                with timer.stage('forest_confidence'):
+                    soil_qualities, confidence_scores = self.predict_with_confidence(X_soil_scaled)
+                for i, soil_quality, confidence_score in zip(pending, soil_qualities, confidence_scores):
+                    scores[i] = {'soil_quality_score': float(soil_quality), 'confidence_score': float(confidence_score)}
+                    if memo_keys[i] is not None:
+                        self.memo.put(memo_keys[i], scores[i])
+            
+        except Exception as e:
+            logging.error(f"Batch soil analysis error: {e}")
+            return None
+        
+        # The range checks run on every raw reading, memoized or not
+        results = [None] * len(rows)
+        with timer.stage('rules'):
+            for i, (soil_data, score) in enumerate(zip(rows, scores)):
+                try:
+                    results[i] = {
+                        'success': True,
+                        'soil_status': self.categorize_soil(score['soil_quality_score']),
+                        'soil_quality_score': score['soil_quality_score'],
+                        'confidence_score': score['confidence_score'],
+                        'soil_issues': self.detect_soil_issues(soil_data, optimal_ranges),
+                        'recommendations': self.generate_recommendations(soil_data, optimal_ranges)
+                    }
+                except Exception as e:
+                    results[i] = {
+                        'success': False,
+                        'error': f"Soil analysis failed: {str(e)}"
+                    }
+        
+        # Every reading reports the batch cost amortized over the batch
+        per_reading_time = (time.time() - start_time) / max(len(results), 1)
+        timings = timer.finish(count=max(len(results), 1))
+        for result in results:
+            if result['success']:
+                result['inference_time'] = per_reading_time
+                result['timings'] = dict(timings)
+        
+        logging.info(f"Batch soil analysis of {len(results)} readings ({len(results) - len(pending)} memoized) complete in {time.time() - start_time:.3f}s")
+        return results
+
     def detect_soil_issues(self, soil_data, optimal_ranges):
         """Detect soil issues using optimal_ranges from database"""
         issues = []
@@ -316,6 +577,134 @@ class SoilAnalyzer:
         
         return moisture_warnings + other_recommendations
 
+def process_batch_request(analyzer, input_data):
+    """Score a 'soil_readings' batch (list of readings or dict of columns)"""
+    soil_readings = input_data.get('soil_readings')
+    optimal_ranges = input_data.get('optimal_ranges', {})
+    user_id = input_data.get('user_id', 'unknown')
+    
+    if not optimal_ranges:
+        return {
+            'success': False,
+            'error': 'No optimal ranges provided from database'
+        }
+    
+    if not soil_readings:
+        return {
+            'success': False,
+            'error': 'No soil readings provided'
+        }
+    
+    logging.info(f"Analyzing soil batch for user: {user_id}")
+    results = analyzer.analyze_soil_batch(soil_readings, optimal_ranges)
+    
+    if results is None:
+        return {
+            'success': False,
+            'error': 'Batch soil analysis failed'
+        }
+    
+    return {
+        'success': True,
+        'results': results,
+        'total_readings': len(results),
+        'user_id': user_id
+    }
+
+def process_request(analyzer, input_data):
+    """Validate one request dict and score it with an already loaded analyzer"""
+    if 'soil_readings' in input_data:
+        return process_batch_request(analyzer, input_data)
+    
+    soil_data = input_data.get('soil_data', {})
+    optimal_ranges = input_data.get('optimal_ranges', {})
+    user_id = input_data.get('user_id', 'unknown')
+    soil_id = input_data.get('soil_id', 'unknown')
+    
+    logging.info(f"Analyzing soil for user: {user_id}")
+    
+    if not soil_data:
+        return {
+            'success': False,
+            'error': 'No soil data provided'
+        }
+    
+    if not optimal_ranges:
+        return {
+            'success': False,
+            'error': 'No optimal ranges provided from database'
+        }
+    
+    result = analyzer.analyze_soil(soil_data, optimal_ranges)
+    result['user_id'] = user_id
+    result['soil_id'] = soil_id
+    
+    logging.info(f"Soil prediction completed for user: {user_id}")
+    return result
+
+def run_stream(source='-'):
+    """
+    Read NDJSON probe readings ({soil_id, soil_data, optimal_ranges?, timestamp?} per line) from
+    stdin ('-') or a file and write a result line only when a probe's analysis changes
+    """
+    from soil_stream import SoilStream
+    from worker_protocol import write_message
+    
+    analyzer = SoilAnalyzer()
+    soil_stream = SoilStream.from_env(analyzer, READING_RESOLUTION)
+    stream = sys.stdin if source == '-' else open(source, 'r', encoding='utf-8')
+    start_time = time.time()
+    try:
+        for line_number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("record must be a JSON object")
+            except ValueError as e:
+                write_message(sys.stdout, {'success': False, 'error': f'Invalid stream line: {str(e)}', 'stream_line': line_number})
+                continue
+            
+            # update() answers a malformed soil_id or soil_data with an error line instead of raising
+            response = soil_stream.update(record.get('soil_id', 'unknown'), record.get('soil_data', {}),
+                                          record.get('optimal_ranges'), record.get('timestamp'))
+            if response is not None:
+                response['stream_line'] = line_number
+                write_message(sys.stdout, response)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    
+    stats = soil_stream.stats()
+    logging.info(f"Streamed {stats['readings']} readings from {stats['probes']} probes in {time.time() - start_time:.2f}s: "
+                 f"{stats['recomputes']} analyses, {stats['emitted']} changes emitted")
+
+def memo_stats(analyzer):
+    return {'memo': analyzer.memo.stats()} if analyzer.memo is not None else {}
+
+def serve(socket_path=None):
+    """Resident soil worker: keep one SoilAnalyzer loaded and answer JSON-lines requests"""
+    from worker_protocol import serve_lines, serve_unix_socket
+    
+    analyzer = SoilAnalyzer()
+    worker_info = {
+        'worker': 'soil_prediction',
+        'model_loaded': True,
+        'n_estimators': analyzer.n_estimators,
+        'forest_evaluator': 'flat' if analyzer.forest is not None else 'sklearn',
+        'model_format': analyzer.model_format,
+        'model_load_ms': analyzer.load_seconds * 1000,
+        'import_report': import_report()
+    }
+    handle_request = lambda request: process_request(analyzer, request)
+    
+    if socket_path:
+        serve_unix_socket(socket_path, handle_request, worker_info)
+    else:
+        serve_lines(handle_request, worker_info, stats=lambda: memo_stats(analyzer))
+
 def main():
     """Main function for soil prediction"""
     try:
@@ -327,36 +716,56 @@ def main():
             print(json.dumps(result))
             return
         
-        input_data = json.loads(sys.argv[1])
-        soil_data = input_data.get('soil_data', {})
-        optimal_ranges = input_data.get('optimal_ranges', {})
-        user_id = input_data.get('user_id', 'unknown')
-        soil_id = input_data.get('soil_id', 'unknown')
+        if sys.argv[1] == '--import-report':
+            # Time the imports loading the model takes under the configured SOIL_MODEL_FORMAT. Resolving
+            # auto memory-maps the artifact (imports joblib only); the pickle path also needs sklearn
+            timed_import('joblib')
+            if load_model_artifact(resolve_model_dir(), os.environ.get('SOIL_MODEL_FORMAT', 'auto')) is None:
+                timed_import('sklearn.ensemble')
+            print(json.dumps({'success': True, 'script': 'soil_prediction', **import_report()}))
+            return
         
-        logging.info(f"Analyzing soil for user: {user_id}")
+        if sys.argv[1] == '--forest-parity':
+            # Flat evaluator against sklearn on N standard-normal rows (the scaler's output space)
+            from flat_forest import compare_with_sklearn
+            
+            analyzer = SoilAnalyzer()
+            rows = int(sys.argv[2]) if len(sys.argv) > 2 else 512
+            X = np.random.default_rng(0).standard_normal((rows, len(FIELD_MAPPING)))
+            print(json.dumps({'success': True, **compare_with_sklearn(analyzer.soil_model, X, flat=analyzer.forest)}))
+            return
         
-        if not soil_data:
-            result = {
-                'success': False,
-                'error': 'No soil data provided'
-            }
-            print(json.dumps(result))
+        if sys.argv[1] == '--export-artifact':
+            # Optional: --export-artifact /path/to/soil_model.mmap.joblib (default: into the models directory)
+            from soil_artifact import ARTIFACT_FILE, export_soil_artifact
+            
+            analyzer = SoilAnalyzer(model_format='pickle')
+            output_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(analyzer.model_dir, ARTIFACT_FILE)
+            forest = export_soil_artifact(output_path, analyzer.soil_model, analyzer.scaler, analyzer.model_paths)
+            print(json.dumps({'success': True, 'path': output_path, 'n_trees': forest.n_trees, 'node_count': forest.node_count}))
             return
         
-        if not optimal_ranges:
-            result = {
-                'success': False,
-                'error': 'No optimal ranges provided from database'
-            }
-            print(json.dumps(result))
+        if sys.argv[1] == '--stream':
+            # --stream [readings.ndjson | -] (SOIL_STREAM_WINDOW, SOIL_STREAM_DELTAS)
+            run_stream(sys.argv[2] if len(sys.argv) > 2 else '-')
             return
         
-        analyzer = SoilAnalyzer()
-        result = analyzer.analyze_soil(soil_data, optimal_ranges)
-        result['user_id'] = user_id
-        result['soil_id'] = soil_id
+        if sys.argv[1] == '--serve':
+            # Optional: --serve --socket /path/to/soil.sock
+            socket_path = sys.argv[3] if len(sys.argv) > 3 and sys.argv[2] == '--socket' else None
+            serve(socket_path)
+            return
+        
+        input_data = json.loads(sys.argv[1])
         
-        logging.info(f"Soil prediction completed for user: {user_id}")
+        has_readings = input_data.get('soil_data') or input_data.get('soil_readings')
+        if not has_readings or not input_data.get('optimal_ranges'):
+            # Reject bad input before paying for model loading
+            print(json.dumps(process_request(None, input_data)))
+            return
+        
+        analyzer = SoilAnalyzer()
+        result = process_request(analyzer, input_data)
         print(json.dumps(result, default=str))
         
     except Exception as e:
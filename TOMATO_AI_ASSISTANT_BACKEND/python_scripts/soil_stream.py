@@ -0,0 +1,163 @@
+import os
+import json
+import math
+import logging
+from collections import deque
+
+import numpy as np
+
+# Smallest move of a smoothed reading (in its own unit) that is worth re-running the model for
+DEFAULT_DELTAS = {
+    'ph_level': 0.05,
+    'temperature': 0.5,
+    'moisture': 1.0,
+    'nitrogen': 2.0,
+    'phosphorus': 2.0,
+    'potassium': 2.0
+}
+
+
+class ProbeState:
+    """Rolling window and last analysis of one soil_id"""
+
+    def __init__(self, window):
+        self.readings = deque(maxlen=window)
+        self.times = deque(maxlen=window)
+        self.optimal_ranges = None
+        self.analyzed = None
+        self.emitted = None
+        self.readings_seen = 0
+        self.recomputes = 0
+
+
+class SoilStream:
+    """
+    Incremental soil analysis for continuous probe feeds.
+
+    Each soil_id keeps its last `window` readings. The smoothed reading (window mean,
+    rounded to sensor resolution) is only sent through the scaler, forest and rule
+    checks when some field has moved by more than its delta since the last analysis,
+    or the optimal ranges changed; a result is only emitted when soil_status, issues
+    or recommendations differ from the last one emitted for that soil_id.
+    """
+
+    def __init__(self, analyzer, resolution, window=5, deltas=None):
+        if window < 1:
+            raise ValueError("window must be at least 1")
+
+        self.analyzer = analyzer
+        self.resolution = resolution
+        self.fields = tuple(resolution)
+        self.window = window
+        self.deltas = {**DEFAULT_DELTAS, **(deltas or {})}
+        self._probes = {}
+
+        self.readings = 0
+        self.recomputes = 0
+        self.emitted = 0
+
+    @classmethod
+    def from_env(cls, analyzer, resolution):
+        """SOIL_STREAM_WINDOW (readings, default 5) and SOIL_STREAM_DELTAS (JSON object of per-field deltas)"""
+        deltas = json.loads(os.environ['SOIL_STREAM_DELTAS']) if os.environ.get('SOIL_STREAM_DELTAS') else None
+        return cls(analyzer, resolution, window=int(os.environ.get('SOIL_STREAM_WINDOW', 5)), deltas=deltas)
+
+    def smoothed(self, state):
+        """Window mean per field, rounded like the sensor so issue texts do not churn on noise"""
+        means = np.mean(np.array(state.readings), axis=0)
+        return {field: round(float(mean), self.resolution[field]) for field, mean in zip(self.fields, means)}
+
+    def trend(self, state):
+        """Least-squares slope per field across the window: per second with timestamps, else per reading"""
+        if len(state.readings) < 2:
+            return {field: 0.0 for field in self.fields}
+
+        x = np.array(state.times, dtype=float) if None not in state.times else np.arange(len(state.readings), dtype=float)
+        x = x - x.mean()
+        spread = float((x * x).sum())
+        if spread == 0:
+            return {field: 0.0 for field in self.fields}
+        slopes = (x[:, np.newaxis] * np.array(state.readings)).sum(axis=0) / spread
+        return {field: float(slope) for field, slope in zip(self.fields, slopes)}
+
+    def moved(self, state, smoothed):
+        if state.analyzed is None:
+            return True
+        return any(abs(smoothed[field] - state.analyzed[field]) > self.deltas[field] for field in self.fields)
+
+    def update(self, soil_id, soil_data, optimal_ranges=None, timestamp=None):
+        """
+        Add one reading; returns the response to emit, or None when nothing changed.
+        optimal_ranges may be omitted after the first reading of a soil_id.
+        """
+        if isinstance(soil_id, bool) or not isinstance(soil_id, (str, int)):
+            return {'success': False, 'error': f"Invalid soil_id: expected a string or integer, got {type(soil_id).__name__}", 'soil_id': None}
+        if not isinstance(soil_data, dict):
+            return {'success': False, 'error': f"Invalid soil_data: expected an object, got {type(soil_data).__name__}", 'soil_id': soil_id}
+        missing = [field for field in self.fields if field not in soil_data]
+        if missing:
+            return {'success': False, 'error': f"Missing required field: {missing[0]}", 'soil_id': soil_id}
+        try:
+            reading = [float(soil_data[field]) for field in self.fields]
+            timestamp = float(timestamp) if timestamp is not None else None
+        except (TypeError, ValueError) as e:
+            return {'success': False, 'error': f"Invalid reading: {str(e)}", 'soil_id': soil_id}
+        # One NaN would poison the window mean, and every later delta check, for `window` readings
+        not_finite = [field for field, value in zip(self.fields, reading) if not math.isfinite(value)]
+        if not_finite or (timestamp is not None and not math.isfinite(timestamp)):
+            field = not_finite[0] if not_finite else 'timestamp'
+            return {'success': False, 'error': f"Invalid reading: {field} is not a finite number", 'soil_id': soil_id}
+
+        state = self._probes.get(soil_id)
+        if state is None:
+            state = self._probes[soil_id] = ProbeState(self.window)
+
+        ranges_changed = bool(optimal_ranges) and optimal_ranges != state.optimal_ranges
+        if ranges_changed:
+            state.optimal_ranges = optimal_ranges
+        if not state.optimal_ranges:
+            return {'success': False, 'error': 'No optimal ranges provided from database', 'soil_id': soil_id}
+
+        state.readings.append(reading)
+        state.times.append(timestamp)
+        state.readings_seen += 1
+        self.readings += 1
+
+        smoothed = self.smoothed(state)
+        if not ranges_changed and not self.moved(state, smoothed):
+            return None
+
+        result = self.analyzer.analyze_soil(smoothed, state.optimal_ranges)
+        state.recomputes += 1
+        self.recomputes += 1
+        if not result.get('success'):
+            # Leave the last good analysis in place so the next reading retries
+            return {**result, 'soil_id': soil_id}
+        state.analyzed = smoothed
+
+        signature = (result['soil_status'], tuple(result['soil_issues']), tuple(result['recommendations']))
+        if signature == state.emitted:
+            return None
+        state.emitted = signature
+        self.emitted += 1
+
+        logging.info(f"Soil {soil_id}: {result['soil_status']} after {state.readings_seen} readings ({state.recomputes} analyses)")
+        return {
+            **result,
+            'soil_id': soil_id,
+            'smoothed_readings': smoothed,
+            'trend': self.trend(state),
+            'readings_seen': state.readings_seen,
+            'analyses': state.recomputes
+        }
+
+    def stats(self):
+        return {
+            'probes': len(self._probes),
+            'window': self.window,
+            'deltas': self.deltas,
+            'readings': self.readings,
+            'recomputes': self.recomputes,
+            'emitted': self.emitted,
+            'skipped_ratio': 1.0 - self.recomputes / self.readings if self.readings else 0.0
+        }
@@ -0,0 +1,108 @@
+import os
+import time
+import atexit
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds (Prometheus 'le' labels)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# METRICS_FILE is rewritten at most this often (and once more at exit)
+METRICS_FILE_INTERVAL = float(os.environ.get('METRICS_FILE_INTERVAL', 5))
+
+
+class StageMetrics:
+    """Process-wide per-stage latency histograms, rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._predictions = {}
+        self._last_file_write = 0.0
+        self._metrics_file = os.environ.get('METRICS_FILE')
+        if self._metrics_file:
+            atexit.register(self.write_file, self._metrics_file)
+
+    def observe(self, script, stages, count=1):
+        """Record one request's stage durations (seconds), or a batch's amortized durations count times"""
+        with self._lock:
+            for stage, seconds in stages.items():
+                histogram = self._histograms.get((script, stage))
+                if histogram is None:
+                    histogram = self._histograms[(script, stage)] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+                bucket = bisect.bisect_left(BUCKETS, seconds)
+                if bucket < len(BUCKETS):
+                    histogram['buckets'][bucket] += count
+                histogram['sum'] += seconds * count
+                histogram['count'] += count
+            self._predictions[script] = self._predictions.get(script, 0) + count
+
+            write_due = self._metrics_file and time.time() - self._last_file_write >= METRICS_FILE_INTERVAL
+            if write_due:
+                self._last_file_write = time.time()
+        if write_due:
+            self.write_file(self._metrics_file)
+
+    def prometheus_text(self):
+        lines = [
+            '# HELP ml_stage_duration_seconds Time spent in each prediction stage.',
+            '# TYPE ml_stage_duration_seconds histogram'
+        ]
+        with self._lock:
+            for (script, stage), histogram in sorted(self._histograms.items()):
+                labels = f'script="{script}",stage="{stage}"'
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKETS, histogram['buckets']):
+                    cumulative += bucket_count
+                    lines.append(f'ml_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'ml_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram["count"]}')
+                lines.append(f'ml_stage_duration_seconds_sum{{{labels}}} {histogram["sum"]}')
+                lines.append(f'ml_stage_duration_seconds_count{{{labels}}} {histogram["count"]}')
+
+            lines.append('# HELP ml_predictions_total Predictions served by this process.')
+            lines.append('# TYPE ml_predictions_total counter')
+            for script, count in sorted(self._predictions.items()):
+                lines.append(f'ml_predictions_total{{script="{script}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_file(self, path):
+        """Atomically replace path with the current metrics (node_exporter textfile collector format)"""
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(self.prometheus_text())
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not write metrics file {path}: {e}")
+
+
+METRICS = StageMetrics()
+
+
+class StageTimer:
+    """Per-request stage durations; finish() returns them as *_ms fields and feeds METRICS"""
+
+    def __init__(self, script):
+        self.script = script
+        self.stages = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def finish(self, count=1):
+        """Close the timer; with count > 1 every stage is amortized over that many items"""
+        self.stages['total'] = time.perf_counter() - self._start
+        per_item = {stage: seconds / count for stage, seconds in self.stages.items()}
+        METRICS.observe(self.script, per_item, count)
+        return {f'{stage}_ms': round(seconds * 1000, 3) for stage, seconds in per_item.items()}
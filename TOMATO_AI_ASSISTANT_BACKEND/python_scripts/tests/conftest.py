@@ -0,0 +1,52 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The scripts import their sibling modules by bare name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+OPTIMAL_RANGES = {
+    'ph_level': {'optimal': [6.0, 7.0], 'unit': 'pH'},
+    'temperature': {'optimal': [20, 30], 'unit': '°C'},
+    'moisture': {'optimal': [60, 80], 'unit': '%'},
+    'nitrogen': {'optimal': [40, 60], 'unit': 'mg/kg'},
+    'phosphorus': {'optimal': [30, 50], 'unit': 'mg/kg'},
+    'potassium': {'optimal': [40, 60], 'unit': 'mg/kg'},
+    'moisture_threshold': {'optimal': [20, 100], 'unit': '%'}
+}
+
+
+def random_readings(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{
+        'ph_level': round(float(rng.uniform(5, 8)), 2),
+        'temperature': round(float(rng.uniform(10, 35)), 1),
+        'moisture': round(float(rng.uniform(10, 90)), 1),
+        'nitrogen': int(rng.uniform(20, 90)),
+        'phosphorus': int(rng.uniform(20, 70)),
+        'potassium': int(rng.uniform(20, 70))
+    } for _ in range(count)]
+
+
+@pytest.fixture(scope='session')
+def soil_model_dir(tmp_path_factory):
+    """A small forest and scaler fitted on synthetic readings, saved under the production file names"""
+    joblib = pytest.importorskip('joblib')
+    pytest.importorskip('sklearn')
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.preprocessing import StandardScaler
+
+    from soil_prediction import FIELD_MAPPING, SCALER_FILE, SOIL_MODEL_FILE
+
+    readings = random_readings(400)
+    X = np.array([[reading[field] for field in FIELD_MAPPING] for reading in readings], dtype=float)
+    y = 100 - np.abs(X[:, 0] - 6.5) * 20 - np.abs(X[:, 2] - 70) * 0.5 - np.abs(X[:, 3] - 50) * 0.3
+    scaler = StandardScaler().fit(X)
+    forest = RandomForestRegressor(n_estimators=12, max_depth=8, random_state=0).fit(scaler.transform(X), y)
+
+    model_dir = tmp_path_factory.mktemp('models')
+    joblib.dump(forest, model_dir / SOIL_MODEL_FILE)
+    joblib.dump(scaler, model_dir / SCALER_FILE)
+    return str(model_dir)
@@ -0,0 +1,60 @@
+import copy
+
+from benchmark import METRIC_DIRECTIONS, compare_results
+
+RUN = {
+    'tomato': {
+        'model_load_ms': 100.0,
+        'stages': {'forward': {'mean_ms': 10.0, 'p99_ms': 20.0}},
+        'prefetch': {'overlap_ratio': 0.8, 'prefetch_depth': 2, 'pipelined_images_per_second': 50.0},
+        'cold_start': {'import_report': {'total_import_ms': 900.0}}
+    },
+    'soil': {
+        'flat_forest': {'node_count': 1000, 'timings': {'1': {'flat_ms': 0.2, 'speedup': 2.0}}},
+        'startup_by_format': {'one_shot_speedup': 3.0}
+    }
+}
+
+
+def test_directions_are_explicit_per_metric():
+    current = copy.deepcopy(RUN)
+    current['tomato']['prefetch']['overlap_ratio'] = 0.4
+    current['soil']['flat_forest']['timings']['1']['speedup'] = 1.0
+    current['soil']['startup_by_format']['one_shot_speedup'] = 6.0
+    current['tomato']['stages']['forward']['p99_ms'] = 30.0
+    current['tomato']['model_load_ms'] = 50.0
+
+    report = compare_results(current, RUN)
+    assert report['regressions'] == [
+        'soil.flat_forest.timings.1.speedup',
+        'tomato.prefetch.overlap_ratio',
+        'tomato.stages.forward.p99_ms'
+    ]
+    assert report['unclassified'] == []
+
+
+def test_descriptive_figures_and_import_reports_are_not_compared():
+    current = copy.deepcopy(RUN)
+    current['soil']['flat_forest']['node_count'] = 5000
+    current['tomato']['prefetch']['prefetch_depth'] = 8
+    current['tomato']['cold_start']['import_report']['total_import_ms'] = 5000.0
+
+    report = compare_results(current, RUN)
+    assert report['regressions'] == []
+    assert 'soil.flat_forest.node_count' not in report['metrics']
+    assert not any('import_report' in name for name in report['metrics'])
+
+
+def test_unknown_metrics_are_reported_not_guessed():
+    current = copy.deepcopy(RUN)
+    baseline = copy.deepcopy(RUN)
+    current['tomato']['stages']['forward']['p75_ms'] = 99.0
+    baseline['tomato']['stages']['forward']['p75_ms'] = 1.0
+
+    report = compare_results(current, baseline)
+    assert report['unclassified'] == ['p75_ms']
+    assert report['regressions'] == []
+
+
+def test_every_direction_is_valid():
+    assert set(METRIC_DIRECTIONS.values()) <= {'lower', 'higher', None}
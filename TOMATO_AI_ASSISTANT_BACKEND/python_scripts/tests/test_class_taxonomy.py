@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from class_taxonomy import ClassTaxonomy, taxonomy_path_for
+from tomato_prediction import TomatoClassifier
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models', 'final_fast_tomato_model.h5')
+SIDECAR_PATH = taxonomy_path_for(MODEL_PATH)
+
+
+@pytest.fixture(scope='module')
+def sidecar():
+    return ClassTaxonomy.load(SIDECAR_PATH)
+
+
+@pytest.fixture(scope='module')
+def rules(sidecar):
+    """The classifier's rule methods only need the class count, so skip loading the model"""
+    classifier = TomatoClassifier.__new__(TomatoClassifier)
+    classifier.num_classes = len(sidecar)
+    return classifier
+
+
+def test_sidecar_matches_the_rule_methods(sidecar, rules):
+    compiled = ClassTaxonomy.compile(rules._auto_detect_class_names(), rules)
+    # Rerun `tomato_prediction.py --export-taxonomy` after changing any rule method
+    assert compiled.version == sidecar.version
+    assert compiled.entries == sidecar.entries
+
+
+def test_compiled_lookups_match_the_rule_methods(sidecar, rules):
+    for class_idx, class_name in enumerate(sidecar.class_names):
+        plant_type = rules.get_plant_type(class_name)
+        for confidence in (0.3, 0.69, 0.71, 0.95):
+            assert sidecar.health_status(class_idx, confidence) == rules.get_health_status(class_name, confidence, plant_type)
+            expected_score = None
+            if rules.is_tomato(plant_type):
+                expected_score = rules.calculate_plant_health_score(class_name, confidence, plant_type)
+            assert sidecar.plant_health_score(class_idx, confidence) == pytest.approx(expected_score)
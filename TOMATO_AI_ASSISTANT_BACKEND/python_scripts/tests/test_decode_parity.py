@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('cv2')
+Image = pytest.importorskip('PIL.Image')
+
+from tomato_prediction import decode_image_opencv, decode_image_pil, decode_parity
+
+# (height, width): at or below the target size, one reduction step, the largest
+# reduction, portrait, panoramic and a shape too narrow to be reduced at all
+SIZES = [(224, 224), (300, 400), (480, 640), (960, 1280), (1280, 960), (600, 1500), (1800, 3200), (230, 1000)]
+
+# Per-pixel bounds on [0, 1] values: the reduced decode averages where PIL picks one pixel
+MAX_ABS_DIFF = 0.15
+MEAN_ABS_DIFF = 0.02
+
+
+def synthetic_jpeg(path, height, width, seed=0):
+    """Smooth colour gradients plus sensor-like noise, which compress like photos"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    base = np.stack([xx / width, yy / height, (xx + yy) / (width + height)], axis=-1) * 255
+    pixels = np.clip(base * rng.uniform(0.5, 1.0, 3) + rng.normal(0, 6, base.shape), 0, 255)
+    Image.fromarray(pixels.astype(np.uint8)).save(path, quality=90)
+    return str(path)
+
+
+@pytest.mark.parametrize('height,width', SIZES)
+def test_opencv_decode_matches_pil(tmp_path, height, width):
+    path = synthetic_jpeg(tmp_path / f'{height}x{width}.jpg', height, width)
+
+    reference = decode_image_pil(path).astype(np.float32) / 255.0
+    candidate = decode_image_opencv(path).astype(np.float32) / 255.0
+    assert candidate.shape == reference.shape == (224, 224, 3)
+
+    difference = np.abs(reference - candidate)
+    assert difference.max() <= MAX_ABS_DIFF
+    assert difference.mean() <= MEAN_ABS_DIFF
+
+
+@pytest.mark.parametrize('height,width', [(224, 224), (300, 400), (230, 1000)])
+def test_full_size_decode_is_exact(tmp_path, height, width):
+    # Without a reduced decode both paths resize with nearest neighbour and must agree exactly
+    path = synthetic_jpeg(tmp_path / 'full.jpg', height, width)
+    np.testing.assert_array_equal(decode_image_opencv(path), decode_image_pil(path))
+
+
+def test_bytes_and_path_decode_alike(tmp_path):
+    path = synthetic_jpeg(tmp_path / 'bytes.jpg', 960, 1280)
+    with open(path, 'rb') as f:
+        data = f.read()
+    np.testing.assert_array_equal(decode_image_opencv(data), decode_image_opencv(path))
+    np.testing.assert_array_equal(decode_image_pil(data), decode_image_pil(path))
+
+
+def test_decode_parity_report(tmp_path):
+    paths = [synthetic_jpeg(tmp_path / f'{i}.jpg', *size, seed=i) for i, size in enumerate(SIZES)]
+    report = decode_parity(paths, tolerance=MEAN_ABS_DIFF)
+    assert report['all_within_tolerance']
+    assert all(image['max_abs_diff'] <= MAX_ABS_DIFF for image in report['images'])
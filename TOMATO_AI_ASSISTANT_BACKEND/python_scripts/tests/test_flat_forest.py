@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('sklearn')
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+
+from flat_forest import FlatForest, compare_with_sklearn, sklearn_tree_matrix
+
+N_FEATURES = 6
+
+
+def soil_like_features(n_samples, seed=0):
+    """
+    Six features on a 0.5 grid, so every threshold is a midpoint on a 0.25 grid: exact in
+    float32, which lets test rows sit exactly on a split instead of just either side of it
+    """
+    rng = np.random.default_rng(seed)
+    return np.round(rng.normal(0, 2, size=(n_samples, N_FEATURES)) * 2) / 2
+
+
+def soil_like_target(X):
+    return 100 - np.abs(X[:, 0]) * 8 - np.abs(X[:, 2] - 1) * 5 - X[:, 3] ** 2 + X[:, 4] * X[:, 5]
+
+
+@pytest.fixture(scope='module')
+def production_shaped():
+    """A forest the size of the shipped soil model: 100 trees, grown to depth 20 and more"""
+    X = soil_like_features(3000)
+    forest = RandomForestRegressor(n_estimators=100, random_state=0, n_jobs=1).fit(X, soil_like_target(X))
+    return forest, FlatForest.from_sklearn(forest), soil_like_features(200, seed=1)
+
+
+@pytest.fixture(scope='module')
+def trained_with_missing():
+    """A forest fitted on data with NaNs, so its splits send missing values both ways"""
+    X = soil_like_features(2000, seed=2)
+    y = soil_like_target(X)
+    X[np.random.default_rng(3).random(X.shape) < 0.15] = np.nan
+    forest = RandomForestRegressor(n_estimators=30, random_state=0, n_jobs=1).fit(X, y)
+    return forest, FlatForest.from_sklearn(forest)
+
+
+def rows_on_thresholds(forest, X, splits_per_tree=20):
+    """Rows of X with one feature moved exactly onto a split threshold of the forest"""
+    rows = []
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        for node in np.flatnonzero(tree.children_left != -1)[:splits_per_tree]:
+            row = X[node % len(X)].copy()
+            row[tree.feature[node]] = tree.threshold[node]
+            rows.append(row)
+    return np.array(rows)
+
+
+def test_forest_is_production_shaped(production_shaped):
+    _, flat, _ = production_shaped
+    assert flat.n_trees == 100
+    assert flat.max_depth >= 20
+
+
+def test_per_tree_predictions_match_sklearn(production_shaped):
+    forest, flat, X = production_shaped
+    report = compare_with_sklearn(forest, X, flat=flat, row_counts=(1, 16), min_seconds=0)
+    assert report['identical']
+    assert report['max_abs_tree_diff'] == 0.0
+    assert report['max_abs_mean_diff'] < 1e-9
+
+
+def test_rows_exactly_on_thresholds_match_sklearn(production_shaped):
+    forest, flat, X = production_shaped
+    ties = rows_on_thresholds(forest, X)
+    # Really on the splits: the float32 cast both sides make leaves the values unchanged
+    assert np.array_equal(ties.astype(np.float32), ties)
+    assert np.array_equal(flat.predict_trees(ties), sklearn_tree_matrix(forest, ties))
+
+
+def test_nan_follows_missing_value_routing(trained_with_missing):
+    forest, flat = trained_with_missing
+    assert flat.missing_left.any() and not flat.missing_left[flat.threshold != np.inf].all()
+
+    X = soil_like_features(300, seed=4)
+    X[np.random.default_rng(5).random(X.shape) < 0.3] = np.nan
+    assert np.array_equal(flat.predict_trees(X), sklearn_tree_matrix(forest, X))
+    assert np.allclose(flat.predict(X), forest.predict(X))
+
+
+def test_nan_in_a_forest_fitted_without_missing_values(production_shaped):
+    forest, flat, X = production_shaped
+    rows = X[:50].copy()
+    rows[::3, 0] = np.nan
+    rows[1::3, 4] = np.nan
+    assert np.array_equal(flat.predict_trees(rows), sklearn_tree_matrix(forest, rows))
+
+
+def test_arrays_round_trip(production_shaped):
+    _, flat, X = production_shaped
+    restored = FlatForest.from_arrays(flat.arrays())
+    assert np.array_equal(restored.predict_trees(X), flat.predict_trees(X))
+
+
+def test_classifiers_are_rejected():
+    X = soil_like_features(50)
+    with pytest.raises(ValueError):
+        FlatForest.from_sklearn(RandomForestClassifier(n_estimators=2, random_state=0).fit(X, X[:, 0] > 0))
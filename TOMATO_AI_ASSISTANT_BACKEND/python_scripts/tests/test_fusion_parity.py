@@ -0,0 +1,136 @@
+import datetime
+import json
+import os
+import random
+import shutil
+import subprocess
+
+import pytest
+
+from fusion_prediction import fuse_single_pair, perform_late_fusion
+
+LATE_FUSION_SERVICE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', 'services', 'lateFusionService.js')
+
+# Runs both fusion entry points of lateFusionService.js over the cases, with Supabase stubbed out and logging silenced
+NODE_HARNESS = r"""
+const Module = require('module');
+const load = Module._load;
+Module._load = function (request, ...rest) {
+  if (request.endsWith('supabaseService')) {
+    const single = async () => ({ data: { prediction_id: 1 } });
+    return { client: { from: () => ({ insert: () => ({ select: () => ({ single }) }) }) } };
+  }
+  return load.call(this, request, ...rest);
+};
+console.log = () => {}; console.error = () => {}; console.warn = () => {};
+
+const LateFusionService = require(process.argv[2]);
+const cases = JSON.parse(require('fs').readFileSync(process.argv[3], 'utf8'));
+(async () => {
+  const service = new LateFusionService();
+  const outputs = [];
+  for (const c of cases) {
+    let average;
+    try {
+      average = await service.performLateFusion(c.image, c.soil, 'user', 'image', c.soil_id);
+      delete average.prediction_id;
+    } catch (error) {
+      average = { error: error.message };
+    }
+    const weighted = await service.fuseSinglePair(c.image, c.soil, 'user', 'image', c.soil_id);
+    outputs.push({ average, weighted });
+  }
+  process.stdout.write(JSON.stringify(outputs));
+})();
+"""
+
+RECOMMENDATIONS = ['Apply fungicide weekly', 'apply fungicide weekly ', 'Remove infected leaves immediately',
+                   'Maintain watering schedule', 'Continue monitoring', 'Rotate crops', 'Urgent: isolate plant',
+                   '', None, 'Add nitrogen fertilizer', 'Prevent splashing']
+
+
+def fusion_cases(count=200, seed=3):
+    """Analyses with the values the JS defaults trip over: nulls, zeros, missing scores, blank recommendations"""
+    rng = random.Random(seed)
+
+    def recommendations():
+        return rng.sample(RECOMMENDATIONS, rng.randint(0, 5))
+
+    cases = []
+    for _ in range(count):
+        image = {
+            'success': rng.random() > 0.05,
+            'tomato_type': rng.choice(['Tomato Leaf', None]),
+            'health_status': rng.choice(['Healthy', 'Diseased']),
+            'disease_type': rng.choice(['Early Blight', None]),
+            'confidence_score': rng.choice([0, None, round(rng.random(), 6), rng.random()]),
+            'plant_health_score': rng.choice([None, 0, rng.uniform(0, 100), 100, 79.99999, 20]),
+            'recommendations': recommendations()
+        }
+        if rng.random() < 0.1:
+            del image['plant_health_score']
+        soil = {
+            'success': rng.random() > 0.05,
+            'soil_status': rng.choice(['Good', 'Poor']),
+            'soil_issues': recommendations(),
+            'confidence_score': rng.choice([0.5, 0.925, rng.random()]),
+            'soil_quality_score': rng.choice([0, rng.uniform(0, 100), 60]),
+            'recommendations': recommendations()
+        }
+        cases.append({'image': image, 'soil': soil, 'soil_id': rng.choice([None, 's1', ''])})
+    return cases
+
+
+@pytest.fixture(scope='module')
+def js_outputs(tmp_path_factory):
+    node = shutil.which('node')
+    if node is None:
+        pytest.skip('node is not installed')
+    workdir = tmp_path_factory.mktemp('fusion')
+    (workdir / 'harness.js').write_text(NODE_HARNESS)
+    (workdir / 'cases.json').write_text(json.dumps(fusion_cases()))
+    completed = subprocess.run(
+        [node, str(workdir / 'harness.js'), os.path.abspath(LATE_FUSION_SERVICE), str(workdir / 'cases.json')],
+        capture_output=True, text=True, timeout=60, check=True
+    )
+    return json.loads(completed.stdout)
+
+
+def as_json(result):
+    """What the result looks like once serialized, which is how Node hands it on"""
+    return json.loads(json.dumps(result))
+
+
+def test_average_fusion_matches_js(js_outputs):
+    for case, output in zip(fusion_cases(), js_outputs):
+        try:
+            result = perform_late_fusion(case['image'], case['soil'], 'user', 'image', case['soil_id'])
+        except ValueError as e:
+            assert output['average'] == {'error': f"Late fusion failed: {e}"}
+            continue
+        expected = dict(output['average'])
+        # Both stamp the current time shifted by +8h, so only the format can match
+        js_time, py_time = expected.pop('date_predicted'), result.pop('date_predicted')
+        assert len(js_time) == len(py_time) and py_time.endswith('Z')
+        assert as_json(result) == expected
+
+
+def test_weighted_fusion_matches_js(js_outputs):
+    for case, output in zip(fusion_cases(), js_outputs):
+        assert as_json(fuse_single_pair(case['image'], case['soil'], 'user', 'image', case['soil_id'])) == output['weighted']
+
+
+def test_cases_cover_both_outcomes(js_outputs):
+    outcomes = {'error' in output['average'] for output in js_outputs}
+    categories = {output['weighted']['overall_health'] for output in js_outputs}
+    assert outcomes == {True, False}
+    assert len(categories) >= 3
+
+
+def test_date_predicted_is_shifted_like_node():
+    image = {'success': True, 'plant_health_score': 80, 'recommendations': []}
+    soil = {'success': True, 'soil_quality_score': 70, 'recommendations': []}
+    stamped = perform_late_fusion(image, soil, 'user', 'image', 'soil')['date_predicted']
+    shifted = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=8)
+    parsed = datetime.datetime.strptime(stamped, '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=datetime.timezone.utc)
+    assert abs((parsed - shifted).total_seconds()) < 60
@@ -0,0 +1,112 @@
+import queue
+import itertools
+import threading
+
+import numpy as np
+import pytest
+
+import inference_pool
+from inference_pool import InferencePool, split_cores, wait_for_workers
+
+
+class ImmediateExecutor:
+    """Runs the decode step on the calling thread so the tests see its effects at once"""
+
+    def submit(self, function, *args):
+        function(*args)
+
+
+def dispatch_only_pool(in_flight, slots=2):
+    """An InferencePool with its dispatch state only: no processes, a fake decoder and plain queues"""
+    pool = InferencePool.__new__(InferencePool)
+    pool.target_size = (4, 4)
+    pool.tensor_shape = (4, 4, 3)
+    pool.decode = lambda img_path, target_size: np.full(pool.tensor_shape, img_path, dtype=np.uint8)
+    pool._condition = threading.Condition()
+    pool._pending = {}
+    pool._request_ids = itertools.count()
+    pool._decode_pool = ImmediateExecutor()
+    pool._workers = [
+        {
+            'alive': True,
+            'in_flight': count,
+            'completed': 0,
+            'free_slots': list(range(slots)),
+            'slots': np.zeros((slots,) + pool.tensor_shape, dtype=np.float32),
+            'task_queue': queue.Queue()
+        }
+        for count in in_flight
+    ]
+    return pool
+
+
+def test_all_workers_ready():
+    results = queue.Queue()
+    for worker_index in (1, 0):
+        results.put(('ready', worker_index, 100 + worker_index))
+    ready = []
+    wait_for_workers(results, 2, lambda worker_index: None, lambda worker_index, pid: ready.append((worker_index, pid)), timeout=5)
+    assert ready == [(1, 101), (0, 100)]
+
+
+def test_worker_that_exits_during_startup_fails_at_once():
+    results = queue.Queue()
+    results.put(('ready', 0, 100))
+    exit_codes = {0: None, 1: 3}
+    with pytest.raises(RuntimeError, match='worker 1 exited with code 3'):
+        # The timeout would hang the test if the exit were only noticed at the deadline
+        wait_for_workers(results, 2, exit_codes.get, lambda worker_index, pid: None, timeout=300, poll_interval=0.01)
+
+
+def test_silent_workers_time_out():
+    with pytest.raises(RuntimeError, match='Only 0/1 pool workers started'):
+        wait_for_workers(queue.Queue(), 1, lambda worker_index: None, lambda worker_index, pid: None, timeout=0.05, poll_interval=0.01)
+
+
+def test_submit_picks_the_least_busy_worker_and_decodes_into_its_slot():
+    pool = dispatch_only_pool([2, 0, 1])
+    pool.submit(51)
+
+    chosen = pool._workers[1]
+    assert [worker['in_flight'] for worker in pool._workers] == [2, 1, 1]
+    request_id, slot, shape = chosen['task_queue'].get_nowait()
+    assert shape == (4, 4, 3)
+    assert slot not in chosen['free_slots']
+    np.testing.assert_allclose(chosen['slots'][slot], 51 / 255.0)
+    assert all(worker['task_queue'].empty() for worker in pool._workers)
+
+
+def test_results_resolve_their_own_request_and_free_the_slot():
+    pool = dispatch_only_pool([0])
+    first, second = pool.submit(10), pool.submit(20)
+    worker = pool._workers[0]
+    tasks = [worker['task_queue'].get_nowait() for _ in range(2)]
+
+    # Answered out of order
+    for request_id, _, _ in reversed(tasks):
+        pool._handle_result(('result', 0, request_id, {'request': request_id}, {'forward': 0.001}))
+
+    assert first.result(timeout=1)['request'] == tasks[0][0]
+    assert second.result(timeout=1)['request'] == tasks[1][0]
+    assert 'forward_ms' in first.result()['timings']
+    assert worker['in_flight'] == 0 and worker['completed'] == 2
+    assert sorted(worker['free_slots']) == [0, 1]
+
+
+def test_undecodable_images_resolve_to_none_and_free_the_slot():
+    pool = dispatch_only_pool([0])
+    pool.decode = lambda img_path, target_size: (_ for _ in ()).throw(ValueError('not an image'))
+    assert pool.submit(b'junk').result(timeout=1) is None
+    assert pool._workers[0]['in_flight'] == 0 and sorted(pool._workers[0]['free_slots']) == [0, 1]
+
+
+def test_workers_get_disjoint_cores(monkeypatch):
+    monkeypatch.setattr(inference_pool, 'available_cores', lambda: list(range(8)))
+    core_sets = split_cores(4)
+    assert len(core_sets) == 4 and all(len(cores) == 2 for cores in core_sets)
+    assert sorted(core for cores in core_sets for core in cores) == list(range(8))
+
+
+def test_more_workers_than_cores_share_them(monkeypatch):
+    monkeypatch.setattr(inference_pool, 'available_cores', lambda: [0, 1])
+    assert split_cores(3) == [[0], [1], [0]]
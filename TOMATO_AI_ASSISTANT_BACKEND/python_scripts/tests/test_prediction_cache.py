@@ -0,0 +1,124 @@
+import json
+import os
+
+from prediction_cache import PredictionCache, hash_file
+
+
+def result(label, confidence=0.9):
+    return {'success': True, 'predicted_class': label, 'confidence': confidence, 'top_predictions': [{'class': label}]}
+
+
+def test_keys_depend_on_content_and_model_version(tmp_path):
+    image = tmp_path / 'leaf.jpg'
+    image.write_bytes(b'jpeg bytes')
+    cache = PredictionCache('model-a')
+
+    assert cache.key_for_file(str(image)) == cache.key_for_bytes(b'jpeg bytes')
+    assert cache.key_for_bytes(b'jpeg bytes') != cache.key_for_bytes(b'other bytes')
+    assert cache.key_for_bytes(b'jpeg bytes') != PredictionCache('model-b').key_for_bytes(b'jpeg bytes')
+    assert len(hash_file(str(image))) == 64
+
+
+def test_lru_evicts_least_recently_used_entry():
+    cache = PredictionCache('model', max_entries=2)
+    cache.put('a', result('a'))
+    cache.put('b', result('b'))
+    assert cache.get('a')['predicted_class'] == 'a'
+
+    # 'b' is now the least recently used entry
+    cache.put('c', result('c'))
+    assert cache.get('b') is None
+    assert cache.get('a')['predicted_class'] == 'a'
+    assert cache.get('c')['predicted_class'] == 'c'
+    assert cache.stats() == {'entries': 2, 'memory_hits': 3, 'disk_hits': 0, 'misses': 1, 'hit_rate': 0.75}
+
+
+def test_put_stores_a_copy():
+    cache = PredictionCache('model')
+    original = result('healthy')
+    cache.put('key', original)
+
+    original['predicted_class'] = 'changed'
+    original['top_predictions'].append({'class': 'changed'})
+    assert cache.get('key') == result('healthy')
+
+
+def test_get_returns_a_copy():
+    cache = PredictionCache('model')
+    cache.put('key', result('healthy'))
+
+    # predict_disease stamps timings and cache_hit onto whatever get returns
+    first = cache.get('key')
+    first['timings'] = {'total_ms': 1.0}
+    first['cache_hit'] = True
+    first['top_predictions'][0]['class'] = 'changed'
+    assert cache.get('key') == result('healthy')
+
+
+def test_disk_tier_serves_a_fresh_process(tmp_path):
+    PredictionCache('model', disk_dir=str(tmp_path)).put('key', result('healthy'))
+    assert json.loads((tmp_path / 'key.json').read_text()) == result('healthy')
+
+    cache = PredictionCache('model', disk_dir=str(tmp_path))
+    assert cache.get('key') == result('healthy')
+    assert cache.get('key') == result('healthy')
+    assert cache.get('missing') is None
+    stats = cache.stats()
+    assert (stats['disk_hits'], stats['memory_hits'], stats['misses']) == (1, 1, 1)
+
+
+def test_disk_tier_ignores_corrupt_entries(tmp_path):
+    (tmp_path / 'key.json').write_text('{not json')
+    assert PredictionCache('model', disk_dir=str(tmp_path)).get('key') is None
+
+
+def test_disk_tier_evicts_least_recently_used_files(tmp_path):
+    entry_bytes = len(json.dumps(result('x')))
+    cache = PredictionCache('model', max_entries=1, disk_dir=str(tmp_path), max_disk_bytes=2 * entry_bytes)
+    cache.put('a', result('a'))
+    cache.put('b', result('b'))
+
+    # 'a' is only on disk now; reading it makes 'b' the least recently used file
+    assert cache.get('a') is not None
+    cache.put('c', result('c'))
+    assert sorted(os.listdir(tmp_path)) == ['a.json', 'c.json']
+
+
+def test_disk_tier_startup_scan_orders_existing_files_by_mtime(tmp_path):
+    entry_bytes = len(json.dumps(result('x')))
+    writer = PredictionCache('model', disk_dir=str(tmp_path))
+    writer.put('a', result('a'))
+    writer.put('b', result('b'))
+    os.utime(tmp_path / 'a.json', (2, 2))
+    os.utime(tmp_path / 'b.json', (1, 1))
+
+    cache = PredictionCache('model', disk_dir=str(tmp_path), max_disk_bytes=2 * entry_bytes)
+    cache.put('c', result('c'))
+    assert sorted(os.listdir(tmp_path)) == ['a.json', 'c.json']
+
+
+def test_disk_tier_writes_do_not_list_the_directory(tmp_path, monkeypatch):
+    cache = PredictionCache('model', disk_dir=str(tmp_path), max_disk_bytes=10 ** 6, rescan_every=100)
+    listings = []
+    real_listdir = os.listdir
+    monkeypatch.setattr(os, 'listdir', lambda path: listings.append(path) or real_listdir(path))
+
+    for i in range(99):
+        cache.put(f'k{i}', result(str(i)))
+    assert listings == []
+
+    cache.put('k99', result('99'))
+    assert listings == [str(tmp_path)]
+
+
+def test_disk_tier_rescan_counts_files_from_other_processes(tmp_path):
+    entry_bytes = len(json.dumps(result('x')))
+    cache = PredictionCache('model', disk_dir=str(tmp_path), max_disk_bytes=2 * entry_bytes, rescan_every=1)
+    other = PredictionCache('model', disk_dir=str(tmp_path))
+    other.put('a', result('a'))
+    other.put('b', result('b'))
+    os.utime(tmp_path / 'a.json', (1, 1))
+    os.utime(tmp_path / 'b.json', (2, 2))
+
+    cache.put('c', result('c'))
+    assert sorted(os.listdir(tmp_path)) == ['b.json', 'c.json']
@@ -0,0 +1,75 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from conftest import OPTIMAL_RANGES, random_readings
+from soil_artifact import ARTIFACT_FILE, export_soil_artifact, load_soil_artifact
+from soil_prediction import SCALER_FILE, SOIL_MODEL_FILE, SoilAnalyzer
+
+SCORES = ('soil_status', 'soil_quality_score', 'confidence_score', 'soil_issues', 'recommendations')
+
+
+@pytest.fixture
+def artifact_dir(soil_model_dir, tmp_path, monkeypatch):
+    """A copy of the fitted pickles plus the artifact exported from them"""
+    monkeypatch.setenv('SOIL_MEMO_SIZE', '0')
+    monkeypatch.setenv('SOIL_FLAT_FOREST_MAX_ROWS', '4')
+    for name in (SOIL_MODEL_FILE, SCALER_FILE):
+        shutil.copy2(os.path.join(soil_model_dir, name), tmp_path / name)
+    pickled = SoilAnalyzer(model_dir=str(tmp_path), model_format='pickle')
+    export_soil_artifact(str(tmp_path / ARTIFACT_FILE), pickled.soil_model, pickled.scaler,
+                         (str(tmp_path / SOIL_MODEL_FILE), str(tmp_path / SCALER_FILE)))
+    return tmp_path
+
+
+def scores(results):
+    return [{field: result[field] for field in SCORES} for result in results]
+
+
+def test_mmap_matches_pickle(artifact_dir):
+    readings = random_readings(3)
+    pickled = SoilAnalyzer(model_dir=str(artifact_dir), model_format='pickle')
+    mapped = SoilAnalyzer(model_dir=str(artifact_dir), model_format='mmap')
+    assert mapped.model_format == 'mmap'
+    assert scores(mapped.analyze_soil_batch(readings, OPTIMAL_RANGES)) == scores(pickled.analyze_soil_batch(readings, OPTIMAL_RANGES))
+    # Small batches never need the pickled forest
+    assert mapped._soil_model is None
+
+
+def test_mmap_never_unpickles_on_the_request_path(artifact_dir):
+    readings = random_readings(20)
+    pickled = SoilAnalyzer(model_dir=str(artifact_dir), model_format='pickle')
+    mapped = SoilAnalyzer(model_dir=str(artifact_dir), model_format='mmap')
+    assert pickled.flat_forest_max_rows == 4
+    assert mapped.flat_forest_max_rows == float('inf')
+
+    # Above the pickle path's crossover the artifact still walks the flat forest, with the same scores
+    assert scores(mapped.analyze_soil_batch(readings, OPTIMAL_RANGES)) == scores(pickled.analyze_soil_batch(readings, OPTIMAL_RANGES))
+    assert mapped._soil_model is None
+
+
+def test_mmap_without_pickles_walks_every_batch(artifact_dir):
+    os.remove(artifact_dir / SOIL_MODEL_FILE)
+    mapped = SoilAnalyzer(model_dir=str(artifact_dir), model_format='mmap')
+    assert all(result['success'] for result in mapped.analyze_soil_batch(random_readings(20), OPTIMAL_RANGES))
+
+
+def test_stale_artifact_is_ignored(artifact_dir):
+    paths = (str(artifact_dir / SOIL_MODEL_FILE), str(artifact_dir / SCALER_FILE))
+    assert load_soil_artifact(str(artifact_dir / ARTIFACT_FILE), paths) is not None
+
+    os.utime(paths[1], ns=(0, 0))
+    assert load_soil_artifact(str(artifact_dir / ARTIFACT_FILE), paths) is None
+    assert SoilAnalyzer(model_dir=str(artifact_dir)).model_format == 'pickle'
+    with pytest.raises(FileNotFoundError):
+        SoilAnalyzer(model_dir=str(artifact_dir), model_format='mmap')
+
+
+def test_artifact_arrays_are_memory_mapped(artifact_dir):
+    forest, _ = load_soil_artifact(str(artifact_dir / ARTIFACT_FILE))
+    base = forest.threshold
+    while base is not None and not isinstance(base, np.memmap):
+        base = base.base
+    assert base is not None
@@ -0,0 +1,83 @@
+import pytest
+
+from conftest import OPTIMAL_RANGES, random_readings
+from soil_prediction import READING_RESOLUTION, SoilAnalyzer
+
+RESULT_FIELDS = ('success', 'soil_status', 'soil_quality_score', 'confidence_score', 'soil_issues', 'recommendations')
+
+# Both round to nitrogen 40 but sit on either side of the 40-60 optimal range
+LOW = {'ph_level': 6.5, 'temperature': 25.0, 'moisture': 70.0, 'nitrogen': 39.6, 'phosphorus': 40, 'potassium': 50}
+IN_RANGE = {**LOW, 'nitrogen': 40.4}
+
+
+@pytest.fixture
+def analyzer(soil_model_dir, monkeypatch):
+    monkeypatch.delenv('SOIL_MEMO_SIZE', raising=False)
+    return SoilAnalyzer(model_dir=soil_model_dir, model_format='pickle')
+
+
+@pytest.fixture
+def unmemoized(soil_model_dir, monkeypatch):
+    monkeypatch.setenv('SOIL_MEMO_SIZE', '0')
+    return SoilAnalyzer(model_dir=soil_model_dir, model_format='pickle')
+
+
+def essentials(result):
+    return {field: result[field] for field in RESULT_FIELDS}
+
+
+def test_readings_in_one_bucket_share_a_memo_key(analyzer):
+    assert analyzer.memo_key(LOW) == analyzer.memo_key(IN_RANGE)
+
+
+@pytest.mark.parametrize('order', [(LOW, IN_RANGE), (IN_RANGE, LOW)])
+def test_rules_run_on_the_raw_reading(analyzer, order):
+    first, second = (analyzer.analyze_soil(reading, OPTIMAL_RANGES) for reading in order)
+    assert analyzer.memo.stats()['memory_hits'] == 1
+
+    low, in_range = (first, second) if order[0] is LOW else (second, first)
+    assert any('Nitrogen is too low (39.6mg/kg)' in issue for issue in low['soil_issues'])
+    assert not any('Nitrogen' in issue for issue in in_range['soil_issues'])
+    assert in_range['recommendations'] != low['recommendations']
+
+
+@pytest.mark.parametrize('order', [(LOW, IN_RANGE), (IN_RANGE, LOW)])
+def test_readings_in_one_bucket_score_the_same_in_either_order(soil_model_dir, unmemoized, monkeypatch, order):
+    quantized = dict(zip(READING_RESOLUTION, unmemoized.memo_key(LOW)))
+    expected = unmemoized.analyze_soil(quantized, OPTIMAL_RANGES)
+    scores = ('soil_quality_score', 'confidence_score')
+
+    for batch in (False, True):
+        monkeypatch.delenv('SOIL_MEMO_SIZE', raising=False)
+        analyzer = SoilAnalyzer(model_dir=soil_model_dir, model_format='pickle')
+        if batch:
+            results = analyzer.analyze_soil_batch(list(order), OPTIMAL_RANGES)
+        else:
+            results = [analyzer.analyze_soil(reading, OPTIMAL_RANGES) for reading in order]
+        for result in results:
+            assert {score: result[score] for score in scores} == {score: expected[score] for score in scores}
+
+
+def test_batch_rules_run_on_the_raw_reading(analyzer):
+    analyzer.analyze_soil(LOW, OPTIMAL_RANGES)
+    low, in_range = analyzer.analyze_soil_batch([LOW, IN_RANGE], OPTIMAL_RANGES)
+    assert any('Nitrogen is too low' in issue for issue in low['soil_issues'])
+    assert not any('Nitrogen' in issue for issue in in_range['soil_issues'])
+
+
+def test_memoized_results_match_unmemoized(analyzer, unmemoized):
+    readings = random_readings(40, seed=1)
+    expected = [essentials(unmemoized.analyze_soil(reading, OPTIMAL_RANGES)) for reading in readings]
+
+    assert [essentials(analyzer.analyze_soil(reading, OPTIMAL_RANGES)) for reading in readings] == expected
+    assert [essentials(result) for result in analyzer.analyze_soil_batch(readings, OPTIMAL_RANGES)] == expected
+    assert analyzer.memo.stats()['memory_hits'] == len(readings)
+
+
+def test_memo_is_shared_across_range_profiles(analyzer):
+    wide = {**OPTIMAL_RANGES, 'nitrogen': {'optimal': [20, 90], 'unit': 'mg/kg'}}
+    narrow = analyzer.analyze_soil(LOW, OPTIMAL_RANGES)
+    relaxed = analyzer.analyze_soil(LOW, wide)
+    assert analyzer.memo.stats()['memory_hits'] == 1
+    assert relaxed['soil_quality_score'] == narrow['soil_quality_score']
+    assert not any('Nitrogen' in issue for issue in relaxed['soil_issues'])
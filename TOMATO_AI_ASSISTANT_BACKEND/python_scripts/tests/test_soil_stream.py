@@ -0,0 +1,151 @@
+import pytest
+
+from conftest import OPTIMAL_RANGES
+from soil_prediction import READING_RESOLUTION
+from soil_stream import SoilStream
+
+READING = {'ph_level': 6.5, 'temperature': 25.0, 'moisture': 70.0, 'nitrogen': 50, 'phosphorus': 40, 'potassium': 50}
+
+
+class FakeAnalyzer:
+    """Records what the stream asks for; status and issues follow nitrogen so tests can steer them"""
+
+    def __init__(self):
+        self.calls = []
+        self.fail_next = False
+
+    def analyze_soil(self, soil_data, optimal_ranges):
+        self.calls.append(dict(soil_data))
+        if self.fail_next:
+            self.fail_next = False
+            return {'success': False, 'error': 'Soil analysis failed: boom'}
+        low = soil_data['nitrogen'] < optimal_ranges['nitrogen']['optimal'][0]
+        return {
+            'success': True,
+            'soil_status': 'Poor' if low else 'Good',
+            'soil_quality_score': 45.0 if low else 85.0,
+            'confidence_score': 0.9,
+            'soil_issues': ['Nitrogen is too low'] if low else ['All soil parameters are within optimal ranges'],
+            'recommendations': ['Add nitrogen'] if low else []
+        }
+
+
+@pytest.fixture
+def analyzer():
+    return FakeAnalyzer()
+
+
+@pytest.fixture
+def stream(analyzer):
+    return SoilStream(analyzer, READING_RESOLUTION, window=3)
+
+
+def feed(stream, nitrogen_values, soil_id='probe-1'):
+    return [stream.update(soil_id, {**READING, 'nitrogen': value}, OPTIMAL_RANGES) for value in nitrogen_values]
+
+
+def test_first_reading_is_analyzed_and_emitted(stream, analyzer):
+    result = stream.update('probe-1', READING, OPTIMAL_RANGES)
+    assert result['success'] and result['soil_status'] == 'Good'
+    assert result['soil_id'] == 'probe-1'
+    assert result['readings_seen'] == 1 and result['analyses'] == 1
+    assert analyzer.calls == [READING]
+
+
+def test_noise_within_delta_is_not_reanalyzed(stream, analyzer):
+    results = feed(stream, [50, 51, 49, 50, 51])
+    assert results[0] is not None
+    assert results[1:] == [None] * 4
+    assert len(analyzer.calls) == 1
+    assert stream.stats()['skipped_ratio'] == pytest.approx(0.8)
+
+
+def test_unchanged_verdict_is_analyzed_but_not_emitted(stream, analyzer):
+    # The smoothed nitrogen moves past its delta, but the verdict stays Good
+    results = feed(stream, [50, 56, 62])
+    assert results[0] is not None
+    assert results[1:] == [None, None]
+    assert len(analyzer.calls) == 3
+    assert stream.stats()['emitted'] == 1
+
+
+def test_changed_verdict_is_emitted_on_smoothed_reading(stream, analyzer):
+    results = feed(stream, [50, 30, 30, 30])
+    # Window means 40, 36.67, 30: only once the mean drops below 40 does the verdict change
+    assert results[1] is None
+    assert results[2]['soil_status'] == 'Poor'
+    assert results[2]['smoothed_readings']['nitrogen'] == 37
+    assert results[2]['trend']['nitrogen'] == pytest.approx(-10.0)
+    assert results[3] is None
+
+
+def test_changed_ranges_force_an_analysis(stream, analyzer):
+    stream.update('probe-1', READING, OPTIMAL_RANGES)
+    stricter = {**OPTIMAL_RANGES, 'nitrogen': {'optimal': [55, 70], 'unit': 'mg/kg'}}
+    result = stream.update('probe-1', READING, stricter)
+    assert result['soil_status'] == 'Poor'
+    # Later readings without ranges reuse the stricter ones
+    assert stream.update('probe-1', READING) is None
+    assert len(analyzer.calls) == 2
+
+
+def test_failed_analysis_is_retried(analyzer):
+    stream = SoilStream(analyzer, READING_RESOLUTION, window=1)
+    stream.update('probe-1', READING, OPTIMAL_RANGES)
+    analyzer.fail_next = True
+    failed = stream.update('probe-1', {**READING, 'nitrogen': 20}, OPTIMAL_RANGES)
+    assert failed == {'success': False, 'error': 'Soil analysis failed: boom', 'soil_id': 'probe-1'}
+
+    # Same smoothed reading again: the failure did not count as an analysis to compare against
+    retried = feed(stream, [20])[0]
+    assert retried['soil_status'] == 'Poor'
+    assert len(analyzer.calls) == 3
+
+
+def test_probes_are_independent(stream, analyzer):
+    assert feed(stream, [50], soil_id='a')[0] is not None
+    assert feed(stream, [50], soil_id='b')[0] is not None
+    assert feed(stream, [51], soil_id='a')[0] is None
+    assert stream.stats()['probes'] == 2
+
+
+def test_invalid_readings_are_reported(stream, analyzer):
+    missing = {field: value for field, value in READING.items() if field != 'moisture'}
+    assert stream.update('probe-1', missing, OPTIMAL_RANGES)['error'] == 'Missing required field: moisture'
+    assert stream.update('probe-1', {**READING, 'nitrogen': 'high'}, OPTIMAL_RANGES)['error'].startswith('Invalid reading')
+    assert stream.update('probe-1', READING)['error'] == 'No optimal ranges provided from database'
+    assert analyzer.calls == []
+
+
+@pytest.mark.parametrize('soil_id,soil_data,error', [
+    ('a', 5, 'Invalid soil_data: expected an object, got int'),
+    ('a', None, 'Invalid soil_data: expected an object, got NoneType'),
+    ('a', [READING], 'Invalid soil_data: expected an object, got list'),
+    ([1], READING, 'Invalid soil_id: expected a string or integer, got list'),
+    ({'id': 1}, READING, 'Invalid soil_id: expected a string or integer, got dict'),
+    (True, READING, 'Invalid soil_id: expected a string or integer, got bool')
+])
+def test_malformed_records_are_reported(stream, analyzer, soil_id, soil_data, error):
+    result = stream.update(soil_id, soil_data, OPTIMAL_RANGES)
+    assert result['success'] is False and result['error'] == error
+    # The stream keeps going after a bad record
+    assert stream.update(7, READING, OPTIMAL_RANGES)['success']
+    assert len(analyzer.calls) == 1
+
+
+@pytest.mark.parametrize('value', ['nan', 'inf', '-inf', float('nan')])
+def test_non_finite_readings_are_rejected(stream, analyzer, value):
+    stream.update('probe-1', READING, OPTIMAL_RANGES)
+    result = stream.update('probe-1', {**READING, 'ph_level': value}, OPTIMAL_RANGES)
+    assert result == {'success': False, 'error': 'Invalid reading: ph_level is not a finite number', 'soil_id': 'probe-1'}
+
+    # The rejected reading never entered the window, so a real change right after it is still analyzed
+    stream.update('probe-1', {**READING, 'ph_level': 3.0}, OPTIMAL_RANGES)
+    assert len(analyzer.calls) == 2
+    assert analyzer.calls[-1]['ph_level'] == 4.75
+
+
+def test_non_finite_timestamp_is_rejected(stream, analyzer):
+    result = stream.update('probe-1', READING, OPTIMAL_RANGES, timestamp='nan')
+    assert result['error'] == 'Invalid reading: timestamp is not a finite number'
+    assert analyzer.calls == []
@@ -0,0 +1,126 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from class_taxonomy import ClassTaxonomy, taxonomy_path_for
+from tomato_gate import GATE_REJECT_LABEL, TomatoGate
+from tomato_prediction import TomatoClassifier
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models', 'final_fast_tomato_model.h5')
+
+# Normalized RGB fills, as predict_preprocessed receives them
+GREY = (0.5, 0.5, 0.5)
+BLUE = (0.15, 0.3, 0.85)
+GREEN = (0.2, 0.65, 0.15)
+
+
+class CountingModel:
+    """Stands in for the network: records every forward pass and calls every row Tomato_healthy"""
+
+    def __init__(self, num_classes, class_idx, seconds=0.02):
+        self.num_classes = num_classes
+        self.class_idx = class_idx
+        self.seconds = seconds
+        self.batches = []
+
+    def predict(self, batch, verbose=0):
+        self.batches.append(len(batch))
+        time.sleep(self.seconds)
+        predictions = np.full((len(batch), self.num_classes), 0.01, dtype=np.float32)
+        predictions[:, self.class_idx] = 0.9
+        return predictions
+
+
+def filled(*colours, size=64):
+    return np.stack([np.broadcast_to(np.array(colour, dtype=np.float32), (size, size, 3)) for colour in colours])
+
+
+@pytest.fixture
+def classifier():
+    """A classifier with the real gate and taxonomy around a counting model, without loading TensorFlow"""
+    taxonomy = ClassTaxonomy.load(taxonomy_path_for(MODEL_PATH))
+    classifier = TomatoClassifier.__new__(TomatoClassifier)
+    classifier.gate = TomatoGate()
+    classifier.taxonomy = taxonomy
+    classifier.class_names = taxonomy.class_names
+    classifier.num_classes = len(taxonomy)
+    classifier.runtime_profile = {'backend': 'test'}
+    classifier.model = CountingModel(len(taxonomy), taxonomy.class_names.index('Tomato_healthy'))
+    return classifier
+
+
+def test_gate_separates_plant_colours_from_grey_and_blue():
+    passed, fractions = TomatoGate().check(filled(GREY, BLUE, GREEN), max_value=1.0)
+    assert passed.tolist() == [False, False, True]
+    assert fractions.tolist() == [0.0, 0.0, 1.0]
+
+
+def test_rejected_images_never_reach_the_model(classifier):
+    results = classifier.predict_preprocessed(filled(GREY, BLUE))
+
+    assert classifier.model.batches == []
+    for result in results:
+        assert result['gate_rejected'] is True
+        assert result['predicted_class'] == GATE_REJECT_LABEL
+        assert result['is_tomato'] is False
+
+    stats = classifier.gate.stats()
+    assert (stats['checked'], stats['rejected']) == (2, 2)
+    # Nothing has been timed through the model yet, so there is no saving to estimate
+    assert stats['model_seconds_per_image'] is None
+    assert stats['estimated_saved_seconds'] is None
+
+
+def test_rejections_have_the_model_result_shape(classifier):
+    rejected, passed = classifier.predict_preprocessed(filled(GREY, GREEN))
+    assert set(rejected) - {'gate_rejected'} == set(passed)
+    assert len(rejected['top_predictions']) == len(passed['top_predictions']) == 3
+    assert rejected['top_predictions'][0] == {'class': GATE_REJECT_LABEL, 'confidence': rejected['confidence']}
+    for entry in rejected['top_predictions'][1:]:
+        assert entry['confidence'] == 0.0
+        assert not classifier.taxonomy.entries[classifier.class_names.index(entry['class'])]['is_tomato']
+
+
+def test_mixed_batch_sends_only_passing_rows_forward(classifier):
+    results = classifier.predict_preprocessed(filled(GREY, GREEN, BLUE, GREEN))
+
+    assert classifier.model.batches == [2]
+    assert [result.get('gate_rejected', False) for result in results] == [True, False, True, False]
+    assert results[1]['predicted_class'] == 'Tomato_healthy'
+    assert results[3]['predicted_class'] == 'Tomato_healthy'
+
+
+def test_stats_counters_add_up(classifier):
+    classifier.predict_preprocessed(filled(GREY, GREEN, BLUE))
+    classifier.predict_preprocessed(filled(GREEN))
+    classifier.predict_preprocessed(filled(BLUE, GREY))
+
+    assert classifier.model.batches == [1, 1]
+    gate = classifier.gate
+    stats = gate.stats()
+    assert (stats['checked'], stats['rejected']) == (6, 4)
+    assert stats['reject_rate'] == pytest.approx(4 / 6)
+    assert gate.model_images == 2
+    assert stats['model_seconds_per_image'] == pytest.approx(gate.model_seconds / 2)
+    assert stats['model_seconds_per_image'] >= classifier.model.seconds
+    assert stats['gate_seconds'] == gate.gate_seconds > 0
+    assert stats['estimated_saved_seconds'] == pytest.approx(4 * stats['model_seconds_per_image'] - stats['gate_seconds'])
+    assert stats['estimated_saved_seconds'] > 0
+
+
+@pytest.mark.parametrize('mode,enabled', [('off', False), ('color', True)])
+def test_from_env(monkeypatch, mode, enabled):
+    monkeypatch.setenv('TOMATO_GATE', mode)
+    monkeypatch.setenv('TOMATO_GATE_MIN_PLANT_FRACTION', '0.25')
+    gate = TomatoGate.from_env()
+    assert (gate is not None) == enabled
+    if enabled:
+        assert gate.min_plant_fraction == 0.25
+
+
+def test_from_env_rejects_unknown_modes(monkeypatch):
+    monkeypatch.setenv('TOMATO_GATE', 'model')
+    with pytest.raises(ValueError):
+        TomatoGate.from_env()
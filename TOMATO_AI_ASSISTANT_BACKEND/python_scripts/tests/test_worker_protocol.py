@@ -0,0 +1,66 @@
+import io
+import json
+from concurrent.futures import Future
+
+from worker_protocol import serve_lines
+
+WORKER_INFO = {'worker': 'test_worker', 'model_loaded': True}
+
+
+def serve(lines, handle_request=None, stats=None):
+    """Run serve_lines over the given input lines; returns (shutdown_requested, messages written)"""
+    output = io.StringIO()
+    handle_request = handle_request or (lambda request: {'success': True, 'echo': request.get('value')})
+    shutdown = serve_lines(handle_request, WORKER_INFO, io.StringIO(''.join(line + '\n' for line in lines)), output, stats=stats)
+    return shutdown, [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_ready_then_results_with_ids():
+    shutdown, messages = serve([json.dumps({'id': 1, 'value': 'a'}), '', json.dumps({'id': 2, 'value': 'b'})])
+    assert not shutdown
+    assert messages[0]['type'] == 'ready' and messages[0]['worker'] == 'test_worker'
+    assert [(message['id'], message['echo']) for message in messages[1:]] == [(1, 'a'), (2, 'b')]
+
+
+def test_bad_lines_get_error_replies_and_the_worker_keeps_serving():
+    _, messages = serve(['{not json', '[1, 2]', '5', '"text"', 'null', json.dumps({'id': 7, 'value': 'ok'})])
+    errors, last = messages[1:-1], messages[-1]
+    assert len(errors) == 5
+    assert all(error['type'] == 'result' and error['id'] is None and not error['success'] for error in errors)
+    assert all(error['error'].startswith('Invalid JSON request') for error in errors)
+    assert 'JSON object' in errors[1]['error']
+    assert last == {'success': True, 'echo': 'ok', 'type': 'result', 'id': 7}
+
+
+def test_handler_exceptions_become_failed_results():
+    def handle_request(request):
+        raise RuntimeError('boom')
+
+    _, messages = serve([json.dumps({'id': 3})], handle_request)
+    assert messages[1] == {'success': False, 'error': 'Worker request failed: boom', 'type': 'result', 'id': 3}
+
+
+def test_futures_are_answered():
+    def handle_request(request):
+        future = Future()
+        future.set_result({'success': True})
+        return future
+
+    _, messages = serve([json.dumps({'id': 4})], handle_request)
+    assert messages[1] == {'success': True, 'type': 'result', 'id': 4}
+
+
+def test_health_metrics_and_shutdown():
+    lines = [json.dumps({'id': 1, 'value': 'a'}), json.dumps({'type': 'health', 'id': 'h'}),
+             json.dumps({'type': 'metrics', 'id': 'm'}), json.dumps({'type': 'shutdown', 'id': 's'}),
+             json.dumps({'id': 2, 'value': 'never served'})]
+    shutdown, messages = serve(lines, stats=lambda: {'cache': {'entries': 0}})
+    assert shutdown
+
+    health, metrics, goodbye = messages[2:]
+    assert health['type'] == 'health' and health['id'] == 'h' and health['status'] == 'ok'
+    assert health['requests_served'] == 1 and health['worker'] == 'test_worker' and health['cache'] == {'entries': 0}
+    assert metrics['type'] == 'metrics' and metrics['id'] == 'm' and metrics['content_type'].startswith('text/plain')
+    assert isinstance(metrics['text'], str)
+    assert goodbye == {'type': 'shutdown', 'id': 's'}
+    assert len(messages) == 5
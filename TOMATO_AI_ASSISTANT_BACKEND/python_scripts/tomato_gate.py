@@ -0,0 +1,84 @@
+import os
+import threading
+
+import numpy as np
+
+GATE_MODES = ('off', 'color')
+
+# Label used for images the gate rejects; the model never saw them, so no class is claimed
+GATE_REJECT_LABEL = 'Non-Plant Object'
+
+
+class TomatoGate:
+    """
+    Cheap pre-check that rejects images which obviously contain no plant before the full model runs.
+
+    Works on a strided thumbnail of the already decoded image: a pixel counts as plant-coloured when
+    it is saturated, not too dark and not blue-dominant (green leaves, red/yellow fruit and brown or
+    yellow lesions all qualify). Images with too few such pixels - documents, screenshots, sky,
+    grey objects - are rejected. Hands and other warm-coloured objects pass and are left to the model.
+    """
+
+    def __init__(self, min_plant_fraction=0.1, stride=4, min_saturation=0.15, min_value=0.1):
+        self.min_plant_fraction = min_plant_fraction
+        self.stride = stride
+        self.min_saturation = min_saturation
+        self.min_value = min_value
+
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.rejected = 0
+        self.gate_seconds = 0.0
+        self.model_seconds = 0.0
+        self.model_images = 0
+
+    @classmethod
+    def from_env(cls):
+        """TOMATO_GATE=off|color (default off) and TOMATO_GATE_MIN_PLANT_FRACTION; None when disabled"""
+        mode = os.environ.get('TOMATO_GATE', 'off')
+        if mode not in GATE_MODES:
+            raise ValueError(f"Unknown gate '{mode}', expected one of {GATE_MODES}")
+        if mode == 'off':
+            return None
+        return cls(min_plant_fraction=float(os.environ.get('TOMATO_GATE_MIN_PLANT_FRACTION', 0.1)))
+
+    def plant_fraction(self, image, max_value=255.0):
+        """Share of plant-coloured pixels in an (H, W, 3) image with values in [0, max_value]"""
+        thumbnail = image[::self.stride, ::self.stride].astype(np.float32)
+        brightest = thumbnail.max(axis=2)
+        darkest = thumbnail.min(axis=2)
+        saturation = (brightest - darkest) / np.maximum(brightest, 1e-6)
+        plant = ((saturation > self.min_saturation)
+                 & (brightest > self.min_value * max_value)
+                 & (thumbnail[..., 2] < brightest))
+        return float(plant.mean())
+
+    def check(self, images, max_value=255.0):
+        """Boolean mask over a batch: True where the image should go on to the full model"""
+        fractions = np.array([self.plant_fraction(image, max_value) for image in images])
+        return fractions >= self.min_plant_fraction, fractions
+
+    def record(self, checked, rejected, gate_seconds, model_seconds=0.0, model_images=0):
+        """Count one gated batch; model_seconds is what the full model spent on the images that passed"""
+        with self._lock:
+            self.checked += checked
+            self.rejected += rejected
+            self.gate_seconds += gate_seconds
+            self.model_seconds += model_seconds
+            self.model_images += model_images
+
+    def stats(self):
+        with self._lock:
+            model_seconds_per_image = self.model_seconds / self.model_images if self.model_images else None
+            return {
+                'mode': 'color',
+                'min_plant_fraction': self.min_plant_fraction,
+                'checked': self.checked,
+                'rejected': self.rejected,
+                'reject_rate': self.rejected / self.checked if self.checked else 0.0,
+                'gate_seconds': self.gate_seconds,
+                'model_seconds_per_image': model_seconds_per_image,
+                # Full-model time the rejected images would have cost, less what the gate itself cost
+                'estimated_saved_seconds': (self.rejected * model_seconds_per_image - self.gate_seconds
+                                            if model_seconds_per_image is not None else None)
+            }
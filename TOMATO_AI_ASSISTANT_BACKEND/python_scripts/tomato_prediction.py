@@ -1,15 +1,27 @@
-import numpy as np
-import tensorflow as tf
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
-import cv2
 import os
+import io
 import json
 import sys
+import base64
+import binascii
 import warnings
+import threading
 import time
 import logging
 
+from lazy_imports import timed_import, import_report
+
+# TensorFlow/Keras are imported lazily in TomatoClassifier so that argument
+# errors and control requests never pay for loading them. numpy is timed
+# before the helper modules below, which import it themselves.
+np = timed_import('numpy')
+
+from stage_metrics import StageTimer
+from prefetch_pipeline import PrefetchPipeline, prefetch_settings
+from tomato_gate import TomatoGate, GATE_REJECT_LABEL
+from runtime_profile import (resolve_runtime_profile, apply_process_settings, apply_tensorflow_threads,
+                             effective_runtime_profile, profile_args_to_env)
+
 # Configure logging to output to stderr
 logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stderr)
 
@@ -18,44 +30,264 @@ sys.stdout.reconfigure(encoding='utf-8') if hasattr(sys.stdout, 'reconfigure') e
 
 warnings.filterwarnings('ignore')
 
+def describe_image(source):
+    """Short label for logs: the file name of a path, or the size of in-memory image bytes"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return f"<{len(source)} bytes in memory>"
+    return os.path.basename(source)
+
+def open_image(source):
+    """PIL-openable handle for an image path or raw encoded bytes"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    return source
+
+def decode_image_pil(img_path, target_size=(224, 224)):
+    """Load an image the way keras' load_img does (RGB, nearest-neighbour resize) without TensorFlow"""
+    Image = timed_import('PIL.Image')
+    
+    img = Image.open(open_image(img_path))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    width_height = (target_size[1], target_size[0])
+    if img.size != width_height:
+        img = img.resize(width_height, Image.NEAREST)
+    return np.asarray(img)
+
+def decode_image_opencv(img_path, target_size=(224, 224)):
+    """Decode with OpenCV, letting libjpeg scale large photos down by 2/4/8 while decoding"""
+    cv2 = timed_import('cv2')
+    Image = timed_import('PIL.Image')
+    
+    # Only the header is read here; it tells us how far the decoder may scale down
+    with Image.open(open_image(img_path)) as header:
+        width, height = header.size
+    
+    read_flag = cv2.IMREAD_COLOR
+    for factor, reduced_flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if width // factor >= target_size[1] and height // factor >= target_size[0]:
+            read_flag = reduced_flag
+            break
+    
+    # PIL ignores EXIF orientation, so OpenCV must too to see the same pixels
+    if isinstance(img_path, (bytes, bytearray, memoryview)):
+        img = cv2.imdecode(np.frombuffer(img_path, dtype=np.uint8), read_flag | cv2.IMREAD_IGNORE_ORIENTATION)
+    else:
+        img = cv2.imread(img_path, read_flag | cv2.IMREAD_IGNORE_ORIENTATION)
+    if img is None:
+        raise ValueError(f"Could not decode image: {describe_image(img_path)}")
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    
+    if img.shape[:2] != tuple(target_size):
+        # Nearest matches the PIL path when decoding at full size; area averaging suits the reduced decode
+        interpolation = cv2.INTER_NEAREST_EXACT if read_flag == cv2.IMREAD_COLOR else cv2.INTER_AREA
+        img = cv2.resize(img, (target_size[1], target_size[0]), interpolation=interpolation)
+    
+    return img
+
+class TFLiteModel:
+    """Run a converted .tflite flatbuffer behind the same predict()/output_shape surface as a Keras model"""
+
+    def __init__(self, model_path, num_threads=None):
+        interpreter_module = self._import_interpreter()
+        self.num_threads = num_threads
+        self.interpreter = interpreter_module.Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        
+        self.input_index = self.interpreter.get_input_details()[0]['index']
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        self.output_shape = tuple(self.interpreter.get_output_details()[0]['shape'])
+        self.batch_size = int(self.interpreter.get_input_details()[0]['shape'][0])
+
+    @staticmethod
+    def _import_interpreter():
+        """Prefer the standalone LiteRT/tflite runtimes so the full TF runtime is never loaded"""
+        for module_name in ('ai_edge_litert.interpreter', 'tflite_runtime.interpreter'):
+            try:
+                return timed_import(module_name)
+            except ImportError:
+                continue
+        return timed_import('tensorflow').lite
+
+    def predict(self, batch, verbose=0):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        
+        # Resize the input tensor only when the batch size changes
+        if batch.shape[0] != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input_index, batch.shape)
+            self.interpreter.allocate_tensors()
+            self.batch_size = batch.shape[0]
+        
+        self.interpreter.set_tensor(self.input_index, batch)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index).copy()
+
 class TomatoClassifier:
-    def __init__(self, model_path='models/final_fast_tomato_model.h5'):
+    BACKENDS = ('keras', 'tflite')
+    DECODERS = ('pil', 'opencv')
+
+    def __init__(self, model_path='models/final_fast_tomato_model.h5', backend=None, decoder=None, profile=None):
         """Initialize the tomato classifier for disease identification"""
+        load_start = time.perf_counter()
         try:
-            logging.info("Loading trained model for disease identification...")
+            # Threads, oneDNN and CPU affinity (TOMATO_* env, CLI flags or profile overrides)
+            self.profile = resolve_runtime_profile(profile)
+            apply_process_settings(self.profile)
             
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            full_model_path = os.path.join(script_dir, model_path)
+            # Backend can also be chosen per deployment with TOMATO_BACKEND=keras|tflite
+            self.backend = backend or os.environ.get('TOMATO_BACKEND', 'keras')
+            if self.backend not in self.BACKENDS:
+                raise ValueError(f"Unknown backend '{self.backend}', expected one of {self.BACKENDS}")
             
-            # Try alternative paths if main path doesn't exist
-            if not os.path.exists(full_model_path):
-                alternative_paths = [
-                    os.path.join(script_dir, '..', 'models', 'final_fast_tomato_model.h5'),
-                    os.path.join(script_dir, 'final_fast_tomato_model.h5')
-                ]
-                
-                for alt_path in alternative_paths:
-                    if os.path.exists(alt_path):
-                        full_model_path = alt_path
-                        logging.info(f"Found model at: {alt_path}")
-                        break
+            # TOMATO_DECODER=opencv switches to reduced-resolution JPEG decoding
+            self.decoder = decoder or os.environ.get('TOMATO_DECODER', 'pil')
+            if self.decoder not in self.DECODERS:
+                raise ValueError(f"Unknown decoder '{self.decoder}', expected one of {self.DECODERS}")
+            self._batch_buffer = None
+            
+            # Batch and stream requests decode the next chunk while the current one runs (0 = serial)
+            self.prefetch_depth, self.decode_threads = prefetch_settings()
+            self._prefetch_pipelines = {}
+            
+            # Optional cascade: TOMATO_GATE=color rejects obvious non-plant images before the forward pass
+            self.gate = TomatoGate.from_env()
+            
+            logging.info(f"Loading trained model for disease identification ({self.backend} backend)...")
             
-            if not os.path.exists(full_model_path):
-                raise FileNotFoundError(f"Model file not found: {full_model_path}")
+            if self.backend == 'tflite':
+                model_path = os.path.splitext(model_path)[0] + '.tflite'
+            full_model_path = self._resolve_model_path(model_path)
             
-            self.model = load_model(full_model_path)
+            if self.backend == 'tflite':
+                self.model = TFLiteModel(full_model_path, num_threads=self.profile['intra_op_threads'])
+            else:
+                timed_import('tensorflow')
+                apply_tensorflow_threads(self.profile)
+                keras_models = timed_import('tensorflow.keras.models')
+                self.model = keras_models.load_model(full_model_path)
+            self.model_path = full_model_path
+            self.runtime_profile = effective_runtime_profile(self.backend, self.model)
             logging.info("Model loaded successfully!")
+            logging.info(f"Runtime profile: {self.runtime_profile}")
             
             self.num_classes = self.model.output_shape[-1]
             logging.info(f"Model has {self.num_classes} output classes")
             
-            self.class_names = self._auto_detect_class_names()
+            self.taxonomy = self._load_taxonomy()
+            self.class_names = self.taxonomy.class_names
             logging.info(f"Loaded {len(self.class_names)} classes")
             
+            self.model_version = self._model_version()
+            self.cache = self._build_cache()
+            
+            # Reported once, on the first prediction this process makes
+            self._unreported_load_time = time.perf_counter() - load_start
+            
         except Exception as e:
             logging.error(f"Model loading failed: {e}")
             raise
 
+    def _load_taxonomy(self):
+        """Per-class metadata from the sidecar next to the model, compiled from the class-name rules if absent"""
+        from class_taxonomy import ClassTaxonomy, taxonomy_path_for
+        
+        taxonomy_path = taxonomy_path_for(self.model_path)
+        if os.path.exists(taxonomy_path):
+            taxonomy = ClassTaxonomy.load(taxonomy_path)
+            if len(taxonomy) != self.num_classes:
+                raise ValueError(f"Taxonomy {taxonomy_path} has {len(taxonomy)} classes, model has {self.num_classes}")
+            logging.info(f"Class taxonomy loaded from {os.path.basename(taxonomy_path)}")
+            return taxonomy
+        
+        return ClassTaxonomy.compile(self._auto_detect_class_names(), self)
+
+    def _model_version(self):
+        """Identify the loaded model plus every setting that changes its outputs (used in cache keys)"""
+        stat = os.stat(self.model_path)
+        return f"{os.path.basename(self.model_path)}:{stat.st_size}:{int(stat.st_mtime)}:{self.backend}:{self.decoder}:{self.taxonomy.version}:{self._gate_version()}"
+
+    def _gate_version(self):
+        return f"gate-{self.gate.min_plant_fraction}" if self.gate is not None else "gate-off"
+
+    def _build_cache(self):
+        """In-memory LRU by default (TOMATO_CACHE_SIZE=0 disables it); TOMATO_CACHE_DIR adds a disk tier"""
+        max_entries = int(os.environ.get('TOMATO_CACHE_SIZE', 1024))
+        if max_entries <= 0:
+            return None
+        
+        from prediction_cache import PredictionCache
+        
+        return PredictionCache(
+            self.model_version,
+            max_entries=max_entries,
+            disk_dir=os.environ.get('TOMATO_CACHE_DIR'),
+            max_disk_bytes=int(os.environ.get('TOMATO_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+        )
+
+    def stage_timer(self):
+        """Start timing one request; the first one of the process also carries the model load time"""
+        timer = StageTimer('tomato_prediction')
+        if self._unreported_load_time is not None:
+            timer.add('model_load', self._unreported_load_time)
+            self._unreported_load_time = None
+        return timer
+
+    def _lookup_cache(self, img_path, start_time):
+        """Return (cache_key, cached_result); both are None when caching is off"""
+        if self.cache is None:
+            return None, None
+        
+        if isinstance(img_path, (bytes, bytearray, memoryview)):
+            cache_key = self.cache.key_for_bytes(img_path)
+        else:
+            cache_key = self.cache.key_for_file(img_path)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            cached['cache_hit'] = True
+            cached['runtime_profile'] = self.runtime_profile
+            cached['inference_time'] = time.time() - start_time
+            logging.info(f"Prediction cache hit: {describe_image(img_path)}")
+        return cache_key, cached
+
+    def prefetch_pipeline(self, batch_size, target_size=(224, 224)):
+        """The PrefetchPipeline for this batch shape (its ring buffers are reused across calls); None when disabled"""
+        if self.prefetch_depth <= 0:
+            return None
+        key = (batch_size, tuple(target_size))
+        if key not in self._prefetch_pipelines:
+            self._prefetch_pipelines[key] = PrefetchPipeline(
+                self, batch_size, self.prefetch_depth, self.decode_threads, target_size)
+        return self._prefetch_pipelines[key]
+
+    def _resolve_model_path(self, model_path):
+        """Find the model file next to the script, falling back to the usual alternative locations"""
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        full_model_path = os.path.join(script_dir, model_path)
+        model_filename = os.path.basename(model_path)
+        
+        # ML_MODEL_DIR points both scripts at another models directory (e.g. benchmark stand-ins)
+        model_dir = os.environ.get('ML_MODEL_DIR')
+        if model_dir and os.path.exists(os.path.join(model_dir, model_filename)):
+            full_model_path = os.path.join(model_dir, model_filename)
+        
+        # Try alternative paths if main path doesn't exist
+        if not os.path.exists(full_model_path):
+            alternative_paths = [
+                os.path.join(script_dir, '..', 'models', model_filename),
+                os.path.join(script_dir, model_filename)
+            ]
+            
+            for alt_path in alternative_paths:
+                if os.path.exists(alt_path):
+                    full_model_path = alt_path
+                    logging.info(f"Found model at: {alt_path}")
+                    break
+        
+        if not os.path.exists(full_model_path):
+            raise FileNotFoundError(f"Model file not found: {full_model_path}")
+        
+        return full_model_path
+
     def _auto_detect_class_names(self):
         """Auto-detect class names for tomato diseases"""
         fallback_classes = [
@@ -74,25 +306,57 @@ class TomatoClassifier:
         
         return [f"Class_{i}" for i in range(self.num_classes)]
 
+    describe_image = staticmethod(describe_image)
+
+    def decode_image(self, img_path, target_size=(224, 224)):
+        """Decode one image (path or raw encoded bytes) and resize it to target_size as an RGB uint8 array"""
+        if self.decoder == 'opencv':
+            return decode_image_opencv(img_path, target_size)
+        return decode_image_pil(img_path, target_size)
+
     def preprocess_image(self, img_path, target_size=(224, 224)):
         """Preprocess image exactly like during training"""
         try:
-            # Load image 
-            img = image.load_img(img_path, target_size=target_size)
-            img_array = image.img_to_array(img)
-            
-            # Apply the same preprocessing as training
-            img_array = img_array / 255.0
-            
-            # Expand dimensions for batch
-            img_array = np.expand_dims(img_array, axis=0)
-            
-            return img_array
+            return self.normalize_image(self.decode_image(img_path, target_size))
             
         except Exception as e:
             logging.error(f"Error preprocessing image: {e}")
             raise
 
+    def normalize_image(self, img_array):
+        """uint8 (H, W, 3) -> float32 (1, H, W, 3) scaled to [0, 1], as during training"""
+        img_array = img_array.astype(np.float32)
+        img_array /= 255.0
+        return np.expand_dims(img_array, axis=0)
+
+    def preprocess_batch(self, img_paths, target_size=(224, 224), timer=None):
+        """
+        Decode images straight into a reused float32 batch buffer and normalize in place.
+        Returns (batch, positions) where positions are the indices of the paths that decoded.
+        """
+        shape = (len(img_paths), target_size[0], target_size[1], 3)
+        if (self._batch_buffer is None or self._batch_buffer.shape[0] < shape[0]
+                or self._batch_buffer.shape[1:] != shape[1:]):
+            self._batch_buffer = np.empty(shape, dtype=np.float32)
+        
+        timer = timer or StageTimer('tomato_prediction')
+        filled = 0
+        positions = []
+        for position, img_path in enumerate(img_paths):
+            try:
+                # uint8 -> float32 conversion happens in the copy into the buffer
+                with timer.stage('decode'):
+                    self._batch_buffer[filled] = self.decode_image(img_path, target_size)
+                positions.append(position)
+                filled += 1
+            except Exception as e:
+                logging.error(f"Skipping image {describe_image(img_path)}: {e}")
+        
+        batch = self._batch_buffer[:filled]
+        with timer.stage('preprocess'):
+            np.divide(batch, 255.0, out=batch)
+        return batch, positions
+
     def is_tomato_plant_part(self, class_name):
         """Check if the predicted class is specifically tomato leaf, fruit, or healthy tomato"""
         class_lower = class_name.lower()
@@ -255,13 +519,13 @@ class TomatoClassifier:
         
         return disease_mapping.get(disease_name.lower(), disease_name)
 
-    def enhance_confidence(self, predictions, predicted_class_idx, original_confidence):
+    def enhance_confidence(self, predictions, predicted_class_idx, original_confidence, top_indices=None):
         """
         Enhance confidence for all predictions based on top prediction consistency
         """
         # Get top 3 predictions and their confidences
-        top_indices = np.argsort(predictions[0])[-3:][::-1]
-        top_classes = [self.class_names[idx] for idx in top_indices]
+        if top_indices is None:
+            top_indices = np.argsort(predictions[0])[-3:][::-1]
         top_confidences = [float(predictions[0][idx]) for idx in top_indices]
         
         # Calculate confidence enhancement factors
@@ -283,11 +547,9 @@ class TomatoClassifier:
             enhanced_confidence = min(0.85, original_confidence * 1.1)
         
         # Additional boost for non-tomato predictions
-        plant_type = self.get_plant_type(self.class_names[predicted_class_idx])
-        if not self.is_tomato(plant_type):
+        if not self.taxonomy.is_tomato[predicted_class_idx]:
             # Check if all top predictions are non-tomato
-            non_tomato_count = sum(1 for class_name in top_classes if not self.is_tomato(self.get_plant_type(class_name)))
-            if non_tomato_count == len(top_classes):
+            if not self.taxonomy.is_tomato[top_indices].any():
                 enhanced_confidence = min(0.97, enhanced_confidence * 1.15)
         
         logging.info(f"Confidence enhanced: {original_confidence:.3f} -> {enhanced_confidence:.3f}")
@@ -555,96 +817,772 @@ class TomatoClassifier:
         
         return recommendations[:6]  # Return maximum 6 most important recommendations
 
+    def interpret_prediction(self, probabilities, predicted_class_idx, top_indices):
+        """Turn one row of class probabilities into the prediction result fields"""
+        original_confidence = float(probabilities[predicted_class_idx])
+        
+        # Enhance confidence for all predictions
+        confidence = self.enhance_confidence(probabilities[np.newaxis], predicted_class_idx, original_confidence, top_indices)
+        
+        # Class metadata was compiled once at load; only confidence-dependent fields are computed here
+        entry = self.taxonomy.entries[predicted_class_idx]
+        predicted_class = entry['class_name']
+        
+        # Get top 3 predictions
+        top_predictions = [
+            {
+                'class': self.class_names[idx],
+                'confidence': float(probabilities[idx])
+            }
+            for idx in top_indices
+        ]
+        
+        plant_type = entry['plant_type']
+        is_tomato = entry['is_tomato']
+        tomato_type = entry['tomato_type']
+        recommendations = list(entry['recommendations'])
+        
+        # Only calculate tomato-specific fields for tomato plants
+        if is_tomato:
+            health_status = self.taxonomy.health_status(predicted_class_idx, confidence)
+            disease_type = entry['disease_type']
+            plant_health_score = self.taxonomy.plant_health_score(predicted_class_idx, confidence)
+            
+            logging.info(f"Tomato {tomato_type.lower()} detected: {predicted_class} ({confidence:.2%})")
+            logging.info(f"Health Status: {health_status}")
+            logging.info(f"Plant Health Score: {plant_health_score}/100")
+            logging.info(f"Disease Type: {disease_type}")
+        else:
+            # Null values for non-tomato cases
+            health_status = None
+            disease_type = None
+            plant_health_score = None
+            
+            logging.info(f"{plant_type} detected: {predicted_class}")
+            logging.info(f"Confidence: {confidence:.2%} (enhanced from {original_confidence:.2%})")
+            logging.info("Non-tomato detected - setting tomato-specific fields to null")
+        
+        logging.info(f"Recommendations generated: {len(recommendations)}")
+        
+        return {
+            'predicted_class': predicted_class,
+            'confidence': confidence,
+            'is_tomato': is_tomato,
+            'tomato_type': tomato_type,
+            'health_status': health_status,
+            'plant_health_score': plant_health_score,
+            'disease_type': disease_type,
+            'recommendations': recommendations,
+            'top_predictions': top_predictions,
+            'plant_type': plant_type,  # Additional field for detailed plant type
+            'runtime_profile': self.runtime_profile
+        }
+
     def predict_disease(self, img_path, target_size=(224, 224)):
         """Make disease prediction on a single image with enhanced confidence"""
         try:
             start_time = time.time()
+            timer = self.stage_timer()
+            
+            logging.info(f"Processing image: {describe_image(img_path)}")
             
-            logging.info(f"Processing image: {os.path.basename(img_path)}")
+            # Identical bytes under the same model skip decode and inference entirely
+            with timer.stage('cache_lookup'):
+                cache_key, cached = self._lookup_cache(img_path, start_time)
+            if cached is not None:
+                cached['timings'] = timer.finish()
+                return cached
             
             # Preprocess image using standardized method
-            img_array = self.preprocess_image(img_path, target_size)
+            with timer.stage('decode'):
+                decoded = self.decode_image(img_path, target_size)
+            with timer.stage('preprocess'):
+                img_array = self.normalize_image(decoded)
             
-            # Make prediction
-            predictions = self.model.predict(img_array, verbose=0)
-            predicted_class_idx = np.argmax(predictions[0])
-            original_confidence = float(predictions[0][predicted_class_idx])
+            # Gate (when enabled), forward pass and interpretation
+            result = self.predict_preprocessed(img_array, timer)[0]
+            if result is None:
+                return None
             
-            # Enhance confidence for all predictions
-            confidence = self.enhance_confidence(predictions, predicted_class_idx, original_confidence)
+            result['inference_time'] = time.time() - start_time
+            result['cache_hit'] = False
+            result['timings'] = timer.finish()
             
-            # Get class name
-            if predicted_class_idx < len(self.class_names):
-                predicted_class = self.class_names[predicted_class_idx]
-            else:
-                predicted_class = f"Class_{predicted_class_idx}"
+            if cache_key is not None:
+                self.cache.put(cache_key, result)
             
-            # Get top 3 predictions
-            top_indices = np.argsort(predictions[0])[-3:][::-1]
-            top_predictions = []
-            
-            for idx in top_indices:
-                if idx < len(self.class_names):
-                    class_name = self.class_names[idx]
-                else:
-                    class_name = f"Class_{idx}"
-                
-                top_predictions.append({
-                    'class': class_name,
-                    'confidence': float(predictions[0][idx])
-                })
-            
-            # Determine plant type with enhanced detection
-            plant_type = self.get_plant_type(predicted_class)
-            is_tomato = self.is_tomato(plant_type)
-            tomato_type = self.get_tomato_type(plant_type)
-            
-            # Only calculate tomato-specific fields for tomato plants
-            if is_tomato:
-                health_status = self.get_health_status(predicted_class, confidence, plant_type)
-                disease_type = self.get_disease_type(predicted_class, plant_type)
-                plant_health_score = self.calculate_plant_health_score(predicted_class, confidence, plant_type)
-                recommendations = self.get_recommendations(plant_type, disease_type, health_status)
-                
-                logging.info(f"Tomato {tomato_type.lower()} detected: {predicted_class} ({confidence:.2%})")
-                logging.info(f"Health Status: {health_status}")
-                logging.info(f"Plant Health Score: {plant_health_score}/100")
-                logging.info(f"Disease Type: {disease_type}")
-            else:
-                # Null values for non-tomato cases
-                health_status = None
-                disease_type = None
-                plant_health_score = None
-                recommendations = self.get_recommendations(plant_type)
-                
-                logging.info(f"{plant_type} detected: {predicted_class}")
-                logging.info(f"Confidence: {confidence:.2%} (enhanced from {original_confidence:.2%})")
-                logging.info("Non-tomato detected - setting tomato-specific fields to null")
-            
-            inference_time = time.time() - start_time
-            logging.info(f"Recommendations generated: {len(recommendations)}")
-            
-            return {
-                'predicted_class': predicted_class,
-                'confidence': confidence,
-                'is_tomato': is_tomato,
-                'tomato_type': tomato_type,
-                'health_status': health_status,
-                'plant_health_score': plant_health_score,
-                'disease_type': disease_type,
-                'recommendations': recommendations,
-                'top_predictions': top_predictions,
-                'inference_time': inference_time,
-                'plant_type': plant_type  # Additional field for detailed plant type
-            }
+            return result
             
         except Exception as e:
             logging.error(f"Error predicting disease: {e}")
             return None
 
+    def predict_preprocessed(self, batch, timer=None):
+        """Run the model on an already normalized (n, H, W, 3) batch and interpret every row"""
+        timer = timer or StageTimer('tomato_prediction')
+        if self.gate is not None:
+            return self._predict_gated(batch, timer)
+        return self._run_model(batch, timer)
+
+    def _run_model(self, batch, timer):
+        """Forward pass plus interpretation, without the gate"""
+        with timer.stage('forward'):
+            predictions = self.model.predict(batch, verbose=0)
+        
+        with timer.stage('postprocess'):
+            # Vectorized argmax / top-3 over every row
+            predicted_indices = np.argmax(predictions, axis=1)
+            top_indices = np.argsort(predictions, axis=1)[:, -3:][:, ::-1]
+            
+            results = []
+            for row in range(len(predictions)):
+                try:
+                    results.append(self.interpret_prediction(predictions[row], predicted_indices[row], top_indices[row]))
+                except Exception as e:
+                    logging.error(f"Error interpreting prediction for batch row {row}: {e}")
+                    results.append(None)
+        return results
+
+    def _predict_gated(self, batch, timer):
+        """Rows the gate rejects get a Non-Plant Object result; only the rest reach the full model"""
+        gate_start = time.perf_counter()
+        passed, plant_fractions = self.gate.check(batch, max_value=1.0)
+        gate_seconds = time.perf_counter() - gate_start
+        timer.add('gate', gate_seconds)
+        
+        results = [None] * len(batch)
+        for row in np.flatnonzero(~passed):
+            results[row] = self.gate_rejection(plant_fractions[row])
+        
+        passed_rows = np.flatnonzero(passed)
+        model_seconds = 0.0
+        if len(passed_rows):
+            model_start = time.perf_counter()
+            model_results = self._run_model(batch if passed.all() else batch[passed_rows], timer)
+            model_seconds = time.perf_counter() - model_start
+            for row, result in zip(passed_rows, model_results):
+                results[row] = result
+        
+        self.gate.record(len(batch), len(batch) - len(passed_rows), gate_seconds, model_seconds, len(passed_rows))
+        return results
+
+    def gate_rejection(self, plant_fraction):
+        """
+        The result for an image the gate rejected, shaped like interpret_prediction's non-tomato
+        output. top_predictions has the usual three entries: the gate's verdict, then the next
+        non-tomato classes of the taxonomy (Non-Plant Object classes first) at confidence 0.0,
+        since the model never scored them.
+        """
+        # Capped like enhance_confidence's strongest non-tomato boost
+        confidence = min(0.97, 1.0 - float(plant_fraction))
+        logging.info(f"Gate rejected image: plant-coloured fraction {plant_fraction:.2%}")
+        
+        non_tomato = [entry for entry in self.taxonomy.entries if not entry['is_tomato'] and entry['class_name'] != GATE_REJECT_LABEL]
+        non_tomato.sort(key=lambda entry: entry['plant_type'] != GATE_REJECT_LABEL)
+        top_predictions = [{'class': GATE_REJECT_LABEL, 'confidence': confidence}]
+        top_predictions += [{'class': entry['class_name'], 'confidence': 0.0} for entry in non_tomato[:2]]
+        return {
+            'predicted_class': GATE_REJECT_LABEL,
+            'confidence': confidence,
+            'is_tomato': False,
+            'tomato_type': None,
+            'health_status': None,
+            'plant_health_score': None,
+            'disease_type': None,
+            'recommendations': self.get_recommendations(GATE_REJECT_LABEL),
+            'top_predictions': top_predictions,
+            'plant_type': GATE_REJECT_LABEL,
+            'runtime_profile': self.runtime_profile,
+            'gate_rejected': True
+        }
+
+    def predict_disease_batch(self, img_paths, target_size=(224, 224), batch_size=32):
+        """
+        Make disease predictions for several images with one forward pass per chunk.
+        Returns one result per path, in order; unreadable images yield None.
+        """
+        pipeline = self.prefetch_pipeline(batch_size, target_size) if len(img_paths) > 1 else None
+        if pipeline is not None:
+            return [result for _, result in pipeline.run(img_paths)]
+        
+        results = [None] * len(img_paths)
+        
+        # Serve cache hits first; only the misses go through the model
+        cache_keys = {}
+        pending_positions = []
+        for position, img_path in enumerate(img_paths):
+            timer = StageTimer('tomato_prediction')
+            try:
+                with timer.stage('cache_lookup'):
+                    cache_key, cached = self._lookup_cache(img_path, time.time())
+            except OSError as e:
+                logging.error(f"Skipping image {describe_image(img_path)}: {e}")
+                continue
+            if cached is not None:
+                cached['timings'] = timer.finish()
+                results[position] = cached
+                continue
+            cache_keys[position] = cache_key
+            pending_positions.append(position)
+        
+        for chunk_start in range(0, len(pending_positions), batch_size):
+            chunk_positions = pending_positions[chunk_start:chunk_start + batch_size]
+            start_time = time.time()
+            timer = self.stage_timer()
+            
+            # Decode every readable image in the chunk into the shared batch buffer
+            batch, offsets = self.preprocess_batch([img_paths[position] for position in chunk_positions], target_size, timer)
+            valid_positions = [chunk_positions[offset] for offset in offsets]
+            
+            if not valid_positions:
+                continue
+            
+            try:
+                # One forward pass for the whole chunk
+                chunk_results = self.predict_preprocessed(batch, timer)
+            except Exception as e:
+                logging.error(f"Error predicting disease batch: {e}")
+                continue
+            
+            for position, result in zip(valid_positions, chunk_results):
+                results[position] = result
+            
+            # Report the amortized per-image cost of the chunk
+            per_image_time = (time.time() - start_time) / len(valid_positions)
+            timings = timer.finish(count=len(valid_positions))
+            for position in valid_positions:
+                if results[position] is not None:
+                    results[position]['inference_time'] = per_image_time
+                    results[position]['cache_hit'] = False
+                    results[position]['timings'] = dict(timings)
+                    if cache_keys[position] is not None:
+                        self.cache.put(cache_keys[position], results[position])
+            
+            logging.info(f"Batch of {len(valid_positions)} images processed in {per_image_time * len(valid_positions):.3f}s")
+        
+        return results
+
+def build_prediction_response(prediction_result, user_id, image_id):
+    """Shape a predict_disease result into the JSON payload returned to Node"""
+    if prediction_result is None:
+        return {
+            'success': False,
+            'error': 'Disease prediction failed'
+        }
+
+    # Prepare result with all fields needed for prediction_results table
+    result = {
+        'success': True,
+        # Fields for prediction_results table
+        'tomato_type': prediction_result['tomato_type'],
+        'health_status': prediction_result['health_status'],
+        'disease_type': prediction_result['disease_type'],
+        'confidence_score': float(prediction_result['confidence']) if prediction_result['confidence'] is not None else None,
+        'plant_health_score': float(prediction_result['plant_health_score']) if prediction_result['plant_health_score'] is not None else None,
+        'recommendations': prediction_result['recommendations'],
+        
+        # Additional information
+        'predicted_class': prediction_result['predicted_class'],
+        'is_tomato': prediction_result['is_tomato'],
+        'top_predictions': prediction_result['top_predictions'],
+        'inference_time': prediction_result['inference_time'],
+        'plant_type': prediction_result['plant_type'],  # Detailed plant type
+        'cache_hit': prediction_result.get('cache_hit', False),
+        'gate_rejected': prediction_result.get('gate_rejected', False),
+        'runtime_profile': prediction_result.get('runtime_profile'),
+        'timings': prediction_result.get('timings'),  # Per-stage milliseconds
+        'user_id': user_id,
+        'image_id': image_id
+    }
+    
+    if prediction_result['is_tomato']:
+        logging.info(f"Tomato Disease Identification Complete: {prediction_result['predicted_class']}")
+        logging.info(f"Plant Type: {prediction_result['plant_type']}")
+        logging.info(f"Tomato Type: {prediction_result['tomato_type']}")
+        logging.info(f"Health Status: {prediction_result['health_status']}")
+        logging.info(f"Plant Health Score: {prediction_result['plant_health_score']}/100")
+        logging.info(f"Disease Type: {prediction_result['disease_type']}")
+    else:
+        logging.info(f"Non-Tomato Detection: {prediction_result['plant_type']}")
+        logging.info("All tomato-specific fields set to null")
+    
+    logging.info(f"Confidence Score: {prediction_result['confidence']:.2%}")
+    logging.info(f"Recommendations: {len(prediction_result['recommendations'])} items")
+    
+    return result
+
+def resolve_image(request):
+    """
+    (source, error) for a request's image. Raw bytes (image_bytes from a binary frame, or
+    image_base64 in JSON) are decoded from memory; otherwise image_path must exist on disk.
+    """
+    if request.get('image_bytes') is not None:
+        return request['image_bytes'], None
+    if request.get('image_base64'):
+        try:
+            return base64.b64decode(request['image_base64'], validate=True), None
+        except (binascii.Error, ValueError) as e:
+            return None, f"Invalid image_base64: {str(e)}"
+    image_path = request.get('image_path')
+    if not image_path or not os.path.exists(image_path):
+        return None, f"Image file not found: {image_path}"
+    return image_path, None
+
+def resolve_single_image(request):
+    """
+    (request, error) for a single-image request, resolved once: any base64 is decoded into
+    image_bytes, so nothing downstream decodes it again. request is None when error is set.
+    """
+    source, error = resolve_image(request)
+    if error:
+        return None, error
+    if isinstance(source, bytes) and 'image_base64' in request:
+        request = {key: value for key, value in request.items() if key != 'image_base64'}
+        request['image_bytes'] = source
+    return request, None
+
+def single_image_request(request):
+    """
+    Resolve a single-image request once, before it is queued: returns the request with any
+    base64 already decoded into image_bytes, or None when it must go the ordinary way
+    (batches, missing files, bad base64 - process_request reports those).
+    """
+    if 'images' in request or 'image_paths' in request:
+        return None
+    return resolve_single_image(request)[0]
+
+def resolve_batch_images(input_data):
+    """
+    (user_id, images, sources, errors) for a multi-image request: sources and errors map each
+    image's index to its resolved source or to why it cannot be scored
+    """
+    user_id = input_data.get('user_id', 'unknown')
+    images = input_data.get('images')
+    if images is None:
+        images = [{'image_path': path} for path in input_data.get('image_paths', [])]
+    
+    logging.info(f"Processing batch of {len(images)} images for user: {user_id}")
+    
+    # Missing files and bad inline images are reported per image without aborting the batch
+    sources = {}
+    errors = {}
+    for index, img in enumerate(images):
+        source, error = resolve_image(img)
+        if error:
+            errors[index] = error
+        else:
+            sources[index] = source
+    return user_id, images, sources, errors
+
+def assemble_batch_response(user_id, images, errors, response_at):
+    """One batch payload from the per-image responses (by index) and the per-image errors"""
+    results = []
+    for index, img in enumerate(images):
+        if index in response_at:
+            result = response_at[index]
+        else:
+            result = {
+                'success': False,
+                'error': errors[index],
+                'image_id': img.get('image_id')
+            }
+        result['batch_index'] = index
+        results.append(result)
+    
+    successful_predictions = sum(1 for result in results if result['success'])
+    
+    return {
+        'success': True,
+        'results': results,
+        'total_images': len(images),
+        'successful_predictions': successful_predictions,
+        'failed_predictions': len(images) - successful_predictions,
+        'user_id': user_id
+    }
+
+def process_batch_request(classifier, input_data):
+    """
+    Run a multi-image request ({'images': [{image_path | image_base64, image_id}, ...]} or {'image_paths': [...]})
+    """
+    user_id, images, sources, errors = resolve_batch_images(input_data)
+    predictions = classifier.predict_disease_batch(list(sources.values())) if sources else []
+    response_at = {
+        index: build_prediction_response(prediction, user_id, images[index].get('image_id'))
+        for index, prediction in zip(sources, predictions)
+    }
+    return assemble_batch_response(user_id, images, errors, response_at)
+
+def schedule_batch_request(scheduler, input_data):
+    """
+    Queue every image of a multi-image request on the micro-batch scheduler, so the classifier is
+    only ever used from the scheduler thread; returns a Future of the same payload as process_batch_request
+    """
+    from concurrent.futures import Future
+    
+    user_id, images, sources, errors = resolve_batch_images(input_data)
+    response = Future()
+    response_at = {}
+    remaining = [len(sources)]
+    lock = threading.Lock()
+    
+    def collect(index, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = None
+            errors[index] = f"Disease prediction failed: {str(e)}"
+        with lock:
+            if result is not None:
+                response_at[index] = result
+            remaining[0] -= 1
+            done = remaining[0] == 0
+        if done:
+            response.set_result(assemble_batch_response(user_id, images, errors, response_at))
+    
+    if not sources:
+        response.set_result(assemble_batch_response(user_id, images, errors, response_at))
+    for index, source in sources.items():
+        request = {'image_bytes': source} if isinstance(source, bytes) else {'image_path': source}
+        request.update(user_id=user_id, image_id=images[index].get('image_id'))
+        scheduler.submit(request).add_done_callback(lambda future, index=index: collect(index, future))
+    return response
+
+def process_request(classifier, input_data):
+    """Validate one request dict and run it through an already loaded classifier"""
+    if 'images' in input_data or 'image_paths' in input_data:
+        return process_batch_request(classifier, input_data)
+    
+    user_id = input_data.get('user_id', 'unknown')
+    image_id = input_data.get('image_id')
+    
+    logging.info(f"Processing for user: {user_id}, image: {image_id}")
+    
+    image_source, error = resolve_image(input_data)
+    if error:
+        return {
+            'success': False,
+            'error': error
+        }
+    
+    # Identify disease
+    logging.info("Identifying plant disease...")
+    prediction_result = classifier.predict_disease(image_source)
+    
+    return build_prediction_response(prediction_result, user_id, image_id)
+
+def process_micro_batch(classifier, requests):
+    """Score a list of single-image requests collected by the micro-batch scheduler"""
+    predictions = classifier.predict_disease_batch([resolve_image(request)[0] for request in requests])
+    return [
+        build_prediction_response(prediction, request.get('user_id', 'unknown'), request.get('image_id'))
+        for request, prediction in zip(requests, predictions)
+    ]
+
+def read_manifest(stream):
+    """Yield (line_number, record) for each NDJSON manifest line; bad lines yield a record with 'error'"""
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("record must be a JSON object")
+        except ValueError as e:
+            record = {'error': f'Invalid manifest line: {str(e)}'}
+        yield line_number, record
+
+def chunk_records(records, chunk_size):
+    """Group an iterable into lists of at most chunk_size without reading ahead further"""
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def scorable_path(record):
+    """The record's image path if it can be scored, else None"""
+    image_path = record.get('image_path')
+    if 'error' in record or not image_path or not os.path.exists(image_path):
+        return None
+    return image_path
+
+def with_scorable_paths(records):
+    """Check each (line_number, record) once, yielding (line_number, record, scorable image path or None)"""
+    for line_number, record in records:
+        yield line_number, record, scorable_path(record)
+
+def score_chunks(classifier, entries, batch_size):
+    """Yield ((line_number, record, image_path), prediction) with one predict_disease_batch call per chunk"""
+    for chunk in chunk_records(entries, batch_size):
+        scorable = [entry for entry in chunk if entry[2]]
+        predictions = classifier.predict_disease_batch([image_path for _, _, image_path in scorable], batch_size=batch_size) if scorable else []
+        prediction_at = {line_number: prediction for (line_number, _, _), prediction in zip(scorable, predictions)}
+        for entry in chunk:
+            yield entry, prediction_at.get(entry[0])
+
+def stream_predictions(classifier, records, batch_size=8):
+    """Score (line_number, record) pairs chunk by chunk, yielding one response per record in manifest order"""
+    # The path is checked once per record and travels with it from here on
+    entries = with_scorable_paths(records)
+    pipeline = classifier.prefetch_pipeline(batch_size)
+    if pipeline is not None:
+        # Later chunks are read and decoded while the current one is on the model
+        scored = pipeline.run(entries, path_of=lambda entry: entry[2])
+    else:
+        scored = score_chunks(classifier, entries, batch_size)
+    
+    for (line_number, record, image_path), prediction in scored:
+        if prediction is not None or image_path:
+            response = build_prediction_response(prediction, record.get('user_id', 'unknown'), record.get('image_id'))
+        else:
+            response = {
+                'success': False,
+                'error': record.get('error') or f"Image file not found: {record.get('image_path')}",
+                'image_id': record.get('image_id')
+            }
+        response['manifest_line'] = line_number
+        yield response
+
+def run_stream(source='-', batch_size=8):
+    """Read an NDJSON manifest from stdin ('-') or a file and write one NDJSON result line per image"""
+    from worker_protocol import write_message
+    
+    classifier = TomatoClassifier()
+    stream = sys.stdin if source == '-' else open(source, 'r', encoding='utf-8')
+    start_time = time.time()
+    total = successful = 0
+    try:
+        for response in stream_predictions(classifier, read_manifest(stream), batch_size):
+            write_message(sys.stdout, response)
+            total += 1
+            successful += response['success']
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    
+    logging.info(f"Streamed {total} images ({successful} successful) in {time.time() - start_time:.2f}s")
+    pipeline = classifier.prefetch_pipeline(batch_size)
+    if pipeline is not None:
+        logging.info(f"Prefetch overlap ratio: {pipeline.stats()['overlap_ratio']:.2f}")
+
+def run_binary_stdin():
+    """
+    Answer length-prefixed binary frames on stdin ([len][request JSON][len][image bytes], see
+    worker_protocol.read_frames) with one JSON result line each; the image never touches disk.
+    """
+    from worker_protocol import read_frames, write_message
+    
+    classifier = None
+    for request, image_bytes in read_frames(sys.stdin.buffer):
+        # The model is only loaded once there is something to score
+        if classifier is None:
+            classifier = TomatoClassifier()
+        request['image_bytes'] = image_bytes
+        write_message(sys.stdout, process_request(classifier, request))
+
+def cache_stats(classifier):
+    return {'cache': classifier.cache.stats()} if classifier.cache is not None else {}
+
+def prefetch_stats(classifier):
+    """Overlap statistics of every prefetch pipeline the classifier has used"""
+    if not classifier._prefetch_pipelines:
+        return {}
+    return {'prefetch': [pipeline.stats() for pipeline in classifier._prefetch_pipelines.values()]}
+
+def worker_stats(classifier):
+    """Cache, prefetch and gate counters for health/stats replies"""
+    stats = {**cache_stats(classifier), **prefetch_stats(classifier)}
+    if classifier.gate is not None:
+        stats['gate'] = classifier.gate.stats()
+    return stats
+
+def serve(micro_batch=False):
+    """Long-lived worker: load the model once, then answer JSON-lines requests on stdin"""
+    from worker_protocol import serve_lines
+    
+    classifier = TomatoClassifier()
+    worker_info = {
+        'worker': 'tomato_prediction',
+        'model_loaded': True,
+        'num_classes': classifier.num_classes,
+        'backend': classifier.backend,
+        'decoder': classifier.decoder,
+        'runtime_profile': classifier.runtime_profile,
+        'import_report': import_report()
+    }
+    
+    if not micro_batch:
+        serve_lines(lambda request: process_request(classifier, request), worker_info, stats=lambda: worker_stats(classifier))
+        return
+    
+    from batch_scheduler import MicroBatchScheduler
+    
+    # Concurrent single-image requests are grouped into one model.predict
+    scheduler = MicroBatchScheduler(
+        lambda requests: process_micro_batch(classifier, requests),
+        max_batch_size=int(os.environ.get('TOMATO_MAX_BATCH_SIZE', 16)),
+        max_wait_ms=float(os.environ.get('TOMATO_MAX_WAIT_MS', 10))
+    )
+    worker_info['micro_batch'] = True
+    
+    def handle_request(request):
+        # Batches go through the scheduler too: the classifier's batch buffer must not be shared between threads
+        if 'images' in request or 'image_paths' in request:
+            return schedule_batch_request(scheduler, request)
+        single = single_image_request(request)
+        if single is None:
+            return process_request(classifier, request)
+        return scheduler.submit(single)
+    
+    try:
+        serve_lines(handle_request, worker_info, stats=lambda: {'scheduler': scheduler.stats(), **worker_stats(classifier)})
+    finally:
+        scheduler.shutdown()
+
+def serve_pool(num_workers=None, zygote=False):
+    """
+    Long-lived worker fronting a pool of classifier processes: an InferencePool of pinned
+    processes, or with zygote=True a ZygotePool of workers forked from one loaded model
+    """
+    from concurrent.futures import Future
+    from worker_protocol import serve_lines
+    
+    if zygote:
+        from zygote_pool import ZygotePool
+        pool = ZygotePool(num_workers)
+    else:
+        from inference_pool import InferencePool
+        pool = InferencePool(num_workers)
+    worker_info = {
+        'worker': 'tomato_prediction',
+        'model_loaded': True,
+        'pool_mode': 'zygote' if zygote else 'pinned',
+        'pool_workers': pool.num_workers,
+        'decoder': pool.decoder,
+        'import_report': import_report()
+    }
+    
+    def handle_request(request):
+        single = single_image_request(request)
+        if single is None:
+            # The pool exposes predict_disease/predict_disease_batch, so the usual request path works as-is
+            return process_request(pool, request)
+        
+        response = Future()
+        
+        def respond(prediction):
+            try:
+                response.set_result(build_prediction_response(prediction.result(), request.get('user_id', 'unknown'), request.get('image_id')))
+            except Exception as e:
+                response.set_exception(e)
+        
+        pool.submit(resolve_image(single)[0]).add_done_callback(respond)
+        return response
+    
+    try:
+        serve_lines(handle_request, worker_info, stats=lambda: {'pool': pool.stats()})
+    finally:
+        pool.shutdown()
+
+def convert_to_tflite(model_path='models/final_fast_tomato_model.h5', output_path=None, optimize=False):
+    """Export the Keras disease model to a TFLite flatbuffer next to it"""
+    classifier = TomatoClassifier(model_path, backend='keras')
+    tf = timed_import('tensorflow')
+    
+    converter = tf.lite.TFLiteConverter.from_keras_model(classifier.model)
+    if optimize:
+        # Dynamic-range quantization: smaller file, usually the same top-1
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    tflite_model = converter.convert()
+    
+    output_path = output_path or os.path.splitext(classifier.model_path)[0] + '.tflite'
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+    
+    logging.info(f"TFLite model written to {output_path}")
+    return {
+        'success': True,
+        'output_path': output_path,
+        'size_bytes': len(tflite_model),
+        'optimized': optimize
+    }
+
+def export_taxonomy(model_path='models/final_fast_tomato_model.h5', output_path=None):
+    """Compile the class-name rules into the taxonomy sidecar shipped next to the model"""
+    from class_taxonomy import ClassTaxonomy, taxonomy_path_for
+    
+    classifier = TomatoClassifier(model_path)
+    taxonomy = ClassTaxonomy.compile(classifier._auto_detect_class_names(), classifier)
+    
+    output_path = output_path or taxonomy_path_for(classifier.model_path)
+    taxonomy.save(output_path)
+    return {
+        'success': True,
+        'output_path': output_path,
+        'num_classes': len(taxonomy),
+        'version': taxonomy.version
+    }
+
+def compare_backends(img_paths, model_path='models/final_fast_tomato_model.h5'):
+    """Top-1 agreement and per-image latency of the TFLite backend against Keras"""
+    classifiers = {backend: TomatoClassifier(model_path, backend=backend) for backend in TomatoClassifier.BACKENDS}
+    
+    predictions = {}
+    latencies = {}
+    for backend, classifier in classifiers.items():
+        predictions[backend] = []
+        start_time = time.time()
+        for img_path in img_paths:
+            result = classifier.predict_disease(img_path)
+            predictions[backend].append(result['predicted_class'] if result else None)
+        latencies[backend] = (time.time() - start_time) / max(len(img_paths), 1)
+    
+    agreed = sum(1 for keras_class, tflite_class in zip(predictions['keras'], predictions['tflite'])
+                 if keras_class is not None and keras_class == tflite_class)
+    
+    return {
+        'success': True,
+        'images': len(img_paths),
+        'top1_agreement': agreed / len(img_paths) if img_paths else None,
+        'mean_latency': latencies,
+        'disagreements': [
+            {'image_path': img_path, 'keras': keras_class, 'tflite': tflite_class}
+            for img_path, keras_class, tflite_class in zip(img_paths, predictions['keras'], predictions['tflite'])
+            if keras_class != tflite_class
+        ]
+    }
+
+def decode_parity(img_paths, target_size=(224, 224), tolerance=0.05):
+    """Compare the OpenCV decode path against the PIL/keras-equivalent path pixel by pixel"""
+    images = []
+    for img_path in img_paths:
+        reference = decode_image_pil(img_path, target_size).astype(np.float32) / 255.0
+        candidate = decode_image_opencv(img_path, target_size).astype(np.float32) / 255.0
+        difference = np.abs(reference - candidate)
+        images.append({
+            'image_path': img_path,
+            'max_abs_diff': float(difference.max()),
+            'mean_abs_diff': float(difference.mean()),
+            'within_tolerance': bool(difference.mean() <= tolerance)
+        })
+    
+    return {
+        'success': True,
+        'tolerance': tolerance,
+        'all_within_tolerance': all(image['within_tolerance'] for image in images),
+        'images': images
+    }
+
 def main():
     """Main function for tomato disease identification"""
     try:
+        # --intra-op-threads N --inter-op-threads N --onednn on|off --cpu-affinity 0-3 may follow any mode
+        profile_args_to_env(sys.argv)
+        
         if len(sys.argv) < 2:
             result = {
                 'success': False,
@@ -653,69 +1591,97 @@ def main():
             print(json.dumps(result))
             return
         
-        # Parse input data
-        input_data = json.loads(sys.argv[1])
-        image_path = input_data.get('image_path')
-        user_id = input_data.get('user_id', 'unknown')
-        image_id = input_data.get('image_id')
+        if sys.argv[1] == '--import-report':
+            # Import everything a prediction needs (without loading the model) and time it
+            timed_import('PIL.Image')
+            if os.environ.get('TOMATO_BACKEND', 'keras') == 'tflite':
+                TFLiteModel._import_interpreter()
+            else:
+                timed_import('tensorflow')
+                timed_import('tensorflow.keras.models')
+            print(json.dumps({'success': True, 'script': 'tomato_prediction', **import_report()}))
+            return
         
-        logging.info(f"Processing for user: {user_id}, image: {image_id}")
+        if sys.argv[1] == '--convert-tflite':
+            # --convert-tflite [output_path] [--optimize]
+            args = [arg for arg in sys.argv[2:] if arg != '--optimize']
+            result = convert_to_tflite(output_path=args[0] if args else None, optimize='--optimize' in sys.argv[2:])
+            print(json.dumps(result))
+            return
         
-        if not image_path or not os.path.exists(image_path):
-            result = {
-                'success': False,
-                'error': f'Image file not found: {image_path}'
-            }
+        if sys.argv[1] == '--export-taxonomy':
+            # --export-taxonomy [output_path]
+            print(json.dumps(export_taxonomy(output_path=sys.argv[2] if len(sys.argv) > 2 else None)))
+            return
+        
+        if sys.argv[1] == '--compare-backends':
+            # --compare-backends image1.jpg image2.jpg ...
+            print(json.dumps(compare_backends(sys.argv[2:]), default=str))
+            return
+        
+        if sys.argv[1] == '--decode-parity':
+            # --decode-parity image1.jpg image2.jpg ... (mean-abs-diff tolerance via DECODE_TOLERANCE)
+            tolerance = float(os.environ.get('DECODE_TOLERANCE', 0.05))
+            print(json.dumps(decode_parity(sys.argv[2:], tolerance=tolerance)))
+            return
+        
+        if sys.argv[1] == '--benchmark-pool':
+            # --benchmark-pool image1.jpg ... (TOMATO_POOL_WORKERS, BENCHMARK_THREADS, BENCHMARK_REQUESTS)
+            from inference_pool import benchmark_pool
+            workers = int(os.environ.get('TOMATO_POOL_WORKERS', 0)) or None
+            result = benchmark_pool(sys.argv[2:], num_workers=workers,
+                                    threads=int(os.environ.get('BENCHMARK_THREADS', 8)),
+                                    requests=int(os.environ.get('BENCHMARK_REQUESTS', 64)))
             print(json.dumps(result))
             return
         
-        # Initialize classifier
-        classifier = TomatoClassifier()
+        if sys.argv[1] == '--stream':
+            # --stream [manifest.ndjson | -] [--batch-size N]: one {image_path, user_id, image_id} per line
+            args = sys.argv[2:]
+            batch_size = int(os.environ.get('TOMATO_STREAM_BATCH_SIZE', 8))
+            if '--batch-size' in args:
+                batch_size = int(args[args.index('--batch-size') + 1])
+                del args[args.index('--batch-size'):args.index('--batch-size') + 2]
+            run_stream(args[0] if args else '-', batch_size)
+            return
         
-        # Identify disease
-        logging.info("Identifying plant disease...")
-        prediction_result = classifier.predict_disease(image_path)
+        if sys.argv[1] == '--binary-stdin':
+            # Raw image bytes instead of an image_path: length-prefixed frames on stdin
+            run_binary_stdin()
+            return
         
-        if prediction_result is None:
-            result = {
-                'success': False,
-                'error': 'Disease prediction failed'
-            }
-        else:
-            # Prepare result with all fields needed for prediction_results table
-            result = {
-                'success': True,
-                # Fields for prediction_results table
-                'tomato_type': prediction_result['tomato_type'],
-                'health_status': prediction_result['health_status'],
-                'disease_type': prediction_result['disease_type'],
-                'confidence_score': float(prediction_result['confidence']) if prediction_result['confidence'] is not None else None,
-                'plant_health_score': float(prediction_result['plant_health_score']) if prediction_result['plant_health_score'] is not None else None,
-                'recommendations': prediction_result['recommendations'],
-                
-                # Additional information
-                'predicted_class': prediction_result['predicted_class'],
-                'is_tomato': prediction_result['is_tomato'],
-                'top_predictions': prediction_result['top_predictions'],
-                'inference_time': prediction_result['inference_time'],
-                'plant_type': prediction_result['plant_type'],  # Detailed plant type
-                'user_id': user_id,
-                'image_id': image_id
-            }
-            
-            if prediction_result['is_tomato']:
-                logging.info(f"Tomato Disease Identification Complete: {prediction_result['predicted_class']}")
-                logging.info(f"Plant Type: {prediction_result['plant_type']}")
-                logging.info(f"Tomato Type: {prediction_result['tomato_type']}")
-                logging.info(f"Health Status: {prediction_result['health_status']}")
-                logging.info(f"Plant Health Score: {prediction_result['plant_health_score']}/100")
-                logging.info(f"Disease Type: {prediction_result['disease_type']}")
-            else:
-                logging.info(f"Non-Tomato Detection: {prediction_result['plant_type']}")
-                logging.info("All tomato-specific fields set to null")
-            
-            logging.info(f"Confidence Score: {prediction_result['confidence']:.2%}")
-            logging.info(f"Recommendations: {len(prediction_result['recommendations'])} items")
+        if sys.argv[1] == '--serve':
+            # Optional: --serve --micro-batch (TOMATO_MAX_BATCH_SIZE / TOMATO_MAX_WAIT_MS)
+            #           --serve --pool [N] (N pinned worker processes; defaults to one per core)
+            #           --serve --zygote [N] (N workers forked from one loaded model)
+            for pool_flag in ('--pool', '--zygote'):
+                if pool_flag in sys.argv[2:]:
+                    pool_args = sys.argv[sys.argv.index(pool_flag) + 1:]
+                    serve_pool(int(pool_args[0]) if pool_args and pool_args[0].isdigit() else None,
+                               zygote=pool_flag == '--zygote')
+                    return
+            serve(micro_batch='--micro-batch' in sys.argv[2:])
+            return
+        
+        # Parse input data (image_path, or the image itself as image_base64)
+        input_data = json.loads(sys.argv[1])
+        is_batch = 'images' in input_data or 'image_paths' in input_data
+        
+        if not is_batch:
+            # Resolved before the model loads, so bad input fails fast; any base64 is decoded
+            # here once and handed on as image_bytes
+            input_data, error = resolve_single_image(input_data)
+            if error:
+                result = {
+                    'success': False,
+                    'error': error
+                }
+                print(json.dumps(result))
+                return
+        
+        # Initialize classifier
+        classifier = TomatoClassifier()
+        result = process_request(classifier, input_data)
         
         # ONLY print JSON to stdout - this is crucial!
         print(json.dumps(result, default=str))
@@ -0,0 +1,233 @@
+import json
+import sys
+import os
+import time
+import struct
+import logging
+import threading
+import socketserver
+from concurrent.futures import Future
+
+from stage_metrics import METRICS
+
+
+def write_message(stream, message):
+    """Write one JSON message as a single line and flush it immediately"""
+    stream.write(json.dumps(message, default=str) + '\n')
+    stream.flush()
+
+
+# Binary frames: big-endian uint32 length, then that many bytes
+FRAME_LENGTH = struct.Struct('>I')
+
+
+def read_frames(stream):
+    """
+    Yield (request, image_bytes) from length-prefixed binary input: each frame is a
+    length-prefixed JSON request followed by the length-prefixed raw image file bytes.
+    Stops cleanly at end of stream; a frame cut short raises EOFError.
+    """
+    while True:
+        request_bytes = _read_part(stream, allow_eof=True)
+        if request_bytes is None:
+            return
+        image_bytes = _read_part(stream)
+        yield json.loads(request_bytes.decode('utf-8')), image_bytes
+
+
+def _read_part(stream, allow_eof=False):
+    header = _read_exactly(stream, FRAME_LENGTH.size)
+    if not header and allow_eof:
+        return None
+    if len(header) < FRAME_LENGTH.size:
+        raise EOFError("Truncated frame length")
+    (length,) = FRAME_LENGTH.unpack(header)
+    payload = _read_exactly(stream, length)
+    if len(payload) < length:
+        raise EOFError(f"Truncated frame: expected {length} bytes, got {len(payload)}")
+    return payload
+
+
+def _read_exactly(stream, size):
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def serve_lines(handle_request, worker_info, input_stream=None, output_stream=None, stats=None):
+    """
+    Serve newline-delimited JSON requests until stdin closes or a shutdown arrives.
+
+    Every request is one JSON object per line. Requests may carry an 'id' which is
+    echoed back on the response so the caller can match results to requests.
+    Control messages use 'type': 'health', 'metrics' or 'shutdown'; anything else is passed
+    to handle_request, which returns the usual result dict or a Future resolving
+    to it. Futures are answered as they complete, so responses may arrive out of
+    order. stats is an optional callable whose dict is added to health replies.
+    Returns True when the peer asked the worker to shut down.
+    """
+    input_stream = input_stream or sys.stdin
+    output_stream = output_stream or sys.stdout
+
+    started_at = time.time()
+    requests_served = 0
+    shutdown_requested = False
+    write_lock = threading.Lock()
+    outstanding = set()
+    outstanding_changed = threading.Condition()
+
+    def send(message):
+        with write_lock:
+            write_message(output_stream, message)
+
+    def send_result(request_id, response):
+        response['type'] = 'result'
+        response['id'] = request_id
+        send(response)
+
+    def failure(e):
+        logging.error(f"Worker request failed: {e}")
+        return {
+            'success': False,
+            'error': f'Worker request failed: {str(e)}'
+        }
+
+    def on_future_done(request_id, future):
+        try:
+            response = future.result()
+        except Exception as e:
+            response = failure(e)
+        send_result(request_id, response)
+        with outstanding_changed:
+            outstanding.discard(future)
+            outstanding_changed.notify_all()
+
+    def wait_for_outstanding():
+        with outstanding_changed:
+            while outstanding:
+                outstanding_changed.wait()
+
+    send({'type': 'ready', 'pid': os.getpid(), **worker_info})
+    logging.info("Worker ready - waiting for requests")
+
+    for line in input_stream:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+        except ValueError as e:
+            send_result(None, {
+                'success': False,
+                'error': f'Invalid JSON request: {str(e)}'
+            })
+            continue
+
+        request_id = request.get('id')
+        request_type = request.get('type', 'predict')
+
+        if request_type == 'health':
+            response = {
+                'type': 'health',
+                'status': 'ok',
+                'pid': os.getpid(),
+                'uptime': time.time() - started_at,
+                'requests_served': requests_served,
+                'requests_in_flight': len(outstanding),
+                **worker_info
+            }
+            if stats is not None:
+                response.update(stats())
+            response['id'] = request_id
+            send(response)
+        elif request_type == 'metrics':
+            # Per-stage latency histograms in Prometheus text format
+            send({
+                'type': 'metrics',
+                'id': request_id,
+                'content_type': 'text/plain; version=0.0.4',
+                'text': METRICS.prometheus_text()
+            })
+        elif request_type == 'shutdown':
+            logging.info("Worker shutdown requested")
+            wait_for_outstanding()
+            send({'type': 'shutdown', 'id': request_id})
+            shutdown_requested = True
+            break
+        else:
+            requests_served += 1
+            try:
+                response = handle_request(request)
+            except Exception as e:
+                response = failure(e)
+
+            if isinstance(response, Future):
+                with outstanding_changed:
+                    outstanding.add(response)
+                response.add_done_callback(lambda future, request_id=request_id: on_future_done(request_id, future))
+            else:
+                send_result(request_id, response)
+
+    wait_for_outstanding()
+    logging.info(f"Worker exiting after {requests_served} requests")
+    return shutdown_requested
+
+
+def serve_unix_socket(socket_path, handle_request, worker_info):
+    """
+    Serve the same JSON-lines protocol on a Unix domain socket.
+
+    Each connection gets its own ready message. Several clients may stay connected
+    at once, but requests are handled one at a time because the models are shared.
+    """
+    request_lock = threading.Lock()
+
+    def locked_handle_request(request):
+        with request_lock:
+            return handle_request(request)
+
+    class LineHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            text_in = (line.decode('utf-8') for line in self.rfile)
+            text_out = _SocketWriter(self.wfile)
+            try:
+                if serve_lines(locked_handle_request, worker_info, text_in, text_out):
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+            except (BrokenPipeError, ConnectionResetError):
+                logging.info("Socket client disconnected")
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    server = socketserver.ThreadingUnixStreamServer(socket_path, LineHandler)
+    server.daemon_threads = True
+    logging.info(f"Worker listening on unix socket: {socket_path}")
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+class _SocketWriter:
+    """Minimal text stream over a socket file so serve_lines can write to it"""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text):
+        self.wfile.write(text.encode('utf-8'))
+
+    def flush(self):
+        self.wfile.flush()
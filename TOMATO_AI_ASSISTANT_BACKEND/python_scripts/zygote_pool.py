@@ -0,0 +1,437 @@
+import gc
+import os
+import time
+import queue
+import signal
+import logging
+import itertools
+import threading
+import multiprocessing
+from multiprocessing import reduction
+from multiprocessing.connection import Connection
+from concurrent.futures import Future
+
+from stage_metrics import METRICS
+
+DEFAULT_MODEL_PATH = 'models/final_fast_tomato_model.h5'
+
+# Set in the parent before it forks the zygote; every worker inherits it copy-on-write
+_ZYGOTE = {'classifier': None}
+
+
+def memory_usage(pid):
+    """
+    Resident memory of one process in MB from /proc/<pid>/smaps_rollup: rss counts shared pages
+    in full, pss splits them between the processes sharing them, uss is what only this process holds.
+    """
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1])
+    except OSError:
+        return None
+    return {
+        'rss_mb': fields.get('Rss', 0) / 1024,
+        'pss_mb': fields.get('Pss', 0) / 1024,
+        'uss_mb': (fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)) / 1024
+    }
+
+
+def _receive_tasks(tasks):
+    """Block for the next task, then take whatever else is already waiting; None marks the end"""
+    try:
+        received = [tasks.recv()]
+        # Whatever else is already queued for this worker goes through the model together
+        while tasks.poll():
+            received.append(tasks.recv())
+    except EOFError:
+        # The pool process is gone, so nobody is left to send work or read results
+        received.append(None)
+    return received
+
+
+def _worker_main(worker_index, tasks, result_queue):
+    """Forked worker: serve its task pipe with the classifier inherited from the zygote"""
+    classifier = _ZYGOTE['classifier']
+    result_queue.put(('ready', worker_index, os.getpid()))
+
+    running = True
+    while running:
+        batch = _receive_tasks(tasks)
+        if None in batch:
+            running = False
+            batch = [task for task in batch if task is not None]
+        if not batch:
+            continue
+
+        try:
+            if len(batch) == 1:
+                results = [classifier.predict_disease(batch[0][1])]
+            else:
+                results = classifier.predict_disease_batch([source for _, source in batch])
+        except Exception as e:
+            logging.error(f"Zygote worker {worker_index} inference failed: {e}")
+            results = [None] * len(batch)
+
+        for (request_id, _), result in zip(batch, results):
+            result_queue.put(('result', worker_index, request_id, result))
+
+
+def _run_worker(worker_index, task_fd, result_queue):
+    """Body of a process the zygote forked; never returns"""
+    exit_code = 0
+    try:
+        _worker_main(worker_index, Connection(task_fd), result_queue)
+        # Flush the results still in the queue's feeder thread before the process goes
+        result_queue.close()
+        result_queue.join_thread()
+    except BaseException:
+        logging.exception(f"Zygote worker {worker_index} crashed")
+        exit_code = 1
+    finally:
+        os._exit(exit_code)
+
+
+def _zygote_main(conn, pool_conn, result_queue, shutdown_timeout=30):
+    """
+    The zygote: a single-threaded process that forks every worker.
+
+    The pool process runs a collector thread, queue feeder threads and whatever its
+    host started, and a fork copies any lock one of them holds. The zygote never
+    starts a thread, so it is always safe to fork. It answers ('fork', worker_index)
+    followed by the read end of the worker's task pipe, and reports
+    ('forked', worker_index, pid) and ('exited', worker_index, pid, exit_code) back.
+    """
+    pool_conn.close()
+    children = {}
+
+    def report(message):
+        try:
+            conn.send(message)
+        except OSError:
+            pass
+
+    deadline = None
+    while deadline is None or children:
+        if deadline is None and conn.poll(0.2):
+            try:
+                command = conn.recv()
+            except EOFError:
+                command = ('shutdown',)
+            if command[0] == 'fork':
+                worker_index = command[1]
+                task_fd = reduction.recv_handle(conn)
+                pid = os.fork()
+                if pid == 0:
+                    conn.close()
+                    _run_worker(worker_index, task_fd, result_queue)
+                os.close(task_fd)
+                children[pid] = worker_index
+                report(('forked', worker_index, pid))
+            elif command[0] == 'shutdown':
+                # Workers exit once they have answered what they have; stragglers are killed
+                deadline = time.time() + shutdown_timeout
+        elif deadline is not None:
+            if time.time() > deadline:
+                for pid in children:
+                    os.kill(pid, signal.SIGTERM)
+                deadline = float('inf')
+            time.sleep(0.1)
+
+        while children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            worker_index = children.pop(pid, None)
+            if worker_index is not None:
+                report(('exited', worker_index, pid, os.waitstatus_to_exitcode(status)))
+
+
+class ZygotePool:
+    """
+    Pre-fork worker pool: the parent loads the classifier once, then forks a zygote
+    process that forks N workers.
+
+    Workers inherit the interpreter, weights and class taxonomy copy-on-write, so
+    each one only adds the memory it writes to, and a crashed worker is replaced by
+    having the zygote fork again instead of loading a model. The parent only forks
+    once, before it starts any thread of its own; every later fork comes from the
+    single-threaded zygote, so no worker inherits a lock some thread was holding.
+    Requests go to the live worker with the fewest in flight; results are the usual
+    prediction dicts.
+
+    The pool always runs the tflite backend. TensorFlow's runtime threads do not
+    survive fork, so a Keras model cannot be shared and each worker would load its
+    own copy; asking for TOMATO_BACKEND=keras raises instead of silently losing that.
+    """
+
+    def __init__(self, num_workers=None, model_path=DEFAULT_MODEL_PATH, respawn=True, startup_timeout=300):
+        from inference_pool import available_cores
+        from tomato_prediction import TomatoClassifier
+
+        self.backend = os.environ.get('TOMATO_BACKEND', 'tflite')
+        if self.backend != 'tflite':
+            raise ValueError(f"The zygote pool needs TOMATO_BACKEND=tflite to share weights, got '{self.backend}' (use --pool for Keras)")
+        self.decoder = os.environ.get('TOMATO_DECODER', 'pil')
+        self.num_workers = num_workers or len(available_cores())
+        self.respawn = respawn
+
+        _ZYGOTE['classifier'] = TomatoClassifier(model_path, backend=self.backend)
+
+        # Keep the garbage collector from touching (and so copying) every inherited object
+        gc.collect()
+        gc.freeze()
+
+        self._context = multiprocessing.get_context('fork')
+        self._result_queue = self._context.Queue()
+        self._condition = threading.Condition()
+        self._pending = {}
+        self._request_ids = itertools.count()
+        self._shutting_down = False
+        self.respawns = 0
+        self.last_respawn_ms = None
+
+        if threading.active_count() > 1:
+            logging.warning(f"Forking the zygote with {threading.active_count()} threads running; create the pool before starting threads")
+        self._zygote_conn, zygote_end = self._context.Pipe()
+        self._zygote_lock = threading.Lock()
+        self._zygote = self._context.Process(
+            target=_zygote_main,
+            args=(zygote_end, self._zygote_conn, self._result_queue),
+            name='tomato-zygote',
+            daemon=True
+        )
+        self._zygote.start()
+        zygote_end.close()
+
+        self._workers = [self._fork_worker(worker_index) for worker_index in range(self.num_workers)]
+        self._wait_until_ready(startup_timeout)
+        self._collector = threading.Thread(target=self._collect_results, name='zygote-results', daemon=True)
+        self._collector.start()
+        logging.info(f"Zygote pool ready: {self.num_workers} forked workers sharing one tflite model")
+
+    def _fork_worker(self, worker_index, respawns=0):
+        """Have the zygote fork one worker; returns its bookkeeping, whose pid arrives with the 'forked' report"""
+        reader, writer = self._context.Pipe(duplex=False)
+        worker = {
+            'pid': None,
+            'task_conn': writer,
+            'send_lock': threading.Lock(),
+            'forked_at': time.perf_counter(),
+            'exitcode': None,
+            'ready': False,
+            'in_flight': 0,
+            'completed': 0,
+            'respawns': respawns,
+            'alive': True
+        }
+        with self._zygote_lock:
+            self._zygote_conn.send(('fork', worker_index))
+            reduction.send_handle(self._zygote_conn, reader.fileno(), self._zygote.pid)
+        reader.close()
+        return worker
+
+    def _poll_zygote(self):
+        """Apply the zygote's fork and exit reports to the worker table"""
+        try:
+            while self._zygote_conn.poll():
+                report = self._zygote_conn.recv()
+                with self._condition:
+                    worker = self._workers[report[1]]
+                    if report[0] == 'forked' and worker['pid'] is None:
+                        worker['pid'] = report[2]
+                    elif report[0] == 'exited' and worker['pid'] == report[2]:
+                        # The zygote always reports a fork before that worker's exit
+                        worker['exitcode'] = report[3]
+        except (EOFError, OSError):
+            pass
+
+    def _exit_code(self, worker_index):
+        """The worker's exit code, or the zygote's if it died first; None while the worker runs"""
+        self._poll_zygote()
+        exit_code = self._workers[worker_index]['exitcode']
+        if exit_code is None and not self._zygote.is_alive():
+            return self._zygote.exitcode
+        return exit_code
+
+    def _wait_until_ready(self, timeout):
+        from inference_pool import wait_for_workers
+
+        try:
+            wait_for_workers(self._result_queue, self.num_workers, self._exit_code, self._mark_ready, timeout, label='Zygote')
+        except RuntimeError:
+            self.shutdown()
+            raise
+
+    def _mark_ready(self, worker_index, pid):
+        with self._condition:
+            worker = self._workers[worker_index]
+            worker['pid'] = pid
+            worker['ready'] = True
+            worker['ready_ms'] = (time.perf_counter() - worker['forked_at']) * 1000
+            if worker['respawns']:
+                self.last_respawn_ms = worker['ready_ms']
+            self._condition.notify_all()
+        logging.info(f"Zygote worker {worker_index} ready (pid {pid}) {worker['ready_ms']:.1f}ms after fork")
+
+    def submit(self, img_path):
+        """Queue one image (path or raw bytes) on the least busy worker; returns a Future of the prediction result"""
+        future = Future()
+        with self._condition:
+            while True:
+                candidates = [worker for worker in self._workers if worker['alive'] and worker['ready']]
+                if candidates:
+                    break
+                if self._shutting_down:
+                    raise RuntimeError("Zygote pool is shut down")
+                if not self._zygote.is_alive() and not any(worker['alive'] for worker in self._workers):
+                    raise RuntimeError("No live zygote workers and no zygote to fork more")
+                self._condition.wait(timeout=1.0)
+            worker = min(candidates, key=lambda candidate: candidate['in_flight'])
+            worker['in_flight'] += 1
+            request_id = next(self._request_ids)
+            self._pending[request_id] = (future, worker)
+        try:
+            with worker['send_lock']:
+                worker['task_conn'].send((request_id, img_path))
+        except OSError as e:
+            # The worker died under us; its exit report fails whatever else it had
+            with self._condition:
+                if self._pending.pop(request_id, None) is not None:
+                    worker['in_flight'] -= 1
+            future.set_exception(RuntimeError(f"Zygote worker could not take the request: {e}"))
+        return future
+
+    def predict_disease(self, img_path):
+        """Blocking single prediction, so the pool can stand in for a TomatoClassifier"""
+        return self.submit(img_path).result()
+
+    def predict_disease_batch(self, img_paths):
+        futures = [self.submit(img_path) for img_path in img_paths]
+        return [future.result() for future in futures]
+
+    def _collect_results(self):
+        while True:
+            try:
+                message = self._result_queue.get(timeout=0.2)
+            except queue.Empty:
+                message = False
+            # Every pass, busy or idle, so a dead worker is noticed even while others keep answering
+            self._check_workers()
+            if message is None:
+                return
+            if message is False:
+                continue
+
+            if message[0] == 'ready':
+                self._mark_ready(message[1], message[2])
+                continue
+
+            _, worker_index, request_id, result = message
+            with self._condition:
+                entry = self._pending.pop(request_id, None)
+                if entry is not None:
+                    entry[1]['in_flight'] -= 1
+                    entry[1]['completed'] += 1
+            if entry is None:
+                # Already failed by _check_workers
+                continue
+            if result is not None and result.get('timings'):
+                # The worker's own stage histograms die with it; keep them in this process's metrics
+                METRICS.observe('tomato_prediction', {
+                    stage[:-3]: milliseconds / 1000 for stage, milliseconds in result['timings'].items()
+                })
+            entry[0].set_result(result)
+
+    def _check_workers(self):
+        """Take workers the zygote reported dead out of rotation, fail their requests and have the zygote fork replacements"""
+        self._poll_zygote()
+        failed = []
+        with self._condition:
+            if self._shutting_down:
+                return
+            for worker_index, worker in enumerate(self._workers):
+                if not worker['alive'] or worker['exitcode'] is None:
+                    continue
+                logging.error(f"Zygote worker {worker_index} exited with code {worker['exitcode']}")
+                worker['alive'] = False
+                with worker['send_lock']:
+                    worker['task_conn'].close()
+                for request_id, (future, owner) in list(self._pending.items()):
+                    if owner is worker:
+                        del self._pending[request_id]
+                        failed.append((future, worker_index))
+                if self.respawn and self._zygote.is_alive():
+                    # Only a message to the zygote, so it is fine to send under the lock
+                    self._workers[worker_index] = self._fork_worker(worker_index, worker['respawns'] + 1)
+                    self.respawns += 1
+                    logging.info(f"Zygote worker {worker_index} respawn requested")
+            self._condition.notify_all()
+        for future, worker_index in failed:
+            future.set_exception(RuntimeError(f"Zygote worker {worker_index} died"))
+
+    def stats(self):
+        """Queue and respawn counters plus per-process memory; low worker uss means the sharing works"""
+        with self._condition:
+            workers = [
+                {
+                    'pid': worker['pid'],
+                    'alive': worker['alive'],
+                    'ready': worker['ready'],
+                    'ready_ms': worker.get('ready_ms'),
+                    'queue_depth': worker['in_flight'],
+                    'completed': worker['completed'],
+                    'respawns': worker['respawns']
+                }
+                for worker in self._workers
+            ]
+            requests_in_flight = len(self._pending)
+        for worker in workers:
+            worker['memory'] = memory_usage(worker['pid']) if worker['pid'] else None
+        return {
+            'backend': self.backend,
+            'parent_memory': memory_usage(os.getpid()),
+            'zygote': {
+                'pid': self._zygote.pid,
+                'alive': self._zygote.is_alive(),
+                'memory': memory_usage(self._zygote.pid)
+            },
+            'workers': workers,
+            'requests_in_flight': requests_in_flight,
+            'respawns': self.respawns,
+            'last_respawn_ms': self.last_respawn_ms
+        }
+
+    def shutdown(self):
+        """Let workers finish what they have, then stop them, the zygote and the collector"""
+        with self._condition:
+            self._shutting_down = True
+            self._condition.notify_all()
+        for worker in self._workers:
+            if worker['alive']:
+                try:
+                    with worker['send_lock']:
+                        worker['task_conn'].send(None)
+                except OSError:
+                    pass
+        # The zygote waits for its workers to exit (killing stragglers) before it exits itself
+        try:
+            with self._zygote_lock:
+                self._zygote_conn.send(('shutdown',))
+        except OSError:
+            pass
+        self._zygote.join(timeout=40)
+        if self._zygote.is_alive():
+            self._zygote.terminate()
+
+        self._result_queue.put(None)
+        collector = getattr(self, '_collector', None)
+        if collector is not None:
+            collector.join(timeout=5)
+        for worker in self._workers:
+            worker['task_conn'].close()
+        self._zygote_conn.close()
+        self._workers = []
@@ -45,6 +45,21 @@ router.get('/ml-status', async (req, res) => {
   }
 });
 
+// Prediction stage timings in Prometheus text format
+router.get('/ml-metrics', async (req, res) => {
+  try {
+    const metrics = await mlService.getPrometheusMetrics();
+    res.set('Content-Type', 'text/plain; version=0.0.4');
+    res.send(metrics);
+  } catch (error) {
+    console.error('❌ ML metrics collection failed:', error);
+    res.status(500).json({
+      success: false,
+      message: 'ML metrics collection failed: ' + error.message
+    });
+  }
+});
+
 // Check data status for batch analysis
 router.get('/data-status', async (req, res) => {
   try {
@@ -3,6 +3,7 @@ const path = require('path');
 const fs = require('fs');
 const supabaseService = require('./supabaseService');
 const LateFusionService = require('./lateFusionService');
+const PythonWorker = require('./pythonWorker');
 const https = require('https');
 
 class MLService {
@@ -10,11 +11,32 @@ class MLService {
     this.initialized = false;
     this.model_loaded = false;
     this.runtime = 'nodejs';
-    this.supports_tflite = false;
+    this.supports_tflite = this.tomatoBackend() === 'tflite';
+    if (process.env.TOMATO_ZYGOTE_WORKERS && process.env.TOMATO_BACKEND && process.env.TOMATO_BACKEND !== 'tflite') {
+      console.warn(`⚠️ TOMATO_ZYGOTE_WORKERS needs the tflite backend, ignoring TOMATO_BACKEND=${process.env.TOMATO_BACKEND}`);
+    }
     this.class_count = 0;
     this.pythonScriptsPath = path.join(__dirname, '..', '..', 'python_scripts');
     this.tempDir = path.join(__dirname, '..', '..', 'temp');
     this.lateFusionService = new LateFusionService();
+    this.usePersistentWorkers = process.env.PYTHON_PERSISTENT_WORKERS !== 'false';
+    // ML_IMAGE_TRANSPORT=bytes hands downloaded images to the classifier in memory instead of via temp files
+    this.imageTransport = process.env.ML_IMAGE_TRANSPORT === 'bytes' ? 'bytes' : 'path';
+    this.tomatoWorker = new PythonWorker(
+      'tomato classifier',
+      path.join(this.pythonScriptsPath, 'tomato_prediction.py'),
+      {
+        args: this.tomatoWorkerArgs(),
+        env: this.tomatoEnv()
+      }
+    );
+    this.soilWorker = new PythonWorker(
+      'soil analyzer',
+      path.join(this.pythonScriptsPath, 'soil_prediction.py'),
+      {
+        env: { ...process.env, PYTHONIOENCODING: 'utf-8' }
+      }
+    );
     
     this.supabase = supabaseService;
     if (!fs.existsSync(this.tempDir)) {
@@ -22,6 +44,36 @@ class MLService {
     }
   }
 
+  tomatoWorkerArgs() {
+    // TOMATO_ZYGOTE_WORKERS=N forks N workers sharing one loaded tflite model (see tomatoBackend)
+    if (process.env.TOMATO_ZYGOTE_WORKERS) {
+      return ['--serve', '--zygote', process.env.TOMATO_ZYGOTE_WORKERS];
+    }
+    // TOMATO_POOL_WORKERS=N serves requests from N core-pinned classifier processes
+    if (process.env.TOMATO_POOL_WORKERS) {
+      return ['--serve', '--pool', process.env.TOMATO_POOL_WORKERS];
+    }
+    // TOMATO_MICRO_BATCH=true groups concurrent uploads into one model.predict
+    return process.env.TOMATO_MICRO_BATCH === 'true' ? ['--serve', '--micro-batch'] : ['--serve'];
+  }
+
+  tomatoBackend() {
+    // Forked workers can only share tflite weights, so the zygote pool always runs tflite
+    return process.env.TOMATO_ZYGOTE_WORKERS ? 'tflite' : process.env.TOMATO_BACKEND;
+  }
+
+  tomatoEnv() {
+    // Runtime profile for the classifier: TOMATO_INTRA_OP_THREADS, TOMATO_INTER_OP_THREADS,
+    // TOMATO_CPU_AFFINITY (e.g. "0-3") and TOMATO_ONEDNN (on/off, off unless set)
+    const backend = this.tomatoBackend();
+    return {
+      ...process.env,
+      ...(backend ? { TOMATO_BACKEND: backend } : {}),
+      TOMATO_ONEDNN: process.env.TOMATO_ONEDNN || 'off',
+      PYTHONIOENCODING: 'utf-8'
+    };
+  }
+
   async initialize() {
     try {
       console.log('🤖 Initializing ML Service...');
@@ -56,7 +108,6 @@ try:
     import numpy as np
     import cv2
     import joblib
-    import pandas as pd
     from PIL import Image
     print("SUCCESS:All dependencies available")
 except ImportError as e:
@@ -86,18 +137,27 @@ except ImportError as e:
         throw new Error('ML Service not initialized');
       }
 
-      let imagePath = await this.getImageLocalPath(imageData);
-      
-      if (!imagePath || !fs.existsSync(imagePath)) {
-        throw new Error(`Image file not found: ${imagePath}`);
-      }
+      let classificationResult;
+      const isLocalFile = typeof imageData === 'string' && fs.existsSync(imageData);
 
-      console.log('📁 Processing image:', imagePath);
+      if (this.imageTransport === 'bytes' && !isLocalFile) {
+        const imageBuffer = await this.getImageBuffer(imageData);
+        console.log(`📦 Processing image from memory (${imageBuffer.length} bytes)`);
+        classificationResult = await this.executeTomatoClassifierBytes(imageBuffer, userId, imageId);
+      } else {
+        let imagePath = await this.getImageLocalPath(imageData);
+        
+        if (!imagePath || !fs.existsSync(imagePath)) {
+          throw new Error(`Image file not found: ${imagePath}`);
+        }
 
-      const classificationResult = await this.executeTomatoClassifier(imagePath, userId, imageId);
-      
-      if (imagePath.includes(this.tempDir)) {
-        this.cleanupTempFile(imagePath);
+        console.log('📁 Processing image:', imagePath);
+
+        classificationResult = await this.executeTomatoClassifier(imagePath, userId, imageId);
+        
+        if (imagePath.includes(this.tempDir)) {
+          this.cleanupTempFile(imagePath);
+        }
       }
 
       if (!classificationResult.success) {
@@ -127,6 +187,7 @@ except ImportError as e:
         features: classificationResult.features,
         model_used: classificationResult.model_used,
         inference_time: classificationResult.inference_time,
+        timings: classificationResult.timings,
         timestamp: new Date().toISOString(),
         user_id: userId,
         image_id: imageId
@@ -139,6 +200,91 @@ except ImportError as e:
   }
 
   async analyzeBatchImages(imageDataList, userId) {
+    const localImages = [];
+    try {
+      console.log(`🤖 Processing batch of ${imageDataList.length} images for user ${userId} in one classifier pass`);
+
+      if (!this.initialized) {
+        throw new Error('ML Service not initialized');
+      }
+
+      // Resolve every image locally first so the classifier can score them together
+      const results = new Array(imageDataList.length);
+      for (let i = 0; i < imageDataList.length; i++) {
+        const imageData = imageDataList[i];
+        try {
+          const imagePath = await this.getImageLocalPath(imageData);
+          localImages.push({ index: i, image_path: imagePath, image_id: imageData.image_id });
+        } catch (error) {
+          results[i] = {
+            success: false,
+            image_id: imageData?.image_id,
+            error: error.message,
+            batch_index: i
+          };
+        }
+      }
+
+      if (localImages.length > 0) {
+        const batchResult = await this.executeTomatoClassifierBatch(
+          localImages.map(img => ({ image_path: img.image_path, image_id: img.image_id })),
+          userId
+        );
+
+        if (!batchResult.success || !Array.isArray(batchResult.results)) {
+          throw new Error(batchResult.error || 'Batch image classification failed');
+        }
+
+        batchResult.results.forEach((imageResult, position) => {
+          const i = localImages[position].index;
+          const imageData = imageDataList[i];
+
+          results[i] = imageResult.success ? {
+            success: true,
+            image_id: imageData.image_id,
+            tomato_type: imageResult.tomato_type || 'Unknown',
+            health_status: imageResult.health_status || 'Unknown',
+            disease_type: imageResult.disease_type || 'Unknown',
+            confidence_score: imageResult.confidence_score || 0.5,
+            plant_health_score: imageResult.plant_health_score !== undefined ? imageResult.plant_health_score : null,
+            recommendations: imageResult.recommendations || [],
+            overall_health: imageResult.overall_health || imageResult.health_status || 'Unknown',
+            batch_index: i
+          } : {
+            success: false,
+            image_id: imageData.image_id,
+            error: imageResult.error || 'Unknown error',
+            batch_index: i
+          };
+        });
+      }
+
+      const successful_predictions = results.filter(r => r && r.success).length;
+      const failed_predictions = imageDataList.length - successful_predictions;
+
+      console.log(`✅ Batch image analysis completed: ${successful_predictions} successful, ${failed_predictions} failed`);
+
+      return {
+        success: true,
+        successful_predictions,
+        failed_predictions,
+        results,
+        total_images: imageDataList.length
+      };
+
+    } catch (error) {
+      console.warn('⚠️ Batched classification failed, falling back to one image at a time:', error.message);
+      return await this.analyzeBatchImagesSequentially(imageDataList, userId);
+    } finally {
+      for (const img of localImages) {
+        if (img.image_path.includes(this.tempDir)) {
+          this.cleanupTempFile(img.image_path);
+        }
+      }
+    }
+  }
+
+  async analyzeBatchImagesSequentially(imageDataList, userId) {
     try {
         console.log(`🤖 Processing batch of ${imageDataList.length} images for user ${userId}`);
         
@@ -234,6 +380,35 @@ except ImportError as e:
     throw new Error('Cannot resolve image to local path');
   }
 
+  async getImageBuffer(imageData) {
+    const publicUrl = imageData.publicUrl || (imageData.image_path && await this.getImagePublicUrl(imageData.image_path));
+    if (!publicUrl) {
+      throw new Error('Cannot resolve image to a URL');
+    }
+    return this.downloadImageToBuffer(publicUrl);
+  }
+
+  async downloadImageToBuffer(imageUrl) {
+    return new Promise((resolve, reject) => {
+      console.log('📥 Downloading image into memory:', imageUrl);
+
+      https.get(imageUrl, (response) => {
+        if (response.statusCode !== 200) {
+          response.resume();
+          reject(new Error(`Failed to download image: HTTP ${response.statusCode}`));
+          return;
+        }
+
+        const chunks = [];
+        response.on('data', (chunk) => chunks.push(chunk));
+        response.on('end', () => resolve(Buffer.concat(chunks)));
+        response.on('error', (err) => reject(new Error(`Failed to download image: ${err.message}`)));
+      }).on('error', (err) => {
+        reject(new Error(`Failed to download image: ${err.message}`));
+      });
+    });
+  }
+
   async getImagePublicUrl(filePath) {
     try {
       const supabaseUrl = process.env.SUPABASE_URL;
@@ -254,7 +429,8 @@ except ImportError as e:
 
   async downloadImageFromUrl(imageUrl) {
     return new Promise((resolve, reject) => {
-      const filename = `temp_image_${Date.now()}.jpg`;
+      // Batches keep several downloads alive at once, so make names unique per file
+      const filename = `temp_image_${Date.now()}_${Math.random().toString(36).slice(2, 8)}.jpg`;
       const filePath = path.join(this.tempDir, filename);
       
       console.log('📥 Downloading image to:', filePath);
@@ -282,26 +458,74 @@ except ImportError as e:
   }
 
   async executeTomatoClassifier(imagePath, userId, imageId) {
+    return this.runTomatoClassifier({
+      image_path: imagePath,
+      user_id: userId,
+      image_id: imageId
+    });
+  }
+
+  async executeTomatoClassifierBytes(imageBuffer, userId, imageId) {
+    const request = { user_id: userId, image_id: imageId };
+
+    if (this.usePersistentWorkers) {
+      try {
+        console.log('🔍 Sending in-memory image to persistent tomato classifier...');
+        return await this.tomatoWorker.request({ ...request, image_base64: imageBuffer.toString('base64') });
+      } catch (error) {
+        console.warn('⚠️ Persistent tomato classifier unavailable, spawning one-shot process:', error.message);
+      }
+    }
+
+    // Large images exceed the argv limit as base64, so the one-shot process reads them from stdin
+    return this.spawnTomatoClassifier(request, imageBuffer);
+  }
+
+  encodeImageFrame(request, imageBuffer) {
+    // [uint32 BE length][request JSON][uint32 BE length][image bytes] - see worker_protocol.read_frames
+    const header = Buffer.from(JSON.stringify(request), 'utf8');
+    const headerLength = Buffer.alloc(4);
+    headerLength.writeUInt32BE(header.length);
+    const imageLength = Buffer.alloc(4);
+    imageLength.writeUInt32BE(imageBuffer.length);
+    return Buffer.concat([headerLength, header, imageLength, imageBuffer]);
+  }
+
+  async executeTomatoClassifierBatch(images, userId) {
+    return this.runTomatoClassifier({
+      images: images,
+      user_id: userId
+    });
+  }
+
+  async runTomatoClassifier(inputData) {
+    if (!this.usePersistentWorkers) {
+      return this.spawnTomatoClassifier(inputData);
+    }
+
+    try {
+      console.log('🔍 Sending request to persistent tomato classifier...');
+      return await this.tomatoWorker.request(inputData);
+    } catch (error) {
+      console.warn('⚠️ Persistent tomato classifier unavailable, spawning one-shot process:', error.message);
+      return this.spawnTomatoClassifier(inputData);
+    }
+  }
+
+  async spawnTomatoClassifier(inputData, imageBuffer = null) {
     return new Promise((resolve) => {
       const pythonScript = path.join(this.pythonScriptsPath, 'tomato_prediction.py');
       
       console.log('🔍 Running tomato classifier for disease identification...');
 
-      const inputData = {
-        image_path: imagePath,
-        user_id: userId,
-        image_id: imageId
-      };
-
-      const env = { 
-        ...process.env, 
-        TF_ENABLE_ONEDNN_OPTS: '0',
-        PYTHONIOENCODING: 'utf-8'
-      };
-      
-      const python = spawn('python', [pythonScript, JSON.stringify(inputData)], { 
-        env
+      const args = imageBuffer ? [pythonScript, '--binary-stdin'] : [pythonScript, JSON.stringify(inputData)];
+      const python = spawn('python', args, { 
+        env: this.tomatoEnv()
       });
+
+      if (imageBuffer) {
+        python.stdin.end(this.encodeImageFrame(inputData, imageBuffer));
+      }
       
       let output = '';
       let errorOutput = '';
@@ -416,6 +640,7 @@ except ImportError as e:
         soil_parameters: soilResult.soil_parameters,
         model_used: soilResult.model_used,
         inference_time: soilResult.inference_time,
+        timings: soilResult.timings,
         timestamp: new Date().toISOString(),
         user_id: userId,
         soil_id: soilId
@@ -428,36 +653,48 @@ except ImportError as e:
   }
 
   async executeSoilPrediction(soilData, optimalRanges, userId, soilId) {
+    const requiredSoilFields = ['ph_level', 'temperature', 'moisture', 'nitrogen', 'phosphorus', 'potassium'];
+    const filteredSoilData = {};
+    
+    for (const field of requiredSoilFields) {
+      if (field in soilData) {
+        filteredSoilData[field] = soilData[field];
+      } else {
+        console.error(`❌ Missing required soil field: ${field}`);
+        return {
+          success: false,
+          error: `Missing required soil field: ${field}`
+        };
+      }
+    }
+    
+    console.log('📊 Filtered soil data (6 fields):', filteredSoilData);
+    console.log('📊 Optimal ranges to send:', optimalRanges);
+
+    const inputData = {
+      soil_data: filteredSoilData,
+      optimal_ranges: optimalRanges,
+      user_id: userId,
+      soil_id: soilId
+    };
+
+    if (this.usePersistentWorkers) {
+      try {
+        console.log('🔍 Sending soil data to persistent soil analyzer...');
+        return await this.soilWorker.request(inputData);
+      } catch (error) {
+        console.warn('⚠️ Persistent soil analyzer unavailable, spawning one-shot process:', error.message);
+      }
+    }
+
+    return this.spawnSoilPrediction(inputData);
+  }
+
+  async spawnSoilPrediction(inputData) {
     return new Promise((resolve) => {
       const pythonScript = path.join(this.pythonScriptsPath, 'soil_prediction.py');
       
       console.log('🔍 Running soil prediction...');
-      
-      const requiredSoilFields = ['ph_level', 'temperature', 'moisture', 'nitrogen', 'phosphorus', 'potassium'];
-      const filteredSoilData = {};
-      
-      for (const field of requiredSoilFields) {
-        if (field in soilData) {
-          filteredSoilData[field] = soilData[field];
-        } else {
-          console.error(`❌ Missing required soil field: ${field}`);
-          resolve({
-            success: false,
-            error: `Missing required soil field: ${field}`
-          });
-          return;
-        }
-      }
-      
-      console.log('📊 Filtered soil data (6 fields):', filteredSoilData);
-      console.log('📊 Optimal ranges to send:', optimalRanges);
-
-      const inputData = {
-        soil_data: filteredSoilData,
-        optimal_ranges: optimalRanges,
-        user_id: userId,
-        soil_id: soilId
-      };
 
       console.log('📤 Full input to Python:', JSON.stringify(inputData, null, 2));
 
@@ -761,10 +998,52 @@ except ImportError as e:
 
  
 
+  // Per-stage latency histograms from the running persistent workers (Prometheus text format)
+  async getPrometheusMetrics() {
+    // Both workers expose the same metric families, so samples are regrouped under one HELP/TYPE header each
+    const families = new Map();
+    for (const worker of [this.tomatoWorker, this.soilWorker]) {
+      if (!worker.readyInfo) {
+        continue;
+      }
+      const response = await worker.metrics();
+      if (response.type !== 'metrics') {
+        continue;
+      }
+
+      let family = null;
+      for (const line of response.text.split('\n')) {
+        if (!line) continue;
+        const header = line.match(/^# (HELP|TYPE) (\S+)/);
+        if (header) {
+          family = header[2];
+          if (!families.has(family)) {
+            families.set(family, { headers: [], samples: [] });
+          }
+          const entry = families.get(family);
+          if (entry.headers.length < 2) {
+            entry.headers.push(line);
+          }
+        } else if (family) {
+          families.get(family).samples.push(line);
+        }
+      }
+    }
+
+    let text = '';
+    for (const { headers, samples } of families.values()) {
+      text += [...headers, ...samples].join('\n') + '\n';
+    }
+    return text;
+  }
+
   healthCheck() {
     return {
       initialized: this.initialized,
       model_loaded: this.model_loaded,
+      persistent_workers: this.usePersistentWorkers,
+      tomato_worker_ready: !!this.tomatoWorker.readyInfo,
+      soil_worker_ready: !!this.soilWorker.readyInfo,
       runtime: this.runtime,
       supports_tflite: this.supports_tflite,
       class_count: this.class_count,
@@ -0,0 +1,146 @@
+const { spawn } = require('child_process');
+
+// Keeps one long-lived Python process running a script in `--serve` mode and
+// exchanges newline-delimited JSON with it, so the model is loaded only once.
+class PythonWorker {
+  constructor(name, scriptPath, options = {}) {
+    this.name = name;
+    this.scriptPath = scriptPath;
+    this.args = options.args || ['--serve'];
+    this.env = options.env || process.env;
+    this.startupTimeout = options.startupTimeout || 120000;
+    this.requestTimeout = options.requestTimeout || 60000;
+
+    this.process = null;
+    this.ready = null;
+    this.readyInfo = null;
+    this.buffer = '';
+    this.nextId = 1;
+    this.pending = new Map();
+  }
+
+  start() {
+    if (this.ready) {
+      return this.ready;
+    }
+
+    this.ready = new Promise((resolve, reject) => {
+      console.log(`🐍 Starting persistent ${this.name} worker...`);
+
+      const python = spawn('python', [this.scriptPath, ...this.args], { env: this.env });
+      this.process = python;
+      this.buffer = '';
+
+      const startupTimer = setTimeout(() => {
+        reject(new Error(`${this.name} worker did not become ready in time`));
+        this.stop();
+      }, this.startupTimeout);
+
+      python.stdout.on('data', (data) => {
+        this.buffer += data.toString('utf8');
+
+        let newlineIndex;
+        while ((newlineIndex = this.buffer.indexOf('\n')) !== -1) {
+          const line = this.buffer.slice(0, newlineIndex).trim();
+          this.buffer = this.buffer.slice(newlineIndex + 1);
+          if (!line) continue;
+
+          let message;
+          try {
+            message = JSON.parse(line);
+          } catch (parseError) {
+            console.error(`❌ Unparseable line from ${this.name} worker:`, line);
+            continue;
+          }
+
+          if (message.type === 'ready') {
+            clearTimeout(startupTimer);
+            this.readyInfo = message;
+            console.log(`✅ ${this.name} worker ready (pid ${message.pid})`);
+            resolve(message);
+          } else {
+            this.handleMessage(message);
+          }
+        }
+      });
+
+      python.stderr.on('data', (data) => {
+        console.error(`🐍 ${this.name} worker stderr:`, data.toString('utf8').trim());
+      });
+
+      python.on('error', (error) => {
+        clearTimeout(startupTimer);
+        console.error(`❌ Failed to start ${this.name} worker:`, error);
+        reject(error);
+        this.reset(`Failed to start ${this.name} worker: ${error.message}`);
+      });
+
+      python.on('close', (code) => {
+        clearTimeout(startupTimer);
+        console.log(`🐍 ${this.name} worker exited with code ${code}`);
+        reject(new Error(`${this.name} worker exited with code ${code}`));
+        this.reset(`${this.name} worker exited with code ${code}`);
+      });
+    });
+
+    // A failed start should not poison later attempts
+    this.ready.catch(() => {});
+    return this.ready;
+  }
+
+  handleMessage(message) {
+    const entry = this.pending.get(message.id);
+    if (!entry) {
+      return;
+    }
+
+    clearTimeout(entry.timer);
+    this.pending.delete(message.id);
+    entry.resolve(message);
+  }
+
+  async request(payload, type = 'predict') {
+    await this.start();
+
+    const id = this.nextId++;
+    return new Promise((resolve) => {
+      const timer = setTimeout(() => {
+        this.pending.delete(id);
+        resolve({
+          success: false,
+          error: `${this.name} worker timeout`
+        });
+      }, this.requestTimeout);
+
+      this.pending.set(id, { resolve, timer });
+      this.process.stdin.write(JSON.stringify({ ...payload, id, type }) + '\n');
+    });
+  }
+
+  async health() {
+    return this.request({}, 'health');
+  }
+
+  async metrics() {
+    return this.request({}, 'metrics');
+  }
+
+  reset(reason) {
+    for (const entry of this.pending.values()) {
+      clearTimeout(entry.timer);
+      entry.resolve({ success: false, error: reason });
+    }
+    this.pending.clear();
+    this.process = null;
+    this.ready = null;
+    this.readyInfo = null;
+  }
+
+  stop() {
+    if (this.process && !this.process.killed) {
+      this.process.kill();
+    }
+  }
+}
+
+module.exports = PythonWorker;